@@ -0,0 +1,104 @@
+"""
+Batched execution of simple shell steps for HySDS.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+
+from future import standard_library
+standard_library.install_aliases()
+from functools import wraps
+
+from fabric.api import run, env, settings
+from fabric.utils import abort
+
+from sdscli.log_utils import logger
+
+
+# marker echoed by the remote script after each step: "<marker> <step index> <exit status>"
+STEP_MARKER = '__sds_step__'
+
+
+def shell_task(cmd_func):
+    """Turn function returning a shell command into a fabric task running it.
+
+    The command builder is kept as batch_cmd so that the task can be collected
+    into a StepBatch instead of being run on its own.
+    """
+
+    @wraps(cmd_func)
+    def task(*args, **kwargs):
+        return run(cmd_func(*args, **kwargs))
+
+    task.batch_cmd = cmd_func
+    return task
+
+
+def build_script(cmds):
+    """Return shell script running cmds in order, reporting exit status of each and stopping at the first failure."""
+
+    lines = []
+    for i, cmd in enumerate(cmds):
+        lines.append('( %s ); rc=$?; echo "%s %d $rc"; [ $rc -eq 0 ] || exit $rc' %
+                     (cmd, STEP_MARKER, i))
+    return "\n".join(lines)
+
+
+def parse_script_output(output):
+    """Return list of (step index, exit status, step output) from output of script."""
+
+    results = []
+    lines = []
+    for line in output.splitlines():
+        if line.startswith(STEP_MARKER + ' '):
+            i, rc = line.split()[1:3]
+            results.append((int(i), int(rc), "\n".join(lines)))
+            lines = []
+        else:
+            lines.append(line)
+    return results
+
+
+def run_steps(cmds):
+    """Run shell commands in one remote script; abort on the first failed step like run() would."""
+
+    with settings(warn_only=True):
+        out = run(build_script(cmds))
+    results = parse_script_output(out)
+    logger.debug("ran %d batched steps in one round trip on %s" % (len(results), env.host_string))
+    for i, rc, step_out in results:
+        if rc != 0:
+            abort("Batched step %d/%d received nonzero return code %d while executing!\n\n"
+                  "Requested: %s\n\n%s" % (i + 1, len(cmds), rc, cmds[i], step_out))
+    if len(results) != len(cmds):
+        abort("Batched steps stopped after %d/%d steps (return code %s).\n\n%s" %
+              (len(results), len(cmds), out.return_code, out))
+    return out
+
+
+class StepBatch(object):
+    """Consecutive shell steps bound for the same hosts, waiting to run as one script."""
+
+    def __init__(self):
+        """Construct StepBatch instance."""
+
+        self.target = None
+        self.cmds = []
+
+    def add(self, target, cmd):
+        """Queue command for target; return False if the batch holds steps for another target."""
+
+        if self.cmds and target != self.target:
+            return False
+        self.target = target
+        self.cmds.append(cmd)
+        return True
+
+    def pop(self):
+        """Return and clear target and queued commands."""
+
+        target, cmds = self.target, self.cmds
+        self.target, self.cmds = None, []
+        return target, cmds
@@ -0,0 +1,98 @@
+"""
+Batched _bulk requests to ES for HySDS.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+
+from future import standard_library
+standard_library.install_aliases()
+import json
+
+from sdscli.log_utils import logger
+
+
+# actions per _bulk request
+BULK_BATCH_SIZE = 500
+
+
+class BulkRequest(object):
+    """Index and delete actions sent to ES in _bulk requests of batch_size actions.
+
+    Nothing is refreshed per action; close() refreshes every index that
+    was touched once and reports the actions that failed.
+    """
+
+    def __init__(self, es, batch_size=None):
+        """Construct BulkRequest instance from ES utility or client."""
+
+        # hysds' ES utilities wrap the elasticsearch/opensearch client
+        self.client = getattr(es, 'es', es)
+        self.batch_size = batch_size or BULK_BATCH_SIZE
+        self.actions = []
+        self.indices = set()
+        self.done = 0
+        self.errors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+
+    def add(self, action, index, id=None, doc=None):
+        """Queue action on document, sending the batch once it is full."""
+
+        meta = {'_index': index}
+        if id is not None:
+            meta['_id'] = id
+        self.actions.append(({action: meta}, doc))
+        self.indices.add(index)
+        if len(self.actions) >= self.batch_size:
+            self.flush()
+
+    def index(self, index, doc, id=None):
+        """Queue indexing of document."""
+
+        self.add('index', index, id, doc)
+
+    def delete(self, index, id):
+        """Queue deletion of document."""
+
+        self.add('delete', index, id)
+
+    def flush(self):
+        """Send queued actions in one _bulk request and record the ones that failed."""
+
+        if not self.actions:
+            return
+        lines = []
+        for meta, doc in self.actions:
+            lines.append(json.dumps(meta))
+            if doc is not None:
+                lines.append(json.dumps(doc))
+        actions, self.actions = self.actions, []
+        result = self.client.bulk(body="\n".join(lines) + "\n")
+        self.done += len(actions)
+        logger.debug("sent %d bulk actions, errors: %s" % (len(actions), result.get('errors')))
+        if not result.get('errors'):
+            return
+        for item in result['items']:
+            action, status = list(item.items())[0]
+            # deleting what is already gone is fine
+            if 'error' in status and not (action == 'delete' and status.get('status') == 404):
+                self.errors.append((action, status.get('_index'), status.get('_id'), status['error']))
+
+    def close(self):
+        """Send remaining actions, refresh the indices once and raise RuntimeError if any action failed."""
+
+        self.flush()
+        if self.indices:
+            self.client.indices.refresh(index=",".join(sorted(self.indices)))
+        for action, index, id, error in self.errors:
+            logger.error("Failed to %s %s in %s: %s" % (action, id, index, json.dumps(error)))
+        if self.errors:
+            raise RuntimeError("%d of %d bulk action(s) failed." % (len(self.errors), self.done))
@@ -14,21 +14,16 @@ import yaml
 import pwd
 import hashlib
 import traceback
-from fabric.api import execute, hide
-from tqdm import tqdm
+from fabric.api import hide
 from urllib.parse import urlparse
 
-from prompt_toolkit.shortcuts import prompt, print_tokens
-from prompt_toolkit.styles import style_from_dict
-from prompt_toolkit.validation import Validator, ValidationError
-from pygments.token import Token
-
 from sdscli.log_utils import logger
 from sdscli.conf_utils import get_user_files_path, SettingsConf
 from sdscli.os_utils import validate_dir
 from sdscli.prompt_utils import print_component_header
 
 from . import fabfile as fab
+from .fabfile import execute
 
 
 def remove_job(args):
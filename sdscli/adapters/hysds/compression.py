@@ -0,0 +1,160 @@
+"""
+Compression codecs for code bundles and SDS package archives.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+
+from builtins import open
+from future import standard_library
+standard_library.install_aliases()
+import bz2
+import gzip
+import shutil
+import tarfile
+import subprocess
+from contextlib import contextmanager
+from collections import OrderedDict
+
+from sdscli.log_utils import logger
+
+
+class Codec(object):
+    """Compression format of a tar archive and the tools that read and write it.
+
+    Tools are tried in order so that multi-threaded ones (lbzip2, pbzip2,
+    pigz, zstd -T0) are used when installed; they all write the standard
+    format, so any tool for the codec can read what another one wrote.
+    """
+
+    def __init__(self, name, ext, magic, tools, compress_opts='', module=None):
+        """Construct Codec instance."""
+
+        self.name = name
+        self.ext = ext
+        self.magic = magic
+        self.tools = tools
+        self.compress_opts = compress_opts
+        self.module = module
+
+    def get_shell_cmd(self, decompress=False):
+        """Return shell command filtering stdin to stdout with the first tool installed on the host."""
+
+        if not self.tools:
+            return 'cat'
+        prog = self.tools[0]
+        if len(self.tools) > 1:
+            prog = "$(%s || echo %s)" % (" || ".join("command -v %s" % t for t in self.tools[:-1]),
+                                         self.tools[-1])
+        opts = '-dc' if decompress else ('%s -c' % self.compress_opts).strip()
+        return "%s %s" % (prog, opts)
+
+    def find_tool(self):
+        """Return first tool installed locally, or None."""
+
+        for tool in self.tools:
+            if shutil.which(tool):
+                return tool
+        return None
+
+
+CODECS = OrderedDict((c.name, c) for c in (
+    Codec('bzip2', '.tbz2', b'BZh', ('lbzip2', 'pbzip2', 'bzip2'), module=bz2),
+    Codec('gzip', '.tgz', b'\x1f\x8b', ('pigz', 'gzip'), module=gzip),
+    Codec('zstd', '.tar.zst', b'\x28\xb5\x2f\xfd', ('zstd',), compress_opts='-T0 -q'),
+    Codec('none', '.tar', None, ()),
+))
+
+# codec of verdi code bundles
+DEFAULT_CODEC = 'bzip2'
+
+
+def get_codec(name):
+    """Return codec by name."""
+
+    if name not in CODECS:
+        raise RuntimeError("Unknown compression codec %s. Use one of: %s." % (name, ", ".join(CODECS)))
+    return CODECS[name]
+
+
+def detect_codec(path):
+    """Return codec of file from its magic bytes."""
+
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    for codec in CODECS.values():
+        if codec.magic is not None and head.startswith(codec.magic):
+            return codec
+    return CODECS['none']
+
+
+@contextmanager
+def _pipe(codec, path, decompress):
+    """Yield binary file object that streams through the codec's tool to or from path."""
+
+    tool = codec.find_tool()
+    if tool is None:
+        if codec.module is None:
+            raise RuntimeError("Cannot %s %s: none of %s is installed." % (
+                'decompress' if decompress else 'compress', path, ", ".join(codec.tools)))
+        with codec.module.open(path, 'rb' if decompress else 'wb') as f:
+            yield f
+        return
+    logger.debug("%s %s with %s" % ('decompressing' if decompress else 'compressing', path, tool))
+    if decompress:
+        proc = subprocess.Popen([tool, '-dc', path], stdout=subprocess.PIPE)
+        f = proc.stdout
+    else:
+        opts = codec.compress_opts.split() if tool == codec.tools[0] else []
+        with open(path, 'wb') as out:
+            proc = subprocess.Popen([tool, '-c'] + opts, stdin=subprocess.PIPE, stdout=out)
+        f = proc.stdin
+    stopped = False
+    try:
+        yield f
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        # readers may stop before the end of the stream, e.g. at the tar
+        # end-of-archive blocks or once they found what they were after
+        stopped = decompress and proc.poll() is None
+        if stopped:
+            proc.kill()
+        try:
+            f.close()
+        finally:
+            proc.wait()
+    if not stopped and proc.returncode != 0:
+        raise RuntimeError("%s exited with %d on %s." % (tool, proc.returncode, path))
+
+
+@contextmanager
+def open_tar_writer(path, codec):
+    """Yield tarfile streaming into path compressed with codec."""
+
+    codec = get_codec(codec)
+    if not codec.tools:
+        with tarfile.open(path, 'w') as tar:
+            yield tar
+        return
+    with _pipe(codec, path, False) as f:
+        with tarfile.open(fileobj=f, mode='w|') as tar:
+            yield tar
+
+
+@contextmanager
+def open_tar_reader(path):
+    """Yield tarfile streaming from path, whichever codec it was written with."""
+
+    codec = detect_codec(path)
+    logger.debug("codec of %s: %s" % (path, codec.name))
+    if not codec.tools:
+        with tarfile.open(path, 'r|') as tar:
+            yield tar
+        return
+    with _pipe(codec, path, True) as f:
+        with tarfile.open(fileobj=f, mode='r|') as tar:
+            yield tar
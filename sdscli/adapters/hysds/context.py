@@ -0,0 +1,226 @@
+"""
+Cluster context for HySDS.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+
+from future import standard_library
+standard_library.install_aliases()
+import os
+import atexit
+from types import MappingProxyType
+
+from sdscli.log_utils import logger
+from sdscli.conf_utils import get_user_config_path, SettingsConf
+
+
+# node types with their own template context overlay
+NODE_TYPES = ('mozart', 'metrics', 'grq', 'verdi')
+
+
+class ClusterContext(object):
+    """HySDS cluster context.
+
+    Nothing is read, validated or connected to until first use; after that
+    the parsed config, role definitions and ES clients are memoized.
+    """
+
+    def __init__(self, cfg_file=None):
+        """Construct ClusterContext instance."""
+
+        self._cfg_file = get_user_config_path() if cfg_file is None else cfg_file
+        self._settings = None
+        self._cfg_mtime = None
+        self._roledefs = None
+        self._node_contexts = {}
+        self._es = {}
+        self._env_configured = False
+        self.ssh_handshakes = 0
+        self.ssh_reused = 0
+
+    @property
+    def cfg_file(self):
+        return self._cfg_file
+
+    @property
+    def settings(self):
+        """SettingsConf instance of the SDS config."""
+
+        if self._settings is None:
+            if not os.path.isfile(self._cfg_file):
+                raise RuntimeError(
+                    "SDS configuration file doesn't exist. Run 'sds configure'.")
+            self._cfg_mtime = os.path.getmtime(self._cfg_file)
+            self._settings = SettingsConf(self._cfg_file)
+        return self._settings
+
+    def is_stale(self):
+        """Return True if the SDS config changed since it was loaded."""
+
+        if self._settings is None:
+            return False
+        try:
+            return os.path.getmtime(self._cfg_file) != self._cfg_mtime
+        except OSError:
+            return True
+
+    @property
+    def conf(self):
+        """Parsed SDS config."""
+
+        return self.settings.cfg
+
+    @property
+    def ops_dir(self):
+        return self.conf['OPS_HOME']
+
+    def get_es_engine(self, comp):
+        """Return search engine (elasticsearch or opensearch) used by component."""
+
+        return self.conf.get("{}_ES_ENGINE".format(comp.upper()), "elasticsearch")
+
+    def get_node_context(self, node_type=None):
+        """Return read-only template context for node type, built once per cluster context."""
+
+        if node_type not in NODE_TYPES:
+            node_type = None
+        if node_type not in self._node_contexts:
+            ctx = dict(self.conf)
+
+            if node_type == 'mozart':
+                if ctx['MOZART_PVT_IP'] == ctx['MOZART_RABBIT_PVT_IP']:
+                    ctx['MOZART_RABBIT_PVT_IP'] = "127.0.0.1"
+                if ctx['MOZART_PVT_IP'] == ctx['MOZART_REDIS_PVT_IP']:
+                    ctx['MOZART_REDIS_PVT_IP'] = "127.0.0.1"
+                if ctx['MOZART_PVT_IP'] == ctx['MOZART_ES_PVT_IP']:
+                    ctx['MOZART_ES_PVT_IP'] = "127.0.0.1"
+
+            if node_type == 'metrics':
+                if ctx['METRICS_PVT_IP'] == ctx['METRICS_REDIS_PVT_IP']:
+                    ctx['METRICS_REDIS_PVT_IP'] = "127.0.0.1"
+                if ctx['METRICS_PVT_IP'] == ctx['METRICS_ES_PVT_IP']:
+                    ctx['METRICS_ES_PVT_IP'] = "127.0.0.1"
+
+            if node_type == 'grq':
+                if ctx['GRQ_PVT_IP'] == ctx['GRQ_ES_PVT_IP']:
+                    ctx['GRQ_ES_PVT_IP'] = "127.0.0.1"
+
+            # set redis passwords
+            if ctx['MOZART_REDIS_PASSWORD'] is None:
+                ctx['MOZART_REDIS_PASSWORD'] = ''
+            if ctx['METRICS_REDIS_PASSWORD'] is None:
+                ctx['METRICS_REDIS_PASSWORD'] = ''
+
+            # split LDAP groups
+            ctx['LDAP_GROUPS'] = [i.strip() for i in ctx['LDAP_GROUPS'].split(',')]
+
+            self._node_contexts[node_type] = MappingProxyType(ctx)
+        return self._node_contexts[node_type]
+
+    @property
+    def roledefs(self):
+        """Fabric role definitions of the cluster."""
+
+        if self._roledefs is None:
+            conf = self.conf
+
+            # all verdi hosts
+            verdi_hosts = ['%s' % conf['VERDI_PVT_IP']]
+            if conf.get('OTHER_VERDI_HOSTS', None) is not None:
+                verdi_hosts.extend([i['VERDI_PVT_IP'] for i in conf['OTHER_VERDI_HOSTS']
+                                    if i['VERDI_PVT_IP'] is not None])
+
+            # ES hosts may be defined as a list
+            def es_hosts(key):
+                hosts = conf[key]
+                return hosts if type(hosts) is list else ['%s' % hosts]
+
+            self._roledefs = {
+                'mozart': ['%s' % conf['MOZART_PVT_IP']],
+                'mozart-rabbit': ['%s' % conf['MOZART_RABBIT_PVT_IP']],
+                'mozart-redis': ['%s' % conf['MOZART_REDIS_PVT_IP']],
+                'mozart-es': es_hosts('MOZART_ES_PVT_IP'),
+                'metrics': ['%s' % conf['METRICS_PVT_IP']],
+                'metrics-redis': ['%s' % conf['METRICS_REDIS_PVT_IP']],
+                'metrics-es': es_hosts('METRICS_ES_PVT_IP'),
+                'grq': ['%s' % conf['GRQ_PVT_IP']],
+                'grq-es': es_hosts('GRQ_ES_PVT_IP'),
+                'factotum': ['%s' % conf['FACTOTUM_PVT_IP']],
+                'ci': ['%s' % conf['CI_PVT_IP']],
+                'verdi': verdi_hosts,
+            }
+        return self._roledefs
+
+    @property
+    def key_filename(self):
+        """Validated SSH key file."""
+
+        key_filename = self.conf['KEY_FILENAME']
+        if not os.path.isfile(key_filename):
+            raise RuntimeError("SSH key filename %s doesn't exist. " % key_filename +
+                               "Run 'ssh-keygen -t rsa' or copy existing key.")
+        return key_filename
+
+    def configure_fabric_env(self, env):
+        """Set roles and key file on fabric env once."""
+
+        if not self._env_configured:
+            env.roledefs = self.roledefs
+            env.key_filename = self.key_filename
+            self._env_configured = True
+            logger.debug("roledefs: %s" % env.roledefs)
+            atexit.register(self.close_connections)
+
+    def count_connections(self, hosts, reused=False):
+        """Record SSH connections made or reused by a fabric task."""
+
+        if reused:
+            self.ssh_reused += hosts
+        else:
+            self.ssh_handshakes += hosts
+
+    def close_connections(self):
+        """Close cached SSH connections and report handshakes saved by reusing them."""
+
+        from fabric.api import hide
+        from fabric.network import disconnect_all
+        logger.debug("SSH handshakes: %d, saved by connection reuse: %d" %
+                     (self.ssh_handshakes, self.ssh_reused))
+        with hide('everything'):
+            disconnect_all()
+
+    def get_es(self, comp):
+        """Return memoized ES client of component (mozart, metrics or grq)."""
+
+        if comp not in self._es:
+            from sdscli.func_utils import get_func
+            self._es[comp] = get_func('hysds.es_util', 'get_{}_es'.format(comp))()
+        return self._es[comp]
+
+    @property
+    def mozart_es(self):
+        """Mozart ES client."""
+
+        return self.get_es('mozart')
+
+
+_cluster_context = None
+
+
+def get_cluster_context():
+    """Return process-wide cluster context, creating it on first call."""
+
+    global _cluster_context
+    if _cluster_context is None:
+        _cluster_context = ClusterContext()
+    return _cluster_context
+
+
+def reset_cluster_context(ctx=None):
+    """Replace process-wide cluster context, e.g. after the SDS config changed."""
+
+    global _cluster_context
+    _cluster_context = ctx
@@ -8,94 +8,101 @@ from __future__ import absolute_import
 
 
 from sdscli.prompt_utils import highlight, blink
-from sdscli.conf_utils import get_user_config_path, get_user_files_path
+from sdscli.conf_utils import get_user_files_path
 from sdscli.log_utils import logger
+from sdscli.template_utils import render_template
 from fabric.contrib.project import rsync_project
-from fabric.contrib.files import upload_template, exists, append
+from fabric.contrib.files import exists, append
+from fabric.utils import apply_lcwd
 from fabric.api import run, cd, put, sudo, prefix, env, settings, hide
-from copy import deepcopy
+from fabric.api import execute as fabric_execute
+from fabric.state import connections
+from collections import ChainMap
+from contextlib import contextmanager
+from datetime import datetime
+from shlex import quote
 import requests
 import json
-import yaml
 import re
 import os
+import hashlib
+import tempfile
+from io import StringIO
 from builtins import open
 from future import standard_library
 standard_library.install_aliases()
 
+from .context import get_cluster_context
+from .batch import StepBatch, shell_task, run_steps
+from .incremental import normalize_path, content_hash, file_hash, build_hash_cmd, parse_hashes
+from .rollout import Rollout
+from .relay import Relay, RELAY_FANOUT, has_ssh_agent, build_tree_hash_cmd, build_pull_cmd
+from .compression import DEFAULT_CODEC, get_codec
+
 
 # ssh_opts and extra_opts for rsync and rsync_project
 ssh_opts = "-o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no"
 extra_opts = "-k"
 
+# rsync options for code sync: compare files by checksum and delete the ones
+# removed upstream instead of removing and resending whole repos
+code_sync_opts = "-k --checksum --delete --stats"
+
+# byte counts reported by rsync --stats
+rsync_stats_re = re.compile(r'^(Total file size|Total transferred file size|Literal data|'
+                            r'Total bytes sent|Total bytes received): ([\d,]+)')
+
+# repos under ~/mozart/ops synced to every node type and to specific ones
+CODE_REPOS = ('osaka', 'hysds_commons', 'hysds', 'prov_es', 'sciflo', 'chimera',
+              'container-builder', 'lightweight-jobs', 'hysds-dockerfiles')
+# wheels of HySDS core dependencies, built on mozart and shared with the other nodes
+WHEELHOUSE_DIR = 'wheelhouse'
+
+# versioned venv tarballs and manifests, built on mozart and unpacked on the other nodes
+VENV_ARTIFACTS_DIR = 'venv_artifacts'
+
+# top-level entries of a venv dir that make up the venv itself
+VENV_ENTRIES = ('bin', 'lib', 'lib64', 'include', 'pyvenv.cfg')
+
+# file in a venv dir holding the version of the venv artifact it was unpacked from
+VENV_STAMP = '.venv_version'
+
+# manifest in the code bucket of the bundles shipped to it and their content hashes
+BUNDLE_MANIFEST = 'sds-bundles.json'
+
+# S3 object metadata key holding the content hash of a bundle
+BUNDLE_HASH_KEY = 'sds-content-hash'
+
+# suffix of the temporary key a bundle is streamed to before it replaces the bundle
+BUNDLE_PARTIAL_SUFFIX = '.partial'
+
+# templates rendered per queue into verdi bundles and where they go on mozart
+QUEUE_TEMPLATES = (
+    ('install.sh', '~/verdi/ops/install.sh'),
+    ('datasets.json.tmpl.asg', '~/verdi/etc/datasets.json'),
+    ('supervisord.conf.tmpl', '~/verdi/etc/supervisord.conf.tmpl'),
+)
+
+# creds on mozart copied into verdi bundles
+VERDI_CREDS = ('.netrc.verdi', '.boto.verdi', '.s3cfg.verdi', '.aws.verdi')
+
+# entries of ~/verdi/ops that make up the per-queue overlay of a layered bundle
+BUNDLE_OVERLAY = ('install.sh', 'etc', 'creds', 'beefed-autoindex-open_in_new_win.tbz2', 'code_layer')
+
+# files of a repo that determine its dependencies
+REQUIREMENT_FILES = ('setup.py', 'setup.cfg', 'pyproject.toml', 'requirements.txt')
+
+NODE_CODE_REPOS = {
+    'mozart': ('mozart',),
+    'verdi': ('spyddder-man',),
+    'factotum': ('spyddder-man',),
+    'grq': ('grq2', 'pele'),
+}
+
 # repo regex
 repo_re = re.compile(r'.+//.*?/(.*?)/(.*?)(?:\.git)?$')
 
-# define private EC2 IP addresses for infrastructure hosts
 this_dir = os.path.dirname(os.path.abspath(__file__))
-sds_cfg = get_user_config_path()
-if not os.path.isfile(sds_cfg):
-    raise RuntimeError(
-        "SDS configuration file doesn't exist. Run 'sds configure'.")
-
-with open(sds_cfg) as f:
-    context = yaml.load(f, Loader=yaml.FullLoader)
-
-# define and build groups to reduce redundancy in defining roles
-
-# mozart hosts
-mozart_es_engine = context.get("MOZART_ES_ENGINE", "elasticsearch")
-mozart_host = '%s' % context['MOZART_PVT_IP']
-mozart_rabbit_host = '%s' % context['MOZART_RABBIT_PVT_IP']
-mozart_redis_host = '%s' % context['MOZART_REDIS_PVT_IP']
-mozart_es_host = '%s' % context['MOZART_ES_PVT_IP']
-
-# metrics host
-metrics_es_engine = context.get("METRICS_ES_ENGINE", "elasticsearch")
-metrics_host = '%s' % context['METRICS_PVT_IP']
-metrics_redis_host = '%s' % context['METRICS_REDIS_PVT_IP']
-metrics_es_host = '%s' % context['METRICS_ES_PVT_IP']
-
-# grq host
-grq_es_engine = context.get("GRQ_ES_ENGINE", "elasticsearch")
-grq_host = '%s' % context['GRQ_PVT_IP']
-grq_es_host = '%s' % context['GRQ_ES_PVT_IP']
-
-# factotum host
-factotum_host = '%s' % context['FACTOTUM_PVT_IP']
-
-# continuous integration host
-ci_host = '%s' % context['CI_PVT_IP']
-
-# all verdi hosts
-verdi_hosts = [
-    '%s' % context['VERDI_PVT_IP'],
-]
-if context.get('OTHER_VERDI_HOSTS', None) is not None:
-    verdi_hosts.extend([i['VERDI_PVT_IP']
-                        for i in context['OTHER_VERDI_HOSTS'] if i['VERDI_PVT_IP'] is not None])
-
-# define roles
-env.roledefs = {
-    'mozart': [mozart_host],
-    'mozart-rabbit': [mozart_rabbit_host],
-    'mozart-redis': [mozart_redis_host],
-    'mozart-es': mozart_es_host if type(mozart_es_host) is list else [mozart_es_host],
-    'metrics': [metrics_host],
-    'metrics-redis': [metrics_redis_host],
-    'metrics-es': metrics_es_host if type(metrics_es_host) is list else [metrics_es_host],
-    'grq': [grq_host],
-    'grq-es': grq_es_host if type(grq_es_host) is list else [grq_es_host],
-    'factotum': [factotum_host],
-    'ci': [ci_host],
-    'verdi': verdi_hosts,
-}
-
-# define key file
-env.key_filename = context['KEY_FILENAME']
-if not os.path.isfile(env.key_filename):
-    raise RuntimeError("SSH key filename %s doesn't exist. " % env.key_filename +
-                       "Run 'ssh-keygen -t rsa' or copy existing key.")
 
 # abort on prompts (password, hosts, etc.)
 env.abort_on_prompts = True
@@ -106,49 +113,299 @@ env.parallel = True
 # set connection timeout
 env.timeout = 60
 
-# define ops home directory
-ops_dir = context['OPS_HOME']
+# pending shell steps while batched_steps() is active
+_batch = None
+
+# deployed file hashes per host and changed files log while incremental_update() is active
+_incremental = None
+
+# limits on fanning tasks out over multi-host roles while rollout() is active
+_rollout = None
+
+# relay tree of code and venv artifacts while relay_distribution() is active
+_relay = None
 
 
 ##########################
 # general functions
 ##########################
-def get_context(node_type=None):
-    """Modify context based on host string."""
+def execute(task, *args, **kwargs):
+    """Execute fabric task after setting up roles and key file from the cluster context."""
+
+    if _batch is not None:
+        batch_cmd = getattr(task, 'batch_cmd', None)
+        target = (tuple(kwargs.get('roles', ())), tuple(kwargs.get('hosts', ())))
+        if batch_cmd is not None and set(kwargs) <= {'roles', 'hosts'}:
+            if not _batch.add(target, batch_cmd(*args)):
+                flush_steps()
+                _batch.add(target, batch_cmd(*args))
+            return {}
+        flush_steps()
+
+    ctx = get_cluster_context()
+    ctx.configure_fabric_env(env)
+    hosts = get_target_hosts(**kwargs)
+    if _relay is not None:
+        _relay.new_round()
+    if _rollout is not None:
+        # leave out hosts that already failed during the rollout; excluding
+        # them keeps the roles tasks resolve their node type from
+        failed = _rollout.get_failed_hosts(hosts)
+        hosts -= set(failed)
+        if not hosts:
+            return {}
+        kwargs = dict(kwargs, exclude_hosts=list(kwargs.get('exclude_hosts', [])) + failed)
+        if len(hosts) > 1:
+            ctx.count_connections(len(hosts))
+            return _rollout.execute(task, *args, **kwargs)
+    if len(hosts) == 1:
+        # a forked worker would gain nothing for a single host and throw away
+        # its SSH connection; run in-process to reuse the cached connection
+        ctx.count_connections(1, has_live_connection(hosts.pop()))
+        with settings(parallel=False):
+            return fabric_execute(task, *args, **kwargs)
+    ctx.count_connections(len(hosts))
+    return fabric_execute(task, *args, **kwargs)
+
+
+@contextmanager
+def batched_steps():
+    """Collect consecutive simple shell tasks into one remote script per host.
+
+    Queued steps run when a task that cannot be batched is executed, when the
+    hosts change or when the block exits.
+    """
 
-    ctx = deepcopy(context)
+    global _batch
+    if _batch is not None:
+        yield
+        return
+    _batch = StepBatch()
+    try:
+        yield
+        flush_steps()
+    finally:
+        _batch = None
+
+
+def flush_steps():
+    """Run queued shell steps."""
+
+    target, cmds = _batch.pop()
+    if cmds:
+        roles, hosts = target
+        kwargs = {}
+        if roles:
+            kwargs['roles'] = list(roles)
+        if hosts:
+            kwargs['hosts'] = list(hosts)
+        execute(run_steps, cmds, **kwargs)
+
+
+@contextmanager
+def incremental_update():
+    """Upload rendered templates only where they differ from the deployed files.
+
+    Changed files are logged to a local file so that uploads made in forked
+    workers are seen by get_changed_files().
+    """
+
+    global _incremental
+    fd, log_file = tempfile.mkstemp(prefix='sds-changed-')
+    os.close(fd)
+    _incremental = {'hashes': {}, 'log': log_file}
+    try:
+        yield
+    finally:
+        _incremental = None
+        os.unlink(log_file)
+
+
+@contextmanager
+def rollout(parallel=None, batch_size=None, rolling=False, max_failures=0):
+    """Bound how many hosts of a multi-host role tasks run on at once, optionally in rolling batches.
+
+    Hosts that fail are skipped from then on until more than max_failures
+    of them failed; without any limits tasks fan out over all hosts as usual.
+    """
+
+    global _rollout
+    if not (parallel or batch_size or rolling or max_failures):
+        yield
+        return
+    _rollout = Rollout(parallel, batch_size, rolling, max_failures)
+    try:
+        yield
+        _rollout.print_summary()
+    finally:
+        _rollout.close()
+        _rollout = None
+
+
+@contextmanager
+def relay_distribution(seeds=0, fanout=RELAY_FANOUT):
+    """Send code and venv artifacts from mozart to seeds hosts only and have them relay to the rest.
+
+    Every host passes artifacts on to fanout others over SSH, using the
+    forwarded agent, and checks the hash of what it got against its source.
+    Hosts fall back to getting artifacts from mozart if that fails; without
+    seeds, or without an ssh-agent to forward, everything is sent from
+    mozart as usual.
+    """
+
+    global _relay
+    if seeds and not has_ssh_agent():
+        logger.warning("Relaying needs an ssh-agent holding the key for the hosts (see SSH_AUTH_SOCK and "
+                       "ssh-add -l); sending artifacts from mozart instead.")
+        seeds = 0
+    if not seeds:
+        yield
+        return
+    _relay = Relay(seeds, fanout)
+    try:
+        yield
+    finally:
+        _relay.close()
+        _relay = None
+
+
+def run_rolling(comp, func, *args, **kwargs):
+    """Call component function, in batches of the component's hosts if a rolling rollout is active."""
+
+    if _rollout is None:
+        return func(*args, **kwargs)
+    get_cluster_context().configure_fabric_env(env)
+    return _rollout.run(comp, func, *args, **kwargs)
 
-    if node_type == 'mozart':
-        if ctx['MOZART_PVT_IP'] == ctx['MOZART_RABBIT_PVT_IP']:
-            ctx['MOZART_RABBIT_PVT_IP'] = "127.0.0.1"
-        if ctx['MOZART_PVT_IP'] == ctx['MOZART_REDIS_PVT_IP']:
-            ctx['MOZART_REDIS_PVT_IP'] = "127.0.0.1"
-        if ctx['MOZART_PVT_IP'] == ctx['MOZART_ES_PVT_IP']:
-            ctx['MOZART_ES_PVT_IP'] = "127.0.0.1"
 
-    if node_type == 'metrics':
-        if ctx['METRICS_PVT_IP'] == ctx['METRICS_REDIS_PVT_IP']:
-            ctx['METRICS_REDIS_PVT_IP'] = "127.0.0.1"
-        if ctx['METRICS_PVT_IP'] == ctx['METRICS_ES_PVT_IP']:
-            ctx['METRICS_ES_PVT_IP'] = "127.0.0.1"
+def query_hashes(paths):
+    """Return dict of path to sha1 of deployed files."""
 
-    if node_type == 'grq':
-        if ctx['GRQ_PVT_IP'] == ctx['GRQ_ES_PVT_IP']:
-            ctx['GRQ_ES_PVT_IP'] = "127.0.0.1"
+    with hide('everything'):
+        return parse_hashes(run(build_hash_cmd(paths)))
 
-    # set redis passwords
-    if ctx['MOZART_REDIS_PASSWORD'] is None:
-        ctx['MOZART_REDIS_PASSWORD'] = ''
-    if ctx['METRICS_REDIS_PASSWORD'] is None:
-        ctx['METRICS_REDIS_PASSWORD'] = ''
 
-    # set hostname
-    ctx['HOST_STRING'] = env.host_string
+def prefetch_hashes(paths, **kwargs):
+    """Fetch hashes of deployed files in one round trip per host."""
 
-    # split LDAP groups
-    ctx['LDAP_GROUPS'] = [i.strip() for i in ctx['LDAP_GROUPS'].split(',')]
+    for host, hashes in execute(query_hashes, paths, **kwargs).items():
+        _incremental['hashes'].setdefault(host, {}).update(hashes)
 
-    return ctx
+
+def get_changed_files():
+    """Return list of (host, path) uploaded since incremental_update() started."""
+
+    with open(_incremental['log']) as f:
+        return [tuple(line.rstrip('\n').split('\t', 1)) for line in f]
+
+
+def put_text(text, destination, filename):
+    """Upload text the way fabric's upload_template does; return the remote path written.
+
+    An existing file is backed up with a .bak extension and a directory
+    destination gets the template's file name.
+    """
+
+    backup = 'if test -d {0}; then echo dir; elif test -e {0}; then cp {0} {0}.bak; fi'
+    with settings(hide('everything'), warn_only=True):
+        # check for a directory and back up the file in one round trip
+        if run(backup.format(destination.replace(' ', r'\ '))).strip() == 'dir':
+            sep = "" if destination.endswith('/') else "/"
+            destination += sep + os.path.basename(filename)
+            run(backup.format(destination.replace(' ', r'\ ')))
+    put(local_path=StringIO(text), remote_path=destination)
+    return destination
+
+
+def upload_template(filename, destination, context=None, use_jinja=False, template_dir=None):
+    """Render template with the shared template cache and upload it.
+
+    In incremental updates the upload is skipped if the deployed file is the same.
+    """
+
+    if template_dir is not None:
+        template_dir = apply_lcwd(template_dir, env)
+    text = render_template(filename, context, use_jinja, template_dir)
+    if _incremental is None:
+        put_text(text, destination, filename)
+        return
+    upload_changed(destination, content_hash(text), lambda: put_text(text, destination, filename))
+
+
+def upload_changed(destination, digest, upload):
+    """Call upload unless the deployed file already has digest, and log destination as changed if it did."""
+
+    path = normalize_path(destination)
+    hashes = _incremental['hashes'].setdefault(env.host_string, {})
+    if path not in hashes:
+        hashes.update(query_hashes([path]))
+    if hashes.get(path) == digest:
+        logger.debug("%s unchanged on %s" % (destination, env.host_string))
+        return
+    upload()
+    hashes[path] = digest
+    with open(_incremental['log'], 'a') as f:
+        f.write("%s\t%s\n" % (env.host_string, destination))
+
+
+def has_live_connection(host):
+    """Return True if a cached SSH connection to host is usable; drop it if it died."""
+
+    if host not in connections:
+        return False
+    transport = connections[host].get_transport()
+    if transport is not None and transport.is_active():
+        return True
+    logger.debug("dropping dead connection to %s" % host)
+    del connections[host]
+    return False
+
+
+def get_target_hosts(hosts=None, roles=None, **kwargs):
+    """Return unique hosts an execute() call with hosts/roles would run on."""
+
+    targets = list(hosts or [])
+    for role in roles or []:
+        targets.extend(env.roledefs.get(role, []))
+    return set(targets)
+
+
+def get_conf():
+    """Return SDS configuration of the cluster."""
+
+    return get_cluster_context().conf
+
+
+def get_ops_dir():
+    """Return ops home directory."""
+
+    return get_cluster_context().ops_dir
+
+
+def get_es_engine(comp):
+    """Return search engine (elasticsearch or opensearch) used by component."""
+
+    return get_cluster_context().get_es_engine(comp)
+
+
+def __getattr__(name):
+    """Resolve config-derived module attributes on first use."""
+
+    if name == 'context':
+        return get_conf()
+    if name == 'ops_dir':
+        return get_ops_dir()
+    if name in ('mozart_es_engine', 'metrics_es_engine', 'grq_es_engine'):
+        return get_es_engine(name.split('_')[0])
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def get_context(node_type=None):
+    """Modify context based on host string."""
+
+    # per-call changes land in the first map; the shared node type context is untouched
+    return ChainMap({'HOST_STRING': env.host_string},
+                    get_cluster_context().get_node_context(node_type))
 
 
 def resolve_files_dir(fname, files_dir):
@@ -218,31 +475,38 @@ def mpstat():
 
 
 def copy(src, dest):
-    put(src, dest)
+    """Upload local file; in incremental updates the upload is skipped if the deployed file is the same."""
 
+    if _incremental is None:
+        put(src, dest)
+        return
+    upload_changed(dest, file_hash(os.path.expanduser(src)), lambda: put(src, dest))
 
+
+@shell_task
 def ln_sf(src, dest):
-    if exists(dest):
-        run('rm -rf %s' % dest)
-    with cd(os.path.dirname(dest)):
-        run('ln -sf %s %s' % (src, os.path.basename(dest)))
+    return 'if test -e %s; then rm -rf %s; fi; cd %s && ln -sf %s %s' % (
+        dest, dest, os.path.dirname(dest), src, os.path.basename(dest))
 
 
+@shell_task
 def cp_rp(src, dest):
-    run('cp -rp %s %s' % (src, dest))
+    return 'cp -rp %s %s' % (src, dest)
 
 
+@shell_task
 def cp_rp_exists(src, dest):
-    if exists(src):
-        run('cp -rp %s %s' % (src, dest))
+    return 'if test -e %s; then cp -rp %s %s; fi' % (src, src, dest)
 
 
+@shell_task
 def rm_rf(path):
-    run('rm -rf %s' % path)
+    return 'rm -rf %s' % path
 
 
+@shell_task
 def sudo_rm_rf(path):
-    run('sudo rm -rf %s' % path)
+    return 'sudo rm -rf %s' % path
 
 
 def send_template(tmpl, dest, tmpl_dir=None, node_type=None):
@@ -273,64 +537,65 @@ def send_template_user_override(tmpl, dest, tmpl_dir=None, node_type=None):
 
 
 def set_spyddder_settings():
+    ops_dir = get_ops_dir()
     upload_template('settings.json.tmpl', '~/verdi/ops/spyddder-man/settings.json', use_jinja=True,
                     context=get_context(), template_dir=os.path.join(ops_dir, 'mozart/ops/spyddder-man'))
 
 
 def rsync_code(node_type, dir_path=None):
-    if dir_path is None:
-        dir_path = node_type
-    rm_rf('%s/ops/osaka' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/osaka'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-    rm_rf('%s/ops/hysds_commons' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/hysds_commons'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-    rm_rf('%s/ops/hysds' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/hysds'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-    rm_rf('%s/ops/prov_es' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/prov_es'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-    rm_rf('%s/ops/sciflo' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/sciflo'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-    rm_rf('%s/ops/chimera' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/chimera'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-    rm_rf('%s/ops/container-builder' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/container-builder'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-    rm_rf('%s/ops/lightweight-jobs' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/lightweight-jobs'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-    rm_rf('%s/ops/hysds-dockerfiles' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/hysds-dockerfiles'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-
-    if node_type == 'mozart':
-        rm_rf('%s/ops/mozart' % dir_path)
-        rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/mozart'), extra_opts=extra_opts,
-                      ssh_opts=ssh_opts)
+    """Sync HySDS repos to the node in one rsync session; return transfer stats.
 
-    if node_type == 'verdi':
-        rm_rf('%s/ops/spyddder-man' % dir_path)
-        rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/spyddder-man'), extra_opts=extra_opts,
-                      ssh_opts=ssh_opts)
-
-    if node_type == 'factotum':
-        rm_rf('%s/ops/spyddder-man' % dir_path)
-        rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/spyddder-man'), extra_opts=extra_opts,
-                      ssh_opts=ssh_opts)
+    The remote repos are kept so that only changed files are sent, and
+    files removed upstream are deleted in place. While relaying, hosts past
+    the seeds pull the repos from their relay parent instead of mozart.
+    """
 
-    if node_type == 'grq':
-        rm_rf('%s/ops/grq2' % dir_path)
-        rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/grq2'), extra_opts=extra_opts,
-                      ssh_opts=ssh_opts)
+    ops_dir = get_ops_dir()
+    if dir_path is None:
+        dir_path = node_type
+    repos = CODE_REPOS + NODE_CODE_REPOS.get(node_type, ())
+    dest = '%s/ops/' % dir_path
 
-        rm_rf('%s/ops/pele' % dir_path)
-        rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/pele'), extra_opts=extra_opts,
-                      ssh_opts=ssh_opts)
+    def get_digest():
+        with hide('everything'):
+            return run(build_tree_hash_cmd(dest, repos)).strip()
+
+    def push():
+        srcs = " ".join(os.path.join(ops_dir, 'mozart/ops', repo) for repo in repos)
+        out = rsync_project(dest, srcs, extra_opts=code_sync_opts, ssh_opts=ssh_opts, capture=True)
+        stats = parse_rsync_stats(out)
+        logger.debug("synced %d repos to %s: %s" % (len(repos), env.host_string, stats))
+        return stats, get_digest() if _relay is not None else None
+
+    def pull(parent, digest):
+        with settings(warn_only=True, forward_agent=True):
+            out = run(build_pull_cmd(parent, [dest + repo for repo in repos], dest,
+                                     code_sync_opts, ssh_opts))
+        if out.failed or get_digest() != digest:
+            return None
+        # the pull reports bytes from this host's side; swap them to match a push
+        stats = parse_rsync_stats(out)
+        stats['total_bytes_sent'], stats['total_bytes_received'] = (
+            stats.get('total_bytes_received', 0), stats.get('total_bytes_sent', 0))
+        stats['relay'] = parent
+        logger.debug("relayed %d repos from %s to %s: %s" % (len(repos), parent, env.host_string, stats))
+        return stats, digest
+
+    if _relay is None:
+        return push()[0]
+    return _relay.fetch('code-%s' % dir_path, push, pull)
+
+
+def parse_rsync_stats(output):
+    """Return dict of byte counts from output of rsync --stats."""
+
+    stats = {}
+    for line in output.splitlines():
+        match = rsync_stats_re.search(line)
+        if match:
+            key = match.group(1).lower().replace(' ', '_')
+            stats[key] = int(match.group(2).replace(',', ''))
+    return stats
 
 
 def svn_co(path, svn_url):
@@ -366,18 +631,20 @@ def grep(grep_str, dir_path):
         pass
 
 
+@shell_task
 def chmod(perms, path):
-    run('chmod -R %s %s' % (perms, path))
+    return 'chmod -R %s %s' % (perms, path)
 
 
 def reboot():
     sudo('reboot')
 
 
+@shell_task
 def mkdir(d, o, g):
     #sudo('mkdir -p %s' % d)
     #sudo('chown -R %s:%s %s' % (o, g, d))
-    run("mkdir -p %s" % d)
+    return "mkdir -p %s" % d
 
 
 def untar(tarfile, chdir):
@@ -439,6 +706,7 @@ def status():
 
 
 def ensure_venv(hysds_dir, update_bash_profile=True, system_site_packages=True, install_supervisor=True):
+    conf = get_conf()
     act_file = "~/%s/bin/activate" % hysds_dir
     if system_site_packages:
         venv_cmd = "virtualenv --system-site-packages %s" % hysds_dir
@@ -452,11 +720,11 @@ def ensure_venv(hysds_dir, update_bash_profile=True, system_site_packages=True,
             if install_supervisor:
                 run('pip install --ignore-installed supervisor')
     mkdir('%s/etc' % hysds_dir,
-          context['OPS_USER'], context['OPS_USER'])
+          conf['OPS_USER'], conf['OPS_USER'])
     mkdir('%s/log' % hysds_dir,
-          context['OPS_USER'], context['OPS_USER'])
+          conf['OPS_USER'], conf['OPS_USER'])
     mkdir('%s/run' % hysds_dir,
-          context['OPS_USER'], context['OPS_USER'])
+          conf['OPS_USER'], conf['OPS_USER'])
     if update_bash_profile:
         append('.bash_profile',
                "source $HOME/{}/bin/activate".format(hysds_dir), escape=True)
@@ -464,6 +732,156 @@ def ensure_venv(hysds_dir, update_bash_profile=True, system_site_packages=True,
                "export FACTER_ipaddress=$(/usr/sbin/ifconfig $(/usr/sbin/route | awk '/default/{print $NF}') | grep 'inet ' | sed 's/addr://' | awk '{print $2}')", escape=True)
 
 
+def build_venv_artifact(hysds_dir):
+    """Package venv as a tarball plus manifest versioned by its interpreter and packages; return the manifest."""
+
+    with hide('everything'):
+        out = run('cd ~/%s && echo "$PWD" && readlink -f bin/python && bin/pip freeze --all --exclude-editable'
+                  % hysds_dir)
+    lines = out.splitlines()
+    prefix_dir, python, packages = lines[0].strip(), lines[1].strip(), sorted(l.strip() for l in lines[2:])
+    version = hashlib.sha1("\n".join([python] + packages).encode('utf-8')).hexdigest()[:16]
+    name = '%s-%s' % (hysds_dir, version)
+    manifest = {
+        'hysds_dir': hysds_dir,
+        'version': version,
+        'prefix': prefix_dir,
+        'python': python,
+        'packages': packages,
+        'tarball': '%s.tar.gz' % name,
+    }
+    if not exists('%s/%s.tar.gz' % (VENV_ARTIFACTS_DIR, name)):
+        # write to temporary names and rename so nodes never see a partial artifact
+        run('mkdir -p {0} && cd ~/{1} && tar -czf ~/{0}/.{2}.tar.gz $(ls -d {3} 2>/dev/null) && '
+            'mv ~/{0}/.{2}.tar.gz ~/{0}/{2}.tar.gz'.format(VENV_ARTIFACTS_DIR, hysds_dir, name,
+                                                           " ".join(VENV_ENTRIES)))
+    with hide('everything'):
+        manifest['sha1'] = run("sha1sum %s/%s | cut -d' ' -f1" % (VENV_ARTIFACTS_DIR, manifest['tarball'])).strip()
+    put(local_path=StringIO(json.dumps(manifest, indent=2)),
+        remote_path='%s/.%s.json' % (VENV_ARTIFACTS_DIR, hysds_dir))
+    run('mv {0}/.{1}.json {0}/{1}.json'.format(VENV_ARTIFACTS_DIR, hysds_dir))
+    return manifest
+
+
+def get_venv_manifest(hysds_dir):
+    """Return manifest of current venv artifact built on mozart or None."""
+
+    path = os.path.join(get_ops_dir(), VENV_ARTIFACTS_DIR, '%s.json' % hysds_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def fetch_venv_tarball(manifest):
+    """Copy venv tarball to the node, from its relay parent while relaying; return its remote path."""
+
+    path = '%s/%s' % (VENV_ARTIFACTS_DIR, manifest['tarball'])
+
+    def get_digest():
+        with hide('everything'):
+            digest = run("sha1sum %s | cut -d' ' -f1" % path).strip()
+        # manifests of older artifacts have no hash to check against
+        return digest if manifest.get('sha1', digest) == digest else None
+
+    def push():
+        run('mkdir -p %s' % VENV_ARTIFACTS_DIR)
+        put(os.path.join(get_ops_dir(), path), path)
+        digest = get_digest()
+        if digest is None:
+            raise RuntimeError("Venv artifact %s on %s doesn't match its manifest." % (path, env.host_string))
+        return path, digest
+
+    def pull(parent, digest):
+        with settings(warn_only=True, forward_agent=True):
+            out = run('mkdir -p %s && %s' % (VENV_ARTIFACTS_DIR, build_pull_cmd(
+                parent, [path], '%s/' % VENV_ARTIFACTS_DIR, '', ssh_opts)))
+        if out.failed or get_digest() != digest:
+            return None
+        return path, digest
+
+    if _relay is None:
+        return push()[0]
+    return _relay.fetch('venv-%s' % manifest['version'], push, pull)
+
+
+def get_venv_artifact_state(hysds_dir):
+    """Return current venv artifact built on mozart or None, whether it fits the node and whether the node has it.
+
+    It fits if the node has the same home dir and interpreter; the node has
+    it if the venv's version stamp matches.
+    """
+
+    manifest = get_venv_manifest(hysds_dir)
+    if manifest is None:
+        return None, False, False
+    with hide('everything'):
+        node = run('echo "$HOME/{0}"; cat {0}/{1} 2>/dev/null || echo; test -x {2} && echo ok || echo'.format(
+            hysds_dir, VENV_STAMP, manifest['python'])).splitlines()
+    fits = node[0].strip() == manifest['prefix'] and node[2].strip() == 'ok'
+    current = node[1].strip() == manifest['version']
+    return manifest, fits, current
+
+
+def has_venv_artifact(hysds_dir):
+    """Return True if the node's venv is the current venv artifact built on mozart."""
+
+    manifest, fits, current = get_venv_artifact_state(hysds_dir)
+    return fits and current
+
+
+def get_venv_staging_dir(hysds_dir, manifest):
+    return '%s/.venv-%s' % (hysds_dir, manifest['version'])
+
+
+def fetch_venv_artifact(hysds_dir, incremental=False, **kwargs):
+    """Fetch current venv artifact built on mozart and unpack it aside, leaving the live venv alone.
+
+    install_venv_artifact swaps it in once services are stopped. The venv
+    is built with ensure_venv instead if there is no artifact or it doesn't
+    fit the node. Incremental updates leave services running on the venv,
+    so they refuse a node whose artifact is out of date.
+    """
+
+    manifest, fits, current = get_venv_artifact_state(hysds_dir)
+    fetch = fits and not current and not incremental
+    if _relay is not None and manifest is not None and not fetch:
+        # not fetched here; relay children get it from mozart instead of waiting
+        _relay.mark('venv-%s' % manifest['version'], env.host_string, None)
+    if manifest is None or not fits:
+        if manifest is not None:
+            logger.debug("venv artifact %s doesn't fit %s" % (manifest['version'], env.host_string))
+        ensure_venv(hysds_dir, **kwargs)
+    elif current:
+        logger.debug("venv artifact %s already current on %s" % (manifest['version'], env.host_string))
+    elif incremental:
+        raise RuntimeError("Venv artifact %s is out of date on %s. Update without --incremental to install it."
+                           % (manifest['version'], env.host_string))
+    else:
+        tarball = fetch_venv_tarball(manifest)
+        run('rm -rf {0} && mkdir -p {0} && tar -xzf {1} -C {0}'.format(
+            get_venv_staging_dir(hysds_dir, manifest), tarball))
+        # keep the current tarball only, for relay children and reinstalls
+        run("find {0} -maxdepth 1 -name '{1}-*.tar.gz' ! -name {2} -delete".format(
+            VENV_ARTIFACTS_DIR, hysds_dir, manifest['tarball']))
+
+
+def install_venv_artifact(hysds_dir, **kwargs):
+    """Swap venv artifact unpacked by fetch_venv_artifact in; services must be stopped."""
+
+    manifest, fits, current = get_venv_artifact_state(hysds_dir)
+    if fits and not current:
+        staging = get_venv_staging_dir(hysds_dir, manifest)
+        # swap each entry in with renames and stamp the version last
+        swap = " && ".join('{{ test ! -e {0}/{1} || mv {0}/{1} {0}/.old/{1}; }} && '
+                           '{{ test ! -e {2}/{1} || mv {2}/{1} {0}/{1}; }}'.format(
+                               hysds_dir, entry, staging) for entry in VENV_ENTRIES)
+        run('test -d {0} && rm -rf {1}/.old && mkdir {1}/.old && {2} && echo {3} > {1}/{4} && '
+            'rm -rf {1}/.old {0}'.format(staging, hysds_dir, swap, manifest['version'], VENV_STAMP))
+    # no-op for the venv itself when it exists; ensures dirs and bash profile
+    ensure_venv(hysds_dir, **kwargs)
+
+
 def install_pkg_es_templates():
     role, hysds_dir, hostname = resolve_role()
     if role not in ('grq', 'mozart'):
@@ -488,7 +906,8 @@ def install_base_es_template():
 
 def install_es_policy():
     # run(f"curl -XPUT 'localhost:9200/_ilm/policy/ilm_policy_mozart?pretty' -H 'Content-Type: application/json' -d@{target_file}")
-    if mozart_es_engine == "opensearch":
+    ops_dir = get_ops_dir()
+    if get_es_engine('mozart') == "opensearch":
         ism_policy_file_name = "opensearch_ism_policy_mozart.json"
         ism_target_file = f"{ops_dir}/mozart/etc/{ism_policy_file_name}"
         send_template(ism_policy_file_name, ism_target_file)
@@ -508,6 +927,7 @@ def install_mozart_es_templates():
     # install index templates
     # Only job_status.template has ILM policy attached
     # HC-451 will focus on adding ILM to worker, task, and event status indices
+    ops_dir = get_ops_dir()
     role, hysds_dir, hostname = resolve_role()
 
     # template files located in ~/.sds/files
@@ -534,13 +954,15 @@ def install_mozart_es_templates():
 # grq functions
 ##########################
 def grqd_start(force=False):
-    mkdir('sciflo/run', context['OPS_USER'], context['OPS_USER'])
+    conf = get_conf()
+    mkdir('sciflo/run', conf['OPS_USER'], conf['OPS_USER'])
     if not exists('sciflo/run/supervisord.pid') or force:
         with prefix('source sciflo/bin/activate'):
             run('supervisord', pty=False)
 
 
 def grqd_clean_start():
+    ops_dir = get_ops_dir()
     run('rm -rf %s/sciflo/log/*' % ops_dir)
     # with prefix('source %s/sciflo/bin/activate' % ops_dir):
     #    with cd(os.path.join(ops_dir, 'sciflo/ops/grq2/scripts')):
@@ -591,6 +1013,7 @@ def mozartd_start(force=False):
 
 
 def mozartd_clean_start():
+    ops_dir = get_ops_dir()
     run('rm -rf %s/mozart/log/*' % ops_dir)
     mozartd_start(True)
 
@@ -705,6 +1128,7 @@ def verdid_start(force=False):
 
 
 def verdid_clean_start():
+    ops_dir = get_ops_dir()
     run('rm -rf /data/work/scifloWork-ops/* /data/work/jobs/* /data/work/cache/* %s/verdi/log/*' % ops_dir)
     verdid_start(True)
 
@@ -747,7 +1171,10 @@ def pip_install_with_req(node_type, dest):
             run('pip install -e .')
 
 
-def pip_install_with_req(node_type, dest, ndeps):
+def pip_install_with_req(node_type, dest, ndeps, skip_artifact=False):
+    if skip_artifact and has_venv_artifact(node_type):
+        logger.debug("venv on %s is the current artifact, so skipping pip for %s" % (env.host_string, dest))
+        return
     with prefix('source ~/%s/bin/activate' % node_type):
         with cd(dest):
             if ndeps:
@@ -759,6 +1186,67 @@ def pip_install_with_req(node_type, dest, ndeps):
                 run('pip install -e .')
 
 
+def get_wheelhouse_key(repos):
+    """Return key of wheelhouse for repos: hash of their requirement files under the ops dir."""
+
+    ops_dir = get_ops_dir()
+    h = hashlib.sha1()
+    for repo in sorted(set(repos)):
+        for fname in REQUIREMENT_FILES:
+            path = os.path.join(ops_dir, 'mozart/ops', repo, fname)
+            if os.path.exists(path):
+                h.update(os.path.join(repo, fname).encode('utf-8'))
+                with open(path, 'rb') as f:
+                    h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+def build_wheelhouse(key, repo_sets):
+    """Build wheels of dependencies of each set of repos in mozart's venv; return False if already built."""
+
+    dest = '%s/%s' % (WHEELHOUSE_DIR, key)
+    if exists('%s/.complete' % dest):
+        return False
+    with prefix('source ~/mozart/bin/activate'):
+        for repos in repo_sets:
+            # one pass per venv's repos so each resolves the way its venv will
+            run('pip wheel -q -w %s %s' % (dest, " ".join('~/mozart/ops/%s' % r for r in repos)))
+    run('touch %s/.complete' % dest)
+    return True
+
+
+def distribute_wheelhouse(key):
+    """Copy wheelhouse built on mozart unless the node already has it."""
+
+    dest = '%s/%s' % (WHEELHOUSE_DIR, key)
+    if exists('%s/.complete' % dest):
+        return False
+    run('mkdir -p %s' % WHEELHOUSE_DIR)
+    rsync_project('%s/' % WHEELHOUSE_DIR, os.path.join(get_ops_dir(), dest),
+                  exclude='.complete', extra_opts=extra_opts, ssh_opts=ssh_opts)
+    run('touch %s/.complete' % dest)
+    return True
+
+
+def pip_install_from_wheelhouse(node_type, key, dests, ndeps, skip_artifact=False):
+    """Install repos in one resolver pass against the local wheelhouse, without index access.
+
+    With skip_artifact nothing is installed if the venv is the current
+    venv artifact, which has them already.
+    """
+
+    if skip_artifact and has_venv_artifact(node_type):
+        logger.debug("venv on %s is the current artifact, so skipping pip" % env.host_string)
+        return
+
+    opts = '--no-index --find-links ~/%s/%s' % (WHEELHOUSE_DIR, key)
+    if ndeps:
+        logger.debug("ndeps is set, so running pip with --no-deps")
+        opts += ' --no-deps'
+    with prefix('source ~/%s/bin/activate' % node_type):
+        run('pip install %s %s' % (opts, " ".join('-e %s' % d for d in dests)))
+
+
 def python_setup_develop(node_type, dest):
     with prefix('source ~/%s/bin/activate' % node_type):
         with cd(dest):
@@ -786,7 +1274,8 @@ def get_ci_job_info(repo, branch=None):
 
 
 def add_ci_job(repo, proto, branch=None, release=False):
-    with settings(sudo_user=context["JENKINS_USER"]):
+    conf = get_conf()
+    with settings(sudo_user=conf["JENKINS_USER"]):
         job_name, config_tmpl = get_ci_job_info(repo, branch)
         ctx = get_context()
         ctx['PROJECT_URL'] = repo
@@ -854,6 +1343,7 @@ def remove_ci_job(repo, branch=None):
 
 def send_shipper_conf(node_type, log_dir, cluster_jobs, redis_ip_job_status,
                       cluster_metrics, redis_ip_metrics):
+    ops_dir = get_ops_dir()
     role, hysds_dir, hostname = resolve_role()
 
     ctx = get_context(node_type)
@@ -864,7 +1354,7 @@ def send_shipper_conf(node_type, log_dir, cluster_jobs, redis_ip_job_status,
                         template_dir=os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash'))
         upload_template('sdswatch_client.conf', '~/mozart/etc/sdswatch_client.conf', use_jinja=True,
                         context=ctx, template_dir=os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash'))
-        if mozart_es_engine == "opensearch":
+        if get_es_engine('mozart') == "opensearch":
             send_template("run_sdswatch_client_opensearch.sh", "~/mozart/bin/run_sdswatch_client.sh")
         else:
             send_template("run_sdswatch_client.sh", "~/mozart/bin/run_sdswatch_client.sh")
@@ -878,7 +1368,7 @@ def send_shipper_conf(node_type, log_dir, cluster_jobs, redis_ip_job_status,
                         template_dir=os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash'))
         upload_template('sdswatch_client.conf', '~/metrics/etc/sdswatch_client.conf', use_jinja=True,
                         context=ctx, template_dir=os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash'))
-        if metrics_es_engine == "opensearch":
+        if get_es_engine('metrics') == "opensearch":
             send_template("run_sdswatch_client_opensearch.sh", "~/metrics/bin/run_sdswatch_client.sh")
         else:
             send_template("run_sdswatch_client.sh", "~/metrics/bin/run_sdswatch_client.sh")
@@ -890,7 +1380,7 @@ def send_shipper_conf(node_type, log_dir, cluster_jobs, redis_ip_job_status,
     elif node_type == 'grq':
         upload_template('sdswatch_client.conf', '~/sciflo/etc/sdswatch_client.conf', use_jinja=True,
                         context=ctx, template_dir=os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash'))
-        if grq_es_engine == "opensearch":
+        if get_es_engine('grq') == "opensearch":
             send_template("run_sdswatch_client_opensearch.sh", "~/sciflo/bin/run_sdswatch_client.sh")
         else:
             send_template("run_sdswatch_client.sh", "~/sciflo/bin/run_sdswatch_client.sh")
@@ -902,7 +1392,7 @@ def send_shipper_conf(node_type, log_dir, cluster_jobs, redis_ip_job_status,
     elif node_type in ('verdi', 'verdi-asg', 'factotum'):
         upload_template('sdswatch_client.conf', '~/verdi/etc/sdswatch_client.conf', use_jinja=True,
                         context=ctx, template_dir=os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash'))
-        if metrics_es_engine == "opensearch":
+        if get_es_engine('metrics') == "opensearch":
             send_template("run_sdswatch_client_opensearch.sh", "~/verdi/bin/run_sdswatch_client.sh")
         else:
             send_template("run_sdswatch_client.sh", "~/verdi/bin/run_sdswatch_client.sh")
@@ -931,6 +1421,7 @@ def send_logstash_jvm_options(node_type):
 ##########################
 
 def send_celeryconf(node_type):
+    ops_dir = get_ops_dir()
     ctx = get_context(node_type)
     template_dir = os.path.join(ops_dir, 'mozart/ops/hysds/configs/celery')
     if node_type == 'mozart':
@@ -955,17 +1446,20 @@ def send_celeryconf(node_type):
 
 
 def send_mozartconf():
+    conf = get_conf()
+    ops_dir = get_ops_dir()
     dest_file = '~/mozart/ops/mozart/settings.cfg'
     upload_template('settings.cfg.tmpl', dest_file, use_jinja=True, context=get_context('mozart'),
                     template_dir=os.path.join(ops_dir, 'mozart/ops/mozart/settings'))
     with prefix('source ~/mozart/bin/activate'):
         with cd('~/mozart/ops/mozart'):
             mkdir('~/mozart/ops/mozart/data',
-                  context['OPS_USER'], context['OPS_USER'])
+                  conf['OPS_USER'], conf['OPS_USER'])
             run('./db_create.py')
 
 
 def send_hysds_ui_conf():
+    ops_dir = get_ops_dir()
     dest_file = '~/mozart/ops/hysds_ui/src/config/index.js'
     upload_template('index.template.js', dest_file, use_jinja=True, context=get_context('mozart'),
                     template_dir=os.path.join(ops_dir, 'mozart/ops/hysds_ui/src/config'))
@@ -998,6 +1492,7 @@ def send_hysds_ui_conf():
 
 
 def send_grq2conf():
+    ops_dir = get_ops_dir()
     dest_file = '~/sciflo/ops/grq2/settings.cfg'
     upload_template('settings.cfg.tmpl', dest_file, use_jinja=True, context=get_context('grq'),
                     template_dir=os.path.join(ops_dir, 'mozart/ops/grq2/config'))
@@ -1056,6 +1551,7 @@ def send_hysds_scripts(node_type):
 ##########################
 
 def ensure_ssl(node_type):
+    conf = get_conf()
     ctx = get_context(node_type)
     if node_type == "grq":
         commonName = ctx['GRQ_FQDN']
@@ -1064,7 +1560,7 @@ def ensure_ssl(node_type):
     else:
         raise RuntimeError("Unknown node type: %s" % node_type)
     if not exists('ssl/server.key') or not exists('ssl/server.pem'):
-        mkdir('ssl', context['OPS_USER'], context['OPS_USER'])
+        mkdir('ssl', conf['OPS_USER'], conf['OPS_USER'])
         upload_template('ssl_server.cnf', 'ssl/server.cnf', use_jinja=True,
                         context={'commonName': commonName},
                         template_dir=get_user_files_path())
@@ -1080,20 +1576,138 @@ def ensure_ssl(node_type):
 ##########################
 # ship code
 ##########################
-def ship_code(cwd, tar_file, encrypt=False):
+def ship_code(cwd, bundle, encrypt=False):
+    # worker bootstraps extract queue bundles as bzip2 before install.sh exists
+    with cd(cwd):
+        return upload_bundle('*', bundle, encrypt, DEFAULT_CODEC)
+
+
+def build_bundle_list_cmd(paths):
+    """Return shell command listing paths and everything under them but VCS dirs, NUL separated in stable order."""
+
+    return "find %s -name .git -prune -o -print0 | LC_ALL=C sort -z" % paths
+
+
+def get_bundle_digest(paths, codec=DEFAULT_CODEC):
+    """Return sha1 over the type, mode, path and content of everything under paths, and the codec.
+
+    This identifies what a bundle unpacks to, unlike a hash of the
+    archive, which also changes with file mtimes.
+    """
+
+    find = "find %s -name .git -prune -o" % paths
+    with hide('everything'):
+        digest = run("{ echo %s; %s -printf '%%y %%m %%p %%l\\n' | LC_ALL=C sort; "
+                     "%s -type f -print0 | LC_ALL=C sort -z | xargs -0 -r sha1sum; } | "
+                     "sha1sum | cut -d' ' -f1" % (codec, find, find)).strip()
+    return digest
+
+
+def upload_bundle(paths, bundle, encrypt=False, codec=DEFAULT_CODEC, digest=None):
+    """Stream tarball of paths through the codec into bundle in the code bucket, unless it is unchanged.
+
+    aws s3 cp reads stdin in multipart chunks, so the upload overlaps with
+    compression and nothing is staged on disk. It can't tell a failed tar
+    or compressor from the end of input though, so the stream goes to a
+    temporary key that is moved to the bundle's, with its content hash as
+    object metadata, only once the whole pipeline succeeded. A bundle with
+    the same hash is left as is.
+    """
+
     ctx = get_context()
+    if digest is None:
+        digest = get_bundle_digest(paths, codec)
+    result = {'bundle': bundle, 'digest': digest, 'codec': codec, 'uploaded': False}
+    with settings(warn_only=True), hide('everything'):
+        shipped = run("aws s3api head-object --bucket %s --key %s --query 'Metadata.\"%s\"' --output text" %
+                      (ctx['CODE_BUCKET'], bundle, BUNDLE_HASH_KEY))
+    if shipped.succeeded and shipped.strip() == digest:
+        logger.debug("bundle %s unchanged: %s" % (bundle, digest))
+        return result
+    url = 's3://%s/%s' % (ctx['CODE_BUCKET'], bundle)
+    partial = '%s%s' % (url, BUNDLE_PARTIAL_SUFFIX)
+    sse = '--sse ' if encrypt else ''
+    with settings(warn_only=True):
+        out = run('set -o pipefail && %s | tar --null --no-recursion -T - -cf - | %s | aws s3 cp %s- %s' % (
+            build_bundle_list_cmd(paths), get_codec(codec).get_shell_cmd(), sse, partial))
+    if out.failed:
+        with settings(warn_only=True), hide('everything'):
+            run('aws s3 rm %s' % partial)
+        raise RuntimeError("Failed to build bundle %s on %s; left %s as it was." % (bundle, env.host_string, url))
+    run('aws s3 mv %s--metadata %s=%s --metadata-directive REPLACE %s %s' % (
+        sse, BUNDLE_HASH_KEY, digest, partial, url))
+    result['uploaded'] = True
+    return result
+
+
+def get_code_layer_paths():
+    """Return shell expression of the entries of the current dir that make up the code layer."""
+
+    return "$(ls | grep -vxF %s)" % " ".join("-e %s" % p for p in BUNDLE_OVERLAY)
+
+
+def get_code_layer_name(cwd, codec=DEFAULT_CODEC):
+    """Return content-addressed name of the code shared by all queue bundles."""
+
     with cd(cwd):
-        run('tar --exclude-vcs -cvjf %s *' % tar_file)
-    if encrypt is False:
-        run('aws s3 cp %s s3://%s/' % (tar_file, ctx['CODE_BUCKET']))
-    else:
-        run('aws s3 cp --sse %s s3://%s/' % (tar_file, ctx['CODE_BUCKET']))
+        digest = get_bundle_digest(get_code_layer_paths(), codec)
+    return 'verdi-code-%s%s' % (digest[:16], get_codec(codec).ext)
+
+
+def ship_code_layer(cwd, encrypt=False, codec=DEFAULT_CODEC):
+    """Ship code shared by all queue bundles unless the code bucket already has it."""
+
+    with cd(cwd):
+        paths = get_code_layer_paths()
+        digest = get_bundle_digest(paths, codec)
+        name = 'verdi-code-%s%s' % (digest[:16], get_codec(codec).ext)
+        return upload_bundle(paths, name, encrypt, codec, digest)
+
+
+def ship_overlay(cwd, bundle, code_layer, encrypt=False):
+    """Ship queue bundle holding only the queue's config and creds plus the name of its code layer.
+
+    Worker bootstraps extract it as bzip2 before install.sh exists, so only
+    the code layer it names can use another codec.
+    """
+
+    with cd(cwd):
+        run('echo %s > code_layer' % code_layer)
+        result = upload_bundle('$(ls -d %s 2>/dev/null)' % " ".join(BUNDLE_OVERLAY), bundle, encrypt,
+                               DEFAULT_CODEC)
+    result['code_layer'] = code_layer
+    return result
+
+
+def update_bundle_manifest(shipped):
+    """Record shipped bundles and their content hashes in the manifest in the code bucket; return it."""
+
+    ctx = get_context()
+    url = 's3://%s/%s' % (ctx['CODE_BUCKET'], BUNDLE_MANIFEST)
+    with settings(warn_only=True), hide('everything'):
+        current = run('aws s3 cp %s -' % url)
+    try:
+        manifest = json.loads(current) if current.succeeded else {}
+    except ValueError:
+        manifest = {}
+    now = datetime.utcnow().isoformat() + 'Z'
+    for result in shipped:
+        entry = manifest.setdefault(result['bundle'], {})
+        if result['uploaded'] or entry.get('digest') != result['digest']:
+            entry['uploaded'] = now
+        entry.update(digest=result['digest'], codec=result['codec'], checked=now)
+        if result.get('code_layer'):
+            entry['code_layer'] = result['code_layer']
+    with hide('everything'):
+        run("printf '%%s\\n' %s | aws s3 cp - %s" % (quote(json.dumps(manifest, indent=2, sort_keys=True)), url))
+    return manifest
 
 
 ##########################
 # ship creds
 ##########################
 def send_awscreds(suffix=None):
+    conf = get_conf()
     ctx = get_context()
     if suffix is None:
         aws_dir = '.aws'
@@ -1103,9 +1717,10 @@ def send_awscreds(suffix=None):
         aws_dir = '.aws{}'.format(suffix)
         boto_file = '.boto{}'.format(suffix)
         s3cfg_file = '.s3cfg{}'.format(suffix)
-    if exists(aws_dir):
+    # incremental updates keep deployed files so they can be compared
+    if exists(aws_dir) and _incremental is None:
         run('rm -rf {}'.format(aws_dir))
-    mkdir(aws_dir, context['OPS_USER'], context['OPS_USER'])
+    mkdir(aws_dir, conf['OPS_USER'], conf['OPS_USER'])
     run('chmod 700 {}'.format(aws_dir))
     upload_template('aws_config', '{}/config'.format(aws_dir), use_jinja=True, context=ctx,
                     template_dir=get_user_files_path())
@@ -1113,12 +1728,12 @@ def send_awscreds(suffix=None):
         upload_template('aws_credentials', '{}/credentials'.format(aws_dir), use_jinja=True, context=ctx,
                         template_dir=get_user_files_path())
     run('chmod 600 {}/*'.format(aws_dir))
-    if exists(boto_file):
+    if exists(boto_file) and _incremental is None:
         run('rm -rf {}'.format(boto_file))
     upload_template('boto', boto_file, use_jinja=True, context=ctx,
                     template_dir=get_user_files_path())
     run('chmod 600 {}'.format(boto_file))
-    if exists(s3cfg_file):
+    if exists(s3cfg_file) and _incremental is None:
         run('rm -rf {}'.format(s3cfg_file))
     upload_template('s3cfg', s3cfg_file, use_jinja=True, context=ctx,
                     template_dir=get_user_files_path())
@@ -1131,18 +1746,37 @@ def send_awscreds(suffix=None):
 def send_queue_config(queue):
     ctx = get_context()
     ctx.update({'queue': queue})
-    upload_template('install.sh', '~/verdi/ops/install.sh', use_jinja=True, context=ctx,
-                    template_dir=get_user_files_path())
-    upload_template('datasets.json.tmpl.asg', '~/verdi/etc/datasets.json',
-                    use_jinja=True, context=ctx, template_dir=get_user_files_path())
-    upload_template('supervisord.conf.tmpl', '~/verdi/etc/supervisord.conf.tmpl',
-                    use_jinja=True, context=ctx, template_dir=get_user_files_path())
+    for tmpl, dest in QUEUE_TEMPLATES:
+        upload_template(tmpl, dest, use_jinja=True, context=ctx, template_dir=get_user_files_path())
+
+
+def get_queue_config_hashes(queue):
+    """Return dict of file name to hash of the queue-specific configs send_queue_config renders."""
+
+    ctx = get_context()
+    ctx.update({'queue': queue})
+    return {os.path.basename(dest): content_hash(render_template(tmpl, ctx, True, get_user_files_path()))
+            for tmpl, dest in QUEUE_TEMPLATES}
+
+
+def get_ship_inputs(codec=DEFAULT_CODEC):
+    """Return dict of hashes of the code, config and creds on mozart that all queue bundles share."""
+
+    inputs = {}
+    with cd('~/verdi/ops'):
+        inputs['code'] = get_bundle_digest(get_code_layer_paths(), codec)
+    with cd('~/verdi/etc'):
+        queue_files = " ".join("-e %s" % os.path.basename(d) for t, d in QUEUE_TEMPLATES)
+        inputs['etc'] = get_bundle_digest('$(ls | grep -vxF -e supervisord.conf %s)' % queue_files)
+    inputs['creds'] = get_bundle_digest(" ".join('~/%s' % c for c in VERDI_CREDS))
+    return inputs
 
 
 ##########################
 # ship s3-bucket style
 ##########################
 def ship_style(bucket=None, encrypt=False):
+    ops_dir = get_ops_dir()
     ctx = get_context()
     if bucket is None:
         bucket = ctx['DATASET_BUCKET']
@@ -1178,6 +1812,7 @@ def create_zip(zip_dir, zip_file):
 # container orchestration
 ##########################
 def rsync_sdsadm():
+    ops_dir = get_ops_dir()
     role, hysds_dir, hostname = resolve_role()
     rm_rf('%s/ops/sdsadm' % hysds_dir)
     rsync_project('%s/ops/' % hysds_dir, os.path.join(ops_dir, 'mozart/ops/sdsadm'),
@@ -8,6 +8,43 @@ HOST_VERDI_HOME={{ HOST_VERDI_HOME or '$HOME' }}
 # This is the base directory of the data work directory
 DATA_DIR=/data
 
+# layered bundles only hold queue config and creds; fetch the shared code layer they name
+if [ -f "$BASE_PATH/code_layer" ]; then
+  CODE_LAYER=$(cat $BASE_PATH/code_layer)
+  if [ "$(cat $BASE_PATH/.code_layer 2>/dev/null)" != "$CODE_LAYER" ]; then
+    LAYER_FILE=$(mktemp /tmp/${CODE_LAYER}.XXXXXX)
+    if ! aws s3 cp s3://{{ CODE_BUCKET }}/${CODE_LAYER} $LAYER_FILE; then
+      echo "Failed to download code layer ${CODE_LAYER}." 1>&2
+      rm -f $LAYER_FILE
+      exit 1
+    fi
+    # detect codec from magic bytes; prefer multi-threaded tools when installed
+    case "$(od -An -tx1 -N4 $LAYER_FILE | tr -d ' \n')" in
+      28b52ffd) DECOMPRESS="zstd -dc" ;;
+      1f8b*) DECOMPRESS="$(command -v pigz || echo gzip) -dc" ;;
+      425a68*) DECOMPRESS="$(command -v lbzip2 || command -v pbzip2 || echo bzip2) -dc" ;;
+      *)
+        # uncompressed tarballs have their magic after the first member's header fields
+        if [ "$(od -An -c -j257 -N5 $LAYER_FILE 2>/dev/null | tr -d ' \n')" = "ustar" ]; then
+          DECOMPRESS="cat"
+        else
+          echo "Code layer ${CODE_LAYER} is not a tarball in a known format." 1>&2
+          rm -f $LAYER_FILE
+          exit 1
+        fi
+        ;;
+    esac
+    (set -o pipefail; $DECOMPRESS $LAYER_FILE | tar xf - -C $BASE_PATH) || {
+      echo "Failed to extract code layer ${CODE_LAYER}." 1>&2
+      rm -f $LAYER_FILE
+      exit 1
+    }
+    rm -f $LAYER_FILE
+    # record the layer only once it is fully in place so a failed fetch is retried
+    echo $CODE_LAYER > $BASE_PATH/.code_layer
+  fi
+fi
+
 source $HOST_VERDI_HOME/verdi/bin/activate
 
 # copy hysds configs
@@ -0,0 +1,93 @@
+"""
+Change detection for incremental updates of HySDS components.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+
+from future import standard_library
+standard_library.install_aliases()
+import hashlib
+from shlex import quote
+
+
+# services to restart when a deployed file ending with the key changes
+RESTART_SERVICES = (
+    ('ops/hysds/celeryconfig.py', 'celery workers'),
+    ('etc/supervisord.conf', 'supervisord'),
+    ('etc/indexer.conf', 'logstash'),
+    ('logstash/config/jvm.options', 'logstash'),
+    ('etc/sdswatch_client.conf', 'sdswatch client'),
+    ('bin/run_sdswatch_client.sh', 'sdswatch client'),
+    ('kibana/config/kibana.yml', 'kibana'),
+    ('ops/mozart/settings.cfg', 'mozart'),
+    ('ops/grq2/settings.cfg', 'grq2'),
+    ('ops/pele/settings.cfg', 'pele'),
+    ('ops/hysds_ui/src/config/index.js', 'hysds_ui (rebuild)'),
+    ('etc/tosca.js', 'hysds_ui (rebuild)'),
+    ('etc/figaro.js', 'hysds_ui (rebuild)'),
+    ('etc/orchestrator_jobs.json', 'orchestrator'),
+    ('etc/orchestrator_datasets.json', 'orchestrator'),
+    ('ops/mozart/actions_config.json', 'mozart'),
+)
+
+
+def normalize_path(path):
+    """Return remote path relative to the home directory, or absolute."""
+
+    if path.startswith('~/'):
+        return path[2:]
+    return path
+
+
+def content_hash(text):
+    """Return sha1 hex digest of text as written to the remote file."""
+
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def file_hash(path):
+    """Return sha1 hex digest of local file."""
+
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 ** 2), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def build_hash_cmd(paths):
+    """Return shell command printing "<sha1> <path>" for each path; the hash is empty if the file is missing."""
+
+    return ("cd ~ && for f in %s; do "
+            "printf '%%s %%s\\n' \"$(sha1sum -- \"$f\" 2>/dev/null | cut -d' ' -f1)\" \"$f\"; "
+            "done" % " ".join(quote(normalize_path(p)) for p in paths))
+
+
+def parse_hashes(output):
+    """Return dict of path to sha1 (None if missing) from output of hash command."""
+
+    hashes = {}
+    for line in output.splitlines():
+        digest, _, path = line.partition(' ')
+        if path:
+            hashes[path] = digest or None
+    return hashes
+
+
+def get_restart_services(comp, paths):
+    """Return sorted services that need a restart to pick up changed files."""
+
+    services = set()
+    for path in paths:
+        path = normalize_path(path)
+        # verdi files on mozart only feed the code/config bundle
+        if comp == 'mozart' and (path.startswith('verdi/') or '.verdi' in path):
+            services.add('verdi bundle (sds ship)')
+            continue
+        for suffix, service in RESTART_SERVICES:
+            if path.endswith(suffix):
+                services.add(service)
+    return sorted(services)
@@ -0,0 +1,74 @@
+"""
+Local ledger of the inputs of shipped verdi bundles for HySDS.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+
+from builtins import open
+from future import standard_library
+standard_library.install_aliases()
+import os
+import json
+import hashlib
+from datetime import datetime
+
+from sdscli.log_utils import logger
+from sdscli.conf_utils import get_ship_ledger_path
+
+
+def get_inputs_digest(inputs):
+    """Return sha1 of dict of input name to hash."""
+
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ShipLedger(object):
+    """Digest of the inputs each bundle was last shipped with, per code bucket.
+
+    The ledger is saved after every bundle, so a ship that fails part of
+    the way still skips the bundles it finished the next time.
+    """
+
+    def __init__(self, bucket, path=None):
+        """Construct ShipLedger instance."""
+
+        self.bucket = bucket
+        self.path = path or get_ship_ledger_path()
+        try:
+            with open(self.path) as f:
+                self.ledger = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.ledger = {}
+
+    @property
+    def bundles(self):
+        return self.ledger.setdefault(self.bucket, {})
+
+    def is_current(self, bundle, inputs):
+        """Return True if bundle was last shipped with the same inputs."""
+
+        entry = self.bundles.get(bundle, {})
+        return entry.get('digest') == get_inputs_digest(inputs)
+
+    def get_changed(self, bundle, inputs):
+        """Return sorted names of inputs that differ from the last ship of bundle."""
+
+        shipped = self.bundles.get(bundle, {}).get('inputs', {})
+        return sorted(k for k in set(inputs) | set(shipped) if inputs.get(k) != shipped.get(k))
+
+    def record(self, bundle, inputs):
+        """Record that bundle was shipped with inputs and save the ledger."""
+
+        self.bundles[bundle] = {
+            'digest': get_inputs_digest(inputs),
+            'inputs': inputs,
+            'shipped': datetime.utcnow().isoformat() + 'Z',
+        }
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.ledger, f, indent=2, sort_keys=True)
+        os.rename(tmp, self.path)
+        logger.debug("recorded %s in %s" % (bundle, self.path))
@@ -8,16 +8,13 @@ from __future__ import absolute_import
 
 
 from . import fabfile as fab
+from .fabfile import execute
 from sdscli.func_utils import get_module, get_func
-from sdscli.prompt_utils import YesNoValidator, highlight, set_bar_desc
+from sdscli.prompt_utils import prompt_yes_no, highlight, set_bar_desc
 from sdscli.conf_utils import get_user_files_path, SettingsConf
 from sdscli.log_utils import logger
-from pygments.token import Token
-from prompt_toolkit.validation import Validator, ValidationError
-from prompt_toolkit.styles import style_from_dict
-from prompt_toolkit.shortcuts import prompt, print_tokens
 from tqdm import tqdm
-from fabric.api import execute, hide
+from fabric.api import hide
 import traceback
 import pkgutil
 import json
@@ -26,13 +23,6 @@ from future import standard_library
 standard_library.install_aliases()
 
 
-prompt_style = style_from_dict({
-    Token.Alert: 'bg:#D8060C',
-    Token.Username: '#D8060C',
-    Token.Param: '#3CFF33',
-})
-
-
 def init_mozart(conf, comp='mozart'):
     """"Initialize mozart component."""
 
@@ -273,9 +263,7 @@ def init(comp, debug=False, force=False):
 
     # prompt user
     if not force:
-        cont = prompt(get_prompt_tokens=lambda x: [(Token.Alert,
-                                                    "Initializing component[s]: {}. Continue [y/n]: ".format(comp)), (Token, " ")],
-                      validator=YesNoValidator(), style=prompt_style) == 'y'
+        cont = prompt_yes_no("Initializing component[s]: {}. Continue [y/n]: ".format(comp))
         if not cont:
             return 0
 
@@ -315,9 +303,7 @@ def start(comp, release, debug=False, force=False):
 
     # prompt user
     if not force:
-        cont = prompt(get_prompt_tokens=lambda x: [(Token.Alert,
-                                                    "Starting component[s]: {}. Continue [y/n]: ".format(comp)), (Token, " ")],
-                      validator=YesNoValidator(), style=prompt_style) == 'y'
+        cont = prompt_yes_no("Starting component[s]: {}. Continue [y/n]: ".format(comp))
         if not cont:
             return 0
 
@@ -353,9 +339,7 @@ def stop(comp, debug=False, force=False):
 
     # prompt user
     if not force:
-        cont = prompt(get_prompt_tokens=lambda x: [(Token.Alert,
-                                                    "Stopping component[s]: {}. Continue [y/n]: ".format(comp)), (Token, " ")],
-                      validator=YesNoValidator(), style=prompt_style) == 'y'
+        cont = prompt_yes_no("Stopping component[s]: {}. Continue [y/n]: ".format(comp))
         if not cont:
             return 0
 
@@ -3,22 +3,36 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import division
 from __future__ import absolute_import
-from builtins import open
 from datetime import datetime
 from future import standard_library
 standard_library.install_aliases()
 
+import io
 import os
 import json
+import time
 import tarfile
 import shutil
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from tqdm import tqdm
 
 from sdscli.log_utils import logger
-from sdscli.conf_utils import get_user_files_path, SettingsConf
+from sdscli.conf_utils import get_user_files_path
 from sdscli.os_utils import validate_dir, normpath
+from sdscli.prompt_utils import set_bar_desc
 
-from osaka.main import get, put, rmall
-from hysds.es_util import get_mozart_es
+from .context import get_cluster_context
+from .compression import get_codec, open_tar_writer, open_tar_reader
+from .transfer import get, put, rmall
+from .bulk import BulkRequest
+
+
+# images downloaded at a time by pkg export
+EXPORT_WORKERS = 4
+
+# seconds between progress bar updates of image downloads
+PROGRESS_INTERVAL = 1
 
 CONTAINERS_INDEX = "containers"
 JOB_SPECS_INDEX = "job_specs"
@@ -27,11 +41,10 @@ HYSDS_IOS_GRQ_INDEX = "hysds_ios-grq"
 USER_RULES_MOZART_INDEX = 'user_rules-mozart'
 USER_RULES_GRQ_INDEX = 'user_rules-grq'
 
-mozart_es = get_mozart_es()
-
 
 def ls(args):
     """List HySDS packages."""
+    mozart_es = get_cluster_context().mozart_es
     hits = mozart_es.query(index=CONTAINERS_INDEX)  # query for containers
 
     for hit in hits:
@@ -40,8 +53,126 @@ def ls(args):
     return
 
 
+def add_bytes(tar, arcname, data):
+    """Add file with data as its content to tarfile."""
+
+    info = tarfile.TarInfo(arcname)
+    info.size = len(data)
+    info.mtime = time.time()
+    info.mode = 0o644
+    tar.addfile(info, io.BytesIO(data))
+
+
+def get_dir_size(d):
+    """Return total size of the files under d, skipping ones that go away while walking it."""
+
+    size = 0
+    for root, dirs, files in os.walk(d):
+        for f in files:
+            try:
+                size += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return size
+
+
+def get_transfer_opts(args):
+    """Return part size and concurrency of transfers from command line args."""
+
+    part_size = getattr(args, 'part_size', None)
+    return {
+        'part_size': part_size * 1024 ** 2 if part_size else None,
+        'concurrency': getattr(args, 'concurrency', None),
+    }
+
+
+def download_images(urls, download_dir, workers=EXPORT_WORKERS, **transfer_opts):
+    """Download images at most workers at a time; yield (file name, path) of each as it completes.
+
+    osaka reports no progress for urls other than s3, so the byte progress
+    bar follows the size of each download's own dir under download_dir.
+    """
+
+    if not urls:
+        return
+    dirs = {}
+    done_bytes = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool, \
+            tqdm(unit='B', unit_scale=True, unit_divisor=1024, leave=False) as bar:
+        set_bar_desc(bar, "Downloading images")
+        for i, url in enumerate(urls):
+            d = os.path.join(download_dir, '.download-%d' % i)
+            validate_dir(d)
+            dirs[pool.submit(get, url, d, **transfer_opts)] = (url, d)
+        pending = set(dirs)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                    url, d = dirs[future]
+                    name = os.path.basename(url)
+                    image = os.path.join(download_dir, name)
+                    os.rename(os.path.join(d, name), image)
+                    os.rmdir(d)
+                    done_bytes += os.path.getsize(image)
+                    bar.update(done_bytes - bar.n)
+                    logger.debug("downloaded %s" % url)
+                    yield name, image
+                size = done_bytes + sum(get_dir_size(dirs[f][1]) for f in pending)
+                if size > bar.n:
+                    bar.update(size - bar.n)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+
+def get_hysds_ios(mozart_es, job_spec_ids, deprecated=False):
+    """Return hysds_io hits of job_specs from mozart and grq, in job_spec order.
+
+    All job_specs are looked up in one query over both indices; with
+    deprecated, those without any hysds_io are looked up again in one
+    query against the deprecated mappings.
+    """
+
+    if not job_spec_ids:
+        return []
+    indices = "%s,%s" % (HYSDS_IOS_MOZART_INDEX, HYSDS_IOS_GRQ_INDEX)
+    query = {
+        "query": {
+            "terms": {"job-specification.keyword": job_spec_ids}
+        }
+    }
+    hits = list(mozart_es.query(index=indices, body=query))
+    logger.debug("Found %d hysds_ios for %d job_specs." % (len(hits), len(job_spec_ids)))
+
+    # backwards-compatible query
+    found = set(hit['_source'].get('job-specification') for hit in hits)
+    missing = [i for i in job_spec_ids if i not in found]
+    if deprecated and missing:
+        logger.debug("Got no hysds_ios for %d job_specs. Checking deprecated mappings:" % len(missing))
+        query = {
+            "query": {
+                "query_string": {
+                    "query": "job-specification:({})".format(" OR ".join('"{}"'.format(i) for i in missing))
+                }
+            }
+        }
+        seen = set((hit['_index'], hit['_id']) for hit in hits)
+        for hit in mozart_es.query(index=indices, body=query):
+            if (hit['_index'], hit['_id']) not in seen and hit['_source'].get('job-specification') in missing:
+                hits.append(hit)
+
+    # mozart's before grq's for each job_spec
+    order = dict((i, n) for n, i in enumerate(job_spec_ids))
+    return sorted(hits, key=lambda hit: (order.get(hit['_source'].get('job-specification'), len(order)),
+                                         hit['_index'].startswith(HYSDS_IOS_GRQ_INDEX)))
+
+
 def export(args):
     """Export HySDS package."""
+    mozart_es = get_cluster_context().mozart_es
     cont_id = args.id  # container id
 
     # query for container
@@ -63,11 +194,12 @@ def export(args):
         logger.error("SDS package export directory {} exists. Not continuing.".format(export_dir))
         return 1
 
-    validate_dir(export_dir)  # create export directory
+    validate_dir(export_dir)  # create export directory; images pass through it on their way into the package
+    images = OrderedDict()  # distinct images to download by file name in the package
 
     # download container if url provided
     if cont_info.get('url', None) != None:
-        get(cont_info['url'], export_dir)
+        images.setdefault(os.path.basename(cont_info['url']), cont_info['url'])
         cont_info['url'] = os.path.basename(cont_info['url'])
 
     query = {
@@ -93,10 +225,9 @@ def export(args):
         job_specs = [job_spec['_source'] for job_spec in job_specs]
         logger.debug("job_specs: %s" % json.dumps(job_specs, indent=2))
 
-    hysds_ios = []  # pull hysds_ios for each job_spec and download any dependency images
+    # download any dependency images
     dep_images = {}
     for job_spec in job_specs:
-        # download dependency images
         for d in job_spec.get('dependency_images', []):
             if d['container_image_name'] in dep_images:
                 d['container_image_url'] = dep_images[d['container_image_name']]
@@ -105,60 +236,13 @@ def export(args):
                 if args.skip_include_dependency_images:
                     logger.info(f"Skipping download of dependency image: {d['container_image_url']}.")
                 else:
-                    get(d['container_image_url'], export_dir)
+                    images.setdefault(os.path.basename(d['container_image_url']), d['container_image_url'])
                 d['container_image_url'] = os.path.basename(d['container_image_url'])
                 dep_images[d['container_image_name']] = d['container_image_url']
 
-        # collect hysds_ios from mozart
-        query = {
-            "query": {
-                "term": {"job-specification.keyword": job_spec['id']}
-            }
-        }
-        mozart_hysds_ios = mozart_es.query(index=HYSDS_IOS_MOZART_INDEX, body=query)
-        mozart_hysds_ios = [hysds_io['_source'] for hysds_io in mozart_hysds_ios]
-        logger.debug("Found %d hysds_ios on mozart for %s." % (len(mozart_hysds_ios), job_spec['id']))
-
-        # backwards-compatible query
-        if len(mozart_hysds_ios) == 0:
-            logger.debug("Got no hysds_ios from mozart. Checking deprecated mappings:")
-            query = {
-                "query": {
-                    "query_string": {
-                        "query": "job-specification:\"{}\"".format(job_spec['id'])
-                    }
-                }
-            }
-            mozart_hysds_ios = mozart_es.query(index=HYSDS_IOS_MOZART_INDEX, body=query)
-            mozart_hysds_ios = [hysds_io['_source'] for hysds_io in mozart_hysds_ios]
-            logger.debug("Found %d hysds_ios on mozart for %s." % (len(mozart_hysds_ios), job_spec['id']))
-        hysds_ios.extend(mozart_hysds_ios)
-
-        # collect hysds_ios from grq
-        query = {
-            "query": {
-                "term": {"job-specification.keyword": job_spec['id']}
-            }
-        }
-        grq_hysds_ios = mozart_es.query(index=HYSDS_IOS_GRQ_INDEX, body=query)
-        grq_hysds_ios = [hysds_io['_source'] for hysds_io in grq_hysds_ios]
-        logger.debug("Found %d hysds_ios on grq for %s." % (len(grq_hysds_ios), job_spec['id']))
-
-        # backwards-compatible query
-        if len(mozart_hysds_ios) == 0:
-            logger.debug("Got no hysds_ios from grq. Checking deprecated mappings:")
-            query = {
-                "query": {
-                    "query_string": {
-                        "query": "job-specification:\"{}\"".format(job_spec['id'])
-                    }
-                }
-            }
-            grq_hysds_ios = mozart_es.query(index=HYSDS_IOS_GRQ_INDEX, body=query)
-            grq_hysds_ios = [hysds_io['_source'] for hysds_io in grq_hysds_ios]
-            logger.debug("Found %d hysds_ios on grq for %s." % (len(grq_hysds_ios), job_spec['id']))
-
-        hysds_ios.extend(grq_hysds_ios)
+    # collect hysds_ios of all job_specs from mozart and grq
+    hysds_ios = [hysds_io['_source'] for hysds_io in
+                 get_hysds_ios(mozart_es, [job_spec['id'] for job_spec in job_specs], deprecated=True)]
     logger.debug("Found %d hysds_ios total." % (len(hysds_ios)))
 
     # export allowed accounts
@@ -173,22 +257,69 @@ def export(args):
         "job_specs": job_specs,
         "hysds_ios": hysds_ios,
     }
-    manifest_file = os.path.join(export_dir, 'manifest.json')
-    with open(manifest_file, 'w') as f:
-        json.dump(manifest, f, indent=2, sort_keys=True)
-
-    # tar up hysds package
-    tar_file = os.path.join(outdir, "{}.tar".format(export_name))
-    with tarfile.open(tar_file, "w") as tar:
-        tar.add(export_dir, arcname=os.path.relpath(export_dir, outdir))
+    manifest = json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8')
+
+    # stream hysds package: package dir, manifest, then each image as soon
+    # as its download completes so the package is the only full copy on disk
+    codec = getattr(args, 'codec', 'none')
+    tar_file = os.path.join(outdir, "{}{}".format(export_name, get_codec(codec).ext))
+    with open_tar_writer(tar_file, codec) as tar:
+        tar.add(export_dir, arcname=export_name, recursive=False)
+        add_bytes(tar, os.path.join(export_name, 'manifest.json'), manifest)
+        workers = getattr(args, 'parallel', None) or EXPORT_WORKERS
+        for name, image in download_images(list(images.values()), export_dir, workers,
+                                           **get_transfer_opts(args)):
+            tar.add(image, arcname=os.path.join(export_name, name))
+            os.unlink(image)
 
     shutil.rmtree(export_dir)  # remove package dir
 
 
+def read_manifest(tar_file):
+    """Return name of the package dir and manifest of package, or None if it has none.
+
+    Packages have the manifest right after their dir, so only the start of
+    them is read; older ones are read up to wherever they have it.
+    """
+
+    export_name = None
+    with open_tar_reader(tar_file) as tar:
+        for member in tar:
+            if export_name is None:
+                export_name = member.name.split('/')[0]
+            if member.isfile() and member.name == "%s/manifest.json" % export_name:
+                return export_name, json.loads(tar.extractfile(member).read().decode('utf-8'))
+    return export_name, None
+
+
+def upload_images(tar_file, export_name, uploads, **transfer_opts):
+    """Stream images out of package into the urls uploads maps their file names to.
+
+    Returns sorted file names of the images not found in the package.
+    """
+
+    pending = dict(uploads)
+    if not pending:
+        return []
+    with open_tar_reader(tar_file) as tar, \
+            tqdm(unit='B', unit_scale=True, unit_divisor=1024, leave=False) as bar:
+        set_bar_desc(bar, "Uploading images")
+        for member in tar:
+            name = os.path.basename(member.name)
+            if not member.isfile() or member.name != "%s/%s" % (export_name, name) or name not in pending:
+                continue
+            put(tar.extractfile(member), pending.pop(name), callback=bar.update, **transfer_opts)
+            if not pending:
+                break
+    return sorted(pending)
+
+
 def import_pkg(args):
     """Import HySDS package."""
+    ctx = get_cluster_context()
+    mozart_es = ctx.mozart_es
 
-    conf = SettingsConf()  # get user's SDS conf settings
+    conf = ctx.settings  # get user's SDS conf settings
 
     # package tar file
     tar_file = normpath(args.file)
@@ -197,23 +328,12 @@ def import_pkg(args):
         return 1
     logger.debug("tar_file: %s" % tar_file)
 
-    # extract
-    outdir = os.path.dirname(tar_file)
-    with tarfile.open(tar_file) as tar:
-        export_name = tar.getnames()[0]
-        tar.extractall(outdir)
-    export_dir = os.path.join(outdir, export_name)
-    logger.debug("export_dir: %s" % export_dir)
-
-    # detect export dir
-    if not os.path.isdir(export_dir):
-        logger.error("Cannot find HySDS package dir %s." % export_dir)
-        return 1
-
     # read in manifest
-    manifest_file = os.path.join(export_dir, 'manifest.json')
-    with open(manifest_file) as f:
-        manifest = json.load(f)
+    export_name, manifest = read_manifest(tar_file)
+    if manifest is None:
+        logger.error("Cannot find manifest.json in HySDS package %s." % tar_file)
+        return 1
+    logger.debug("export_name: %s" % export_name)
     logger.debug("manifest: %s" % json.dumps(manifest, indent=2, sort_keys=True))
 
     # get code bucket
@@ -223,67 +343,63 @@ def import_pkg(args):
     logger.debug("code_bucket_url: %s" % code_bucket_url)
 
     cont_info = manifest['containers']
+    uploads = {}  # url to upload each image in the package to by file name
 
-    # upload container image to s3
+    # container image
     if cont_info.get('url', None) != None:
-        cont_image = os.path.join(export_dir, cont_info['url'])
-        cont_info['url'] = "{}/{}".format(code_bucket_url, cont_info['url'])
-        put(cont_image, cont_info['url'])
-
-    # index container in ES
-    indexed_container = mozart_es.index_document(index=CONTAINERS_INDEX, body=cont_info, id=cont_info['id'])
-    logger.debug(indexed_container)
+        uploads[cont_info['url']] = "{}/{}".format(code_bucket_url, cont_info['url'])
+        cont_info['url'] = uploads[cont_info['url']]
 
-    # index job_specs in ES and upload any dependency containers
+    # dependency images
     dep_images = {}
     for job_spec in manifest['job_specs']:
-        # download dependency images
         for d in job_spec.get('dependency_images', []):
             if d['container_image_name'] in dep_images:
                 d['container_image_url'] = dep_images[d['container_image_name']]
             else:
-                # upload container
-                dep_img = os.path.join(export_dir, d['container_image_url'])
+                dep_img = d['container_image_url']
                 d['container_image_url'] = "%s/%s" % (code_bucket_url, d['container_image_url'])
                 if args.skip_include_dependency_images:
                     logger.info(f"Skipping upload of dependency image: {dep_img}.")
                 else:
-                    put(dep_img, d['container_image_url'])
+                    uploads.setdefault(dep_img, d['container_image_url'])
                 dep_images[d['container_image_name']] = d['container_image_url']
 
-        indexed_job_spec = mozart_es.index_document(index=JOB_SPECS_INDEX, body=job_spec, id=job_spec['id'])
-        logger.debug(indexed_job_spec)
+    # upload images to s3 straight from the package
+    missing = upload_images(tar_file, export_name, uploads, **get_transfer_opts(args))
+    if missing:
+        raise RuntimeError("Cannot find image(s) %s in HySDS package %s." % (", ".join(missing), tar_file))
 
-    # index hysds_ios to ES
-    for hysds_io in manifest['hysds_ios']:
-        component = hysds_io.get('component', 'tosca')
+    # index container, job_specs, hysds_ios and user_rules in ES in batches
+    with BulkRequest(mozart_es, getattr(args, 'batch_size', None)) as bulk:
+        bulk.index(CONTAINERS_INDEX, cont_info, id=cont_info['id'])
 
-        hysds_io_id = hysds_io['id']
-        if component in ('mozart', 'figaro'):
-            indexed_hysds_io = mozart_es.index_document(index=HYSDS_IOS_MOZART_INDEX, body=hysds_io, id=hysds_io_id)
-            logger.debug(indexed_hysds_io)
-        else:
-            indexed_hysds_io = mozart_es.index_document(index=HYSDS_IOS_GRQ_INDEX, body=hysds_io, id=hysds_io_id)
-            logger.debug(indexed_hysds_io)
+        for job_spec in manifest['job_specs']:
+            bulk.index(JOB_SPECS_INDEX, job_spec, id=job_spec['id'])
 
-    # index user_rules to ES
-    for component in (('mozart', USER_RULES_MOZART_INDEX), ('grq', USER_RULES_GRQ_INDEX)):
-        for rule in manifest.get('user_rules', {}).get(component[0], []):
-            now = datetime.utcnow().isoformat() + 'Z'
+        for hysds_io in manifest['hysds_ios']:
+            component = hysds_io.get('component', 'tosca')
+            if component in ('mozart', 'figaro'):
+                bulk.index(HYSDS_IOS_MOZART_INDEX, hysds_io, id=hysds_io['id'])
+            else:
+                bulk.index(HYSDS_IOS_GRQ_INDEX, hysds_io, id=hysds_io['id'])
 
-            if not rule.get('creation_time', None):
-                rule['creation_time'] = now
-            if not rule.get('modified_time', None):
-                rule['modified_time'] = now
+        for component in (('mozart', USER_RULES_MOZART_INDEX), ('grq', USER_RULES_GRQ_INDEX)):
+            for rule in manifest.get('user_rules', {}).get(component[0], []):
+                now = datetime.utcnow().isoformat() + 'Z'
 
-            result = mozart_es.index_document(index=component[1], body=rule)  # indexing user rules
-            logger.debug(result)
+                if not rule.get('creation_time', None):
+                    rule['creation_time'] = now
+                if not rule.get('modified_time', None):
+                    rule['modified_time'] = now
 
-    shutil.rmtree(export_dir)  # remove package dir
+                bulk.index(component[1], rule)
+    logger.debug("indexed %d document(s)" % bulk.done)
 
 
 def rm(args):
     """Remove HySDS package."""
+    mozart_es = get_cluster_context().mozart_es
     cont_id = args.id  # container id
 
     cont_info = mozart_es.get_by_id(index=CONTAINERS_INDEX, id=cont_id, ignore=404)  # query for container
@@ -296,9 +412,6 @@ def rm(args):
 
     rmall(cont_info['url'])  # delete container from code bucket and ES
 
-    deleted_container = mozart_es.delete_by_id(index=CONTAINERS_INDEX, id=cont_info['id'])
-    logger.debug(deleted_container)
-
     query = {
         "query": {
             "term": {"container.keyword": cont_id}  # query job specs
@@ -306,38 +419,12 @@ def rm(args):
     }
 
     job_specs = mozart_es.query(index=JOB_SPECS_INDEX, body=query)
-    job_specs = [job_spec['_source'] for job_spec in job_specs]
-    logger.debug("job_specs: %s" % json.dumps(job_specs, indent=2))
-
-    # delete job_specs and hysds_ios
-    for job_spec in job_specs:
-        query = {
-            "query": {
-                "term": {"job-specification.keyword": job_spec['id']}  # collect hysds_ios from mozart
-            }
-        }
-        mozart_hysds_ios = mozart_es.query(index=HYSDS_IOS_MOZART_INDEX, body=query)
-        mozart_hysds_ios = [hysds_io['_source'] for hysds_io in mozart_hysds_ios]
-        logger.debug("Found %d hysds_ios on mozart for %s" % (len(mozart_hysds_ios), job_spec['id']))
-
-        for hysds_io in mozart_hysds_ios:  # deleting hysds_io in mozart
-            hysds_io_id = hysds_io['id']
-            deleted_hysds_io = mozart_es.delete_by_id(index=HYSDS_IOS_MOZART_INDEX, id=hysds_io_id)
-            logger.debug(deleted_hysds_io)
-
-        query = {
-            "query": {
-                "term": {"job-specification.keyword": job_spec['id']}  # collect hysds_ios from GRQ
-            }
-        }
-        grq_hysds_ios = mozart_es.query(index=HYSDS_IOS_GRQ_INDEX, body=query)
-        grq_hysds_ios = [hysds_io['_source'] for hysds_io in grq_hysds_ios]
-        logger.debug("Found %d hysds_ios on grq for %s." % (len(grq_hysds_ios), job_spec['id']))
-
-        for hysds_io in grq_hysds_ios:
-            hysds_io_id = hysds_io['id']
-            deleted_hysds_io = mozart_es.delete_by_id(index=HYSDS_IOS_GRQ_INDEX, id=hysds_io_id)
-            logger.debug(deleted_hysds_io)
-
-        deleted_job_spec = mozart_es.delete_by_id(index=JOB_SPECS_INDEX, id=job_spec['id'])  # delete job_spec from ES
-        logger.debug(deleted_job_spec)
+    logger.debug("job_specs: %s" % json.dumps([job_spec['_source'] for job_spec in job_specs], indent=2))
+    hysds_ios = get_hysds_ios(mozart_es, [job_spec['_source']['id'] for job_spec in job_specs])
+
+    # delete container, job_specs and hysds_ios in batches
+    with BulkRequest(mozart_es, getattr(args, 'batch_size', None)) as bulk:
+        bulk.delete(CONTAINERS_INDEX, cont_info['id'])
+        for hit in hysds_ios + job_specs:
+            bulk.delete(hit['_index'], hit['_id'])
+    logger.debug("deleted %d document(s)" % bulk.done)
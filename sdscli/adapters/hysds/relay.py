@@ -0,0 +1,155 @@
+"""
+Tree relay of artifacts from mozart to many hosts for HySDS.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+
+from builtins import open
+from future import standard_library
+standard_library.install_aliases()
+import os
+import time
+import uuid
+import shutil
+import tempfile
+import subprocess
+from shlex import quote
+
+from fabric.api import env
+
+from sdscli.log_utils import logger
+
+
+# default number of hosts fed by mozart and of hosts each host relays to
+RELAY_SEEDS = 2
+RELAY_FANOUT = 4
+
+# seconds a host waits for its relay parent before getting the artifact from mozart
+RELAY_TIMEOUT = 1800
+
+# seconds between checks for the relay parent
+RELAY_POLL = 1
+
+
+def has_ssh_agent():
+    """Return True if an ssh-agent holding keys is available to forward for host-to-host pulls."""
+
+    if not os.environ.get('SSH_AUTH_SOCK'):
+        return False
+    try:
+        return subprocess.call(['ssh-add', '-l'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+    except OSError:
+        return False
+
+
+def get_relay_parent(hosts, host, seeds=RELAY_SEEDS, fanout=RELAY_FANOUT):
+    """Return host that host gets artifacts from, or None if it is a seed fed by mozart.
+
+    The first seeds hosts are fed by mozart and every host relays to the
+    next fanout hosts without a parent, so a parent always comes before its
+    children in hosts and the tree is logarithmic in the number of hosts.
+    """
+
+    i = list(hosts).index(host)
+    if i < seeds:
+        return None
+    return hosts[(i - seeds) // fanout]
+
+
+def build_tree_hash_cmd(base_dir, paths):
+    """Return shell command printing one sha1 over the files under paths, relative to base dir."""
+
+    return ("cd %s && find %s -type f -print0 | LC_ALL=C sort -z | xargs -0 sha1sum | "
+            "sha1sum | cut -d' ' -f1" % (base_dir, " ".join(quote(p) for p in paths)))
+
+
+def build_pull_cmd(parent, srcs, dest, opts, ssh_opts):
+    """Return shell command pulling srcs from parent host into dest dir over SSH."""
+
+    return 'rsync -pthrz %s -e "ssh %s -o BatchMode=yes" %s %s' % (
+        opts, ssh_opts, " ".join('%s:%s' % (parent, s) for s in srcs), dest)
+
+
+class Relay(object):
+    """Distribution of artifacts over a tree of hosts rooted at mozart.
+
+    Each host records the digest of an artifact once it has it in a marker
+    file, local to the fabric workers of all hosts, so its children know
+    when they can pull from it and what they should end up with.
+    """
+
+    def __init__(self, seeds=RELAY_SEEDS, fanout=RELAY_FANOUT):
+        """Construct Relay instance."""
+
+        self.seeds = seeds
+        self.fanout = fanout
+        self.dir = tempfile.mkdtemp(prefix='sds-relay-')
+        self.token = None
+
+    def close(self):
+        """Remove markers."""
+
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def new_round(self):
+        """Start relaying for a new fabric execute; markers of earlier ones are ignored."""
+
+        self.token = uuid.uuid4().hex
+
+    def get_marker(self, artifact, host):
+        return os.path.join(self.dir, '%s-%s-%s' % (self.token, artifact, host))
+
+    def mark(self, artifact, host, digest):
+        """Record that host has artifact with digest, or failed to get it if digest is None."""
+
+        marker = self.get_marker(artifact, host)
+        with open(marker + '.tmp', 'w') as f:
+            f.write(digest or '')
+        os.rename(marker + '.tmp', marker)
+
+    def wait(self, artifact, host, timeout=RELAY_TIMEOUT):
+        """Wait for host to have artifact; return its digest or None if it failed or timed out."""
+
+        marker = self.get_marker(artifact, host)
+        deadline = time.time() + timeout
+        while not os.path.exists(marker):
+            if time.time() > deadline:
+                logger.debug("timed out waiting for %s on %s" % (artifact, host))
+                return None
+            time.sleep(RELAY_POLL)
+        with open(marker) as f:
+            return f.read() or None
+
+    def fetch(self, artifact, push, pull):
+        """Get artifact onto the current host and return the push or pull result.
+
+        pull(parent, digest) copies it from the relay parent and returns
+        (result, digest), or None if that failed or didn't verify; push()
+        sends it from mozart instead and returns (result, digest).
+        """
+
+        host = env.host_string
+        try:
+            got = None
+            # fabric's job queue starts hosts from the end of the host list;
+            # build the tree in that order so parents start before children
+            hosts = list(reversed(env.all_hosts))
+            parent = get_relay_parent(hosts, host, self.seeds, self.fanout)
+            if parent is not None:
+                digest = self.wait(artifact, parent)
+                if digest is not None:
+                    got = pull(parent, digest)
+                if got is None:
+                    logger.warning("couldn't relay %s from %s to %s, sending it from mozart" %
+                                   (artifact, parent, host))
+            if got is None:
+                got = push()
+        except BaseException:
+            self.mark(artifact, host, None)
+            raise
+        result, digest = got
+        self.mark(artifact, host, digest)
+        return result
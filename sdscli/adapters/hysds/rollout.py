@@ -0,0 +1,186 @@
+"""
+Bounded and rolling fan-out of tasks over multi-host roles for HySDS.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+
+from builtins import open
+from future import standard_library
+standard_library.install_aliases()
+import os
+import tempfile
+import traceback
+from functools import wraps
+from collections import OrderedDict
+
+from fabric.api import env, settings
+from fabric.api import execute as fabric_execute
+from tqdm import tqdm
+
+from sdscli.log_utils import logger
+from sdscli.prompt_utils import set_bar_desc
+
+
+# hosts per batch of a rolling run when no batch size or parallelism is given
+DEFAULT_BATCH_SIZE = 10
+
+
+class HostFailure(object):
+    """Error of a task on one host, returned in place of the task's result."""
+
+    def __init__(self, host, error):
+        """Construct HostFailure instance."""
+
+        self.host = host
+        self.error = error
+
+    def __repr__(self):
+        return "HostFailure(%r)" % self.host
+
+
+class HostsFailed(RuntimeError):
+    """Raised when more hosts failed than the rollout tolerates."""
+
+    def __init__(self, message, failures):
+        """Construct HostsFailed instance."""
+
+        super(HostsFailed, self).__init__(message, failures)
+        self.failures = failures
+
+    def __str__(self):
+        return self.args[0]
+
+
+def catch_host_failure(task):
+    """Wrap fabric task so that errors on a host are returned as HostFailure instead of aborting."""
+
+    @wraps(task)
+    def wrapper(*args, **kwargs):
+        try:
+            # have abort() raise with its message rather than a bare SystemExit
+            with settings(abort_exception=RuntimeError):
+                return task(*args, **kwargs)
+        except BaseException as e:
+            logger.debug("%s failed on %s:\n%s" % (getattr(task, '__name__', task), env.host_string,
+                                                   traceback.format_exc()))
+            return HostFailure(env.host_string, get_error_summary(e))
+    return wrapper
+
+
+def get_error_summary(e):
+    """Return first line of exception message prefixed by its type."""
+
+    lines = [l.strip() for l in str(e).splitlines() if l.strip()]
+    return "%s: %s" % (type(e).__name__, lines[0]) if lines else type(e).__name__
+
+
+class Rollout(object):
+    """Limits on fanning tasks out over the hosts of multi-host roles.
+
+    Hosts a task fails on are left out of the following tasks, and the
+    rollout aborts once more than max_failures hosts failed. Failures are
+    logged to a local file so that ones in forked workers are seen by all.
+    """
+
+    def __init__(self, parallel=None, batch_size=None, rolling=False, max_failures=0):
+        """Construct Rollout instance."""
+
+        self.parallel = parallel
+        if batch_size is None and rolling:
+            batch_size = parallel or DEFAULT_BATCH_SIZE
+        self.batch_size = batch_size
+        self.max_failures = max_failures
+        fd, self.log_file = tempfile.mkstemp(prefix='sds-failed-')
+        os.close(fd)
+
+    def close(self):
+        """Remove failure log."""
+
+        os.unlink(self.log_file)
+
+    def get_failed(self):
+        """Return ordered dict of failed host to error summary."""
+
+        with open(self.log_file) as f:
+            return OrderedDict(line.rstrip('\n').split('\t', 1) for line in f)
+
+    def record_failures(self, failures):
+        """Log failed hosts with their error summaries; raise HostsFailed if there are now too many."""
+
+        with open(self.log_file, 'a') as f:
+            for host, error in failures.items():
+                f.write("%s\t%s\n" % (host, error))
+        self.check_failures()
+
+    def check_failures(self):
+        """Raise HostsFailed if more hosts failed than tolerated."""
+
+        failed = self.get_failed()
+        if len(failed) > self.max_failures:
+            raise HostsFailed("Aborting rollout: %d host(s) failed, more than the %d tolerated: %s" %
+                              (len(failed), self.max_failures, ", ".join(failed)), failed)
+
+    def get_failed_hosts(self, hosts):
+        """Return sorted hosts that failed."""
+
+        failed = self.get_failed()
+        return sorted(h for h in hosts if h in failed)
+
+    def execute(self, task, *args, **kwargs):
+        """Run fabric task, on at most parallel hosts at a time; return results of the hosts it succeeded on."""
+
+        with settings(pool_size=self.parallel or env.pool_size):
+            results = fabric_execute(catch_host_failure(task), *args, **kwargs)
+        failures = OrderedDict((h, r.error) for h, r in results.items() if isinstance(r, HostFailure))
+        if failures:
+            logger.debug("%s failed on %s" % (getattr(task, '__name__', task), ", ".join(failures)))
+            self.record_failures(failures)
+        return OrderedDict((h, r) for h, r in results.items() if h not in failures)
+
+    def get_batches(self, hosts):
+        """Return hosts split into batches of a rolling run."""
+
+        if not self.batch_size:
+            return [hosts]
+        return [hosts[i:i + self.batch_size] for i in range(0, len(hosts), self.batch_size)]
+
+    def run(self, comp, func, *args, **kwargs):
+        """Run component function on the hosts of its role one batch at a time."""
+
+        batches = self.get_batches(list(env.roledefs.get(comp, [])))
+        if len(batches) <= 1:
+            return func(*args, **kwargs)
+        hosts = sum(len(b) for b in batches)
+        with tqdm(total=hosts, unit='host', leave=False) as bar:
+            for i, batch in enumerate(batches):
+                set_bar_desc(bar, "{} batch {}/{}".format(comp, i + 1, len(batches)))
+                roledefs = dict(env.roledefs)
+                roledefs[comp] = batch
+                try:
+                    with settings(roledefs=roledefs):
+                        func(*args, **kwargs)
+                except HostsFailed:
+                    raise
+                except (Exception, SystemExit) as e:
+                    # threshold may have been crossed in a forked worker
+                    self.check_failures()
+                    # failure that wasn't tied to a host; blame the batch's remaining hosts
+                    logger.debug("batch %d of %s failed:\n%s" % (i + 1, comp, traceback.format_exc()))
+                    failed = self.get_failed()
+                    self.record_failures(OrderedDict((h, get_error_summary(e)) for h in batch
+                                                     if h not in failed))
+                bar.update(len(batch))
+                bar.set_postfix(failed=len(self.get_failed()))
+        print("")
+
+    def print_summary(self):
+        """Print hosts that failed."""
+
+        failed = self.get_failed()
+        if failed:
+            print("{} host(s) failed and were skipped:".format(len(failed)))
+            for host, error in failed.items():
+                print("  {}: {}".format(host, error))
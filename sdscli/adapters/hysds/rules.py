@@ -13,16 +13,16 @@ from datetime import datetime
 
 from sdscli.log_utils import logger
 from sdscli.os_utils import validate_dir, normpath
-from hysds.es_util import get_mozart_es
+from .context import get_cluster_context
+from .bulk import BulkRequest
 
 USER_RULES_MOZART = 'user_rules-mozart'
 USER_RULES_GRQ = 'user_rules-grq'
 
-mozart_es = get_mozart_es()
-
 
 def export(args):
     """Export HySDS user rules."""
+    mozart_es = get_cluster_context().mozart_es
     rules = {}
 
     mozart_rules = mozart_es.query(index=USER_RULES_MOZART)
@@ -53,6 +53,7 @@ def import_rules(args):
         "grq": [...],
     }
     """
+    mozart_es = get_cluster_context().mozart_es
 
     rules_file = normpath(args.file)  # user rules JSON file
     logger.debug("rules_file: {}".format(rules_file))
@@ -65,24 +66,15 @@ def import_rules(args):
         user_rules = json.load(f)  # read in user rules
     logger.debug("rules: {}".format(json.dumps(rules_file, indent=2, sort_keys=True)))
 
-    for rule in user_rules['mozart']:
-        now = datetime.utcnow().isoformat() + 'Z'
-
-        if not rule.get('creation_time', None):
-            rule['creation_time'] = now
-        if not rule.get('modified_time', None):
-            rule['modified_time'] = now
-
-        result = mozart_es.index_document(index=USER_RULES_MOZART, body=rule)  # indexing mozart rules
-        logger.debug(result)
-
-    for rule in user_rules['grq']:
-        now = datetime.utcnow().isoformat() + 'Z'
+    with BulkRequest(mozart_es, getattr(args, 'batch_size', None)) as bulk:
+        for component, index in (('mozart', USER_RULES_MOZART), ('grq', USER_RULES_GRQ)):
+            for rule in user_rules[component]:
+                now = datetime.utcnow().isoformat() + 'Z'
 
-        if not rule.get('creation_time', None):
-            rule['creation_time'] = now
-        if not rule.get('modified_time', None):
-            rule['modified_time'] = now
+                if not rule.get('creation_time', None):
+                    rule['creation_time'] = now
+                if not rule.get('modified_time', None):
+                    rule['modified_time'] = now
 
-        result = mozart_es.index_document(index=USER_RULES_GRQ, body=rule)  # indexing GRQ rules
-        logger.debug(result)
+                bulk.index(index, rule)  # indexing user rules
+    logger.debug("indexed %d user rule(s)" % bulk.done)
@@ -0,0 +1,95 @@
+"""
+Warm sds daemon for HySDS.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+
+from future import standard_library
+standard_library.install_aliases()
+import time
+
+from sdscli.log_utils import logger
+from sdscli.func_utils import get_module
+from sdscli.serve_utils import (get_socket_path, get_serve_log_path, ping, request,
+                                daemonize, serve_forever)
+from sdscli.prompt_utils import highlight
+
+from .context import get_cluster_context, reset_cluster_context
+from .fabfile import connections, has_live_connection
+
+
+# adapter modules whose commands are forwarded to the daemon
+WARM_MODULES = ('status', 'pkg', 'rules')
+
+
+def warm_up():
+    """Parse config and import adapter modules ahead of the first request."""
+
+    logger.debug("roledefs: %s" % get_cluster_context().roledefs)
+    for mod_name in WARM_MODULES:
+        get_module('sdscli.adapters.hysds.{}'.format(mod_name))
+
+
+def refresh():
+    """Reload cluster context if the SDS config changed and prune dead connections."""
+
+    ctx = get_cluster_context()
+    if ctx.is_stale():
+        logger.info("SDS config changed, reloading cluster context")
+        ctx.close_connections()
+        reset_cluster_context()
+        warm_up()
+    for host_string in list(connections.keys()):
+        has_live_connection(host_string)
+
+
+def run_command(argv):
+    """Run sds command line in the daemon."""
+
+    from sdscli.command_line import main
+    return main(argv, forward=False)
+
+
+def start(args):
+    """Start sds daemon."""
+
+    socket_path = get_socket_path()
+    if ping(socket_path) is not None:
+        print("sds daemon already listening on {}".format(socket_path))
+        return 0
+    warm_up()
+    if not args.foreground and not daemonize(get_serve_log_path()):
+        for i in range(50):
+            if ping(socket_path) is not None:
+                print("sds daemon: {} ({})".format(highlight("RUNNING"), socket_path))
+                return 0
+            time.sleep(.1)
+        logger.error("sds daemon failed to start. See %s." % get_serve_log_path())
+        return 1
+    serve_forever(run_command, refresh, socket_path)
+    return 0
+
+
+def stop(args):
+    """Stop sds daemon."""
+
+    reply = request({'cmd': 'stop'})
+    if reply is None:
+        print("sds daemon: {}".format(highlight("NOT RUNNING", 'red')))
+    else:
+        print("sds daemon {}: {}".format(reply['pid'], highlight("STOPPED")))
+    return 0
+
+
+def status(args):
+    """Status of sds daemon."""
+
+    pid = ping()
+    if pid is None:
+        print("sds daemon: {}".format(highlight("NOT RUNNING", 'red')))
+        return 1
+    print("sds daemon {}: {} ({})".format(pid, highlight("RUNNING"), get_socket_path()))
+    return 0
@@ -8,16 +8,13 @@ from __future__ import absolute_import
 
 
 from . import fabfile as fab
-from sdscli.prompt_utils import YesNoValidator, set_bar_desc
+from .fabfile import execute
+from sdscli.prompt_utils import prompt_yes_no, set_bar_desc
 from sdscli.os_utils import validate_dir
 from sdscli.conf_utils import get_user_files_path, SettingsConf
 from sdscli.log_utils import logger
-from pygments.token import Token
-from prompt_toolkit.validation import Validator, ValidationError
-from prompt_toolkit.styles import style_from_dict
-from prompt_toolkit.shortcuts import prompt, print_tokens
 from tqdm import tqdm
-from fabric.api import execute, hide
+from fabric.api import hide
 import traceback
 import hashlib
 import pwd
@@ -27,13 +24,6 @@ from future import standard_library
 standard_library.install_aliases()
 
 
-prompt_style = style_from_dict({
-    Token.Alert: 'bg:#D8060C',
-    Token.Username: '#D8060C',
-    Token.Param: '#3CFF33',
-})
-
-
 def start_mozart(conf, comp='mozart'):
     """"Start mozart component."""
 
@@ -106,6 +96,24 @@ def start_factotum(conf, comp='factotum'):
         set_bar_desc(bar, 'Started factotum')
 
 
+def start_verdi(conf, comp='verdi'):
+    """"Start verdi component on all verdi hosts."""
+
+    # progress bar
+    with tqdm(total=2) as bar:
+
+        # ensure venv
+        set_bar_desc(bar, 'Ensuring HySDS venv')
+        execute(fab.ensure_venv, 'verdi', roles=[comp])
+        bar.update()
+
+        # start services
+        set_bar_desc(bar, 'Starting verdid')
+        execute(fab.verdid_start, roles=[comp])
+        bar.update()
+        set_bar_desc(bar, 'Started verdi')
+
+
 def start_comp(comp, conf):
     """Start component."""
 
@@ -137,16 +145,17 @@ def start_comp(comp, conf):
             start_metrics(conf)
         if comp == 'factotum':
             start_factotum(conf)
+        if comp == 'verdi':
+            fab.run_rolling(comp, start_verdi, conf)
 
 
-def start(comp, debug=False, force=False):
+def start(comp, debug=False, force=False, parallel=None, batch_size=None, rolling=False,
+          max_failures=0):
     """Start components."""
 
     # prompt user
     if not force:
-        cont = prompt(get_prompt_tokens=lambda x: [(Token.Alert,
-                                                    "Starting component[s]: {}. Continue [y/n]: ".format(comp)), (Token, " ")],
-                      validator=YesNoValidator(), style=prompt_style) == 'y'
+        cont = prompt_yes_no("Starting component[s]: {}. Continue [y/n]: ".format(comp))
         if not cont:
             return 0
 
@@ -155,8 +164,9 @@ def start(comp, debug=False, force=False):
 
     logger.debug("Starting %s" % comp)
 
-    if debug:
-        start_comp(comp, conf)
-    else:
-        with hide('everything'):
+    with fab.rollout(parallel, batch_size, rolling, max_failures):
+        if debug:
             start_comp(comp, conf)
+        else:
+            with hide('everything'):
+                start_comp(comp, conf)
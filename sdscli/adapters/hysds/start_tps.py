@@ -14,27 +14,16 @@ import yaml
 import pwd
 import hashlib
 import traceback
-from fabric.api import execute, hide
+from fabric.api import hide
 from tqdm import tqdm
 
-from prompt_toolkit.shortcuts import prompt, print_tokens
-from prompt_toolkit.styles import style_from_dict
-from prompt_toolkit.validation import Validator, ValidationError
-from pygments.token import Token
-
 from sdscli.log_utils import logger
 from sdscli.conf_utils import get_user_files_path, SettingsConf
 from sdscli.os_utils import validate_dir
-from sdscli.prompt_utils import YesNoValidator, set_bar_desc
+from sdscli.prompt_utils import prompt_yes_no, set_bar_desc
 
 from . import fabfile as fab
-
-
-prompt_style = style_from_dict({
-    Token.Alert: 'bg:#D8060C',
-    Token.Username: '#D8060C',
-    Token.Param: '#3CFF33',
-})
+from .fabfile import execute
 
 
 def start_mozart(conf, comp='mozart'):
@@ -145,9 +134,7 @@ def start(comp, debug=False, force=False):
 
     # prompt user
     if not force:
-        cont = prompt(get_prompt_tokens=lambda x: [(Token.Alert,
-                                                    "Starting TPS on component[s]: {}. Continue [y/n]: ".format(comp)), (Token, " ")],
-                      validator=YesNoValidator(), style=prompt_style) == 'y'
+        cont = prompt_yes_no("Starting TPS on component[s]: {}. Continue [y/n]: ".format(comp))
         if not cont:
             return 0
 
@@ -9,42 +9,26 @@ from __future__ import absolute_import
 
 from future import standard_library
 standard_library.install_aliases()
-import os
-import yaml
-import pwd
-import hashlib
-import traceback
-import requests
 import re
-from fabric.api import execute, hide
-from tqdm import tqdm
-
-from prompt_toolkit.shortcuts import prompt, print_tokens
-from prompt_toolkit.styles import style_from_dict
-from prompt_toolkit.validation import Validator, ValidationError
-from pygments.token import Token
-
-import kombu
-import redis
-import elasticsearch
+from fabric.api import hide
 
 from sdscli.log_utils import logger
-from sdscli.conf_utils import get_user_files_path, SettingsConf
-from sdscli.os_utils import validate_dir
+from sdscli.func_utils import lazy_import, lazy_func
 from sdscli.prompt_utils import (highlight, blink, print_component_header,
                                  print_tps_header, print_supervisor_header)
 
 from . import fabfile as fab
+from .fabfile import execute
+from .context import get_cluster_context
 
-from hysds.es_util import get_mozart_es, get_metrics_es, get_grq_es
-from hysds.es_util import get_mozart_es_engine, get_metrics_es_engine, get_grq_es_engine
-
+# clients only needed by some status checks are imported on first use
+requests = lazy_import('requests')
+kombu = lazy_import('kombu')
+redis = lazy_import('redis')
 
-prompt_style = style_from_dict({
-    Token.Alert: 'bg:#D8060C',
-    Token.Username: '#D8060C',
-    Token.Param: '#3CFF33',
-})
+get_mozart_es_engine = lazy_func('hysds.es_util', 'get_mozart_es_engine')
+get_metrics_es_engine = lazy_func('hysds.es_util', 'get_metrics_es_engine')
+get_grq_es_engine = lazy_func('hysds.es_util', 'get_grq_es_engine')
 
 
 def print_rabbitmq_status(user, password, host):
@@ -80,13 +64,13 @@ def print_es_status(host, component):
     """Print status of ES server."""
     if component == "mozart":
         service = get_mozart_es_engine()
-        es = get_mozart_es()
+        es = get_cluster_context().get_es('mozart')
     elif component == "metrics":
         service = get_metrics_es_engine()
-        es = get_metrics_es()
+        es = get_cluster_context().get_es('metrics')
     elif component == "grq":
         service = get_grq_es_engine()
-        es = get_grq_es()
+        es = get_cluster_context().get_es('grq')
     else:
         service = "Unknown Search Engine"
         es = None
@@ -182,7 +166,8 @@ def print_status(conf, comp, debug=False):
     """"Status of component."""
 
     print_component_header(comp)
-    if len(fab.env.roledefs[comp]) == 1 and "None" not in fab.env.roledefs[comp]:
+    hosts = get_cluster_context().roledefs[comp]
+    if hosts and "None" not in hosts:
         print_tps_status(conf, comp, debug)
         print_supervisor_header(comp)
         execute(fab.status, roles=[comp])
@@ -204,15 +189,16 @@ def status_comp(comp, conf, debug=False):
     if comp in ('all', 'ci'):
         print_status(conf, 'ci', debug)
     if comp in ('all', 'verdi'):
-        print_status(conf, 'verdi', debug)
+        fab.run_rolling('verdi', print_status, conf, 'verdi', debug)
 
 
-def status(comp, debug=False):
+def status(comp, debug=False, parallel=None, batch_size=None, rolling=False, max_failures=0):
     """Component status."""
 
     # get user's SDS conf settings
-    conf = SettingsConf()
+    conf = get_cluster_context().settings
 
     logger.debug("Status for %s component(s)" % comp)
 
-    status_comp(comp, conf, debug)
+    with fab.rollout(parallel, batch_size, rolling, max_failures):
+        status_comp(comp, conf, debug)
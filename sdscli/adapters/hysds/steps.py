@@ -0,0 +1,176 @@
+"""
+Dependency-aware execution of component update steps for HySDS.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+
+from future import standard_library
+standard_library.install_aliases()
+import pickle
+import traceback
+import multiprocessing
+from collections import OrderedDict
+
+from sdscli.log_utils import logger
+from sdscli.prompt_utils import set_bar_desc
+
+from . import fabfile as fab
+
+
+def call(task, *args, **kwargs):
+    """Return fabric task call to be run as part of a step."""
+
+    return (task, args, kwargs)
+
+
+class Step(object):
+    """Named group of fabric task calls that runs after its dependencies."""
+
+    def __init__(self, name, desc, calls, deps=()):
+        """Construct Step instance."""
+
+        self.name = name
+        self.desc = desc
+        self.calls = list(calls)
+        self.deps = tuple(deps)
+
+
+class StepGraph(object):
+    """Update steps of a component and the dependencies between them.
+
+    Steps must be added after the steps they depend on, so declaration order
+    is always a valid sequential order.
+    """
+
+    def __init__(self, comp):
+        """Construct StepGraph instance."""
+
+        self.comp = comp
+        self.steps = OrderedDict()
+        self.results = {}
+
+    def __len__(self):
+        return len(self.steps)
+
+    def add(self, name, desc, calls, deps=()):
+        """Add step and return its name; None entries in calls are skipped."""
+
+        if name in self.steps:
+            raise RuntimeError("Duplicate update step %s." % name)
+        for dep in deps:
+            if dep not in self.steps:
+                raise RuntimeError("Update step %s depends on unknown step %s." % (name, dep))
+        self.steps[name] = Step(name, desc, [c for c in calls if c is not None], deps)
+        return name
+
+    def run_step(self, name):
+        """Run fabric task calls of step on the component's hosts; return their results per host."""
+
+        with fab.batched_steps():
+            return [fab.execute(task, *args, roles=[self.comp], **kwargs)
+                    for task, args, kwargs in self.steps[name].calls]
+
+    def run(self, bar=None, max_parallelism=1):
+        """Run all steps, at most max_parallelism at a time, updating progress bar as they finish."""
+
+        if max_parallelism <= 1:
+            for name, step in self.steps.items():
+                if bar is not None:
+                    set_bar_desc(bar, step.desc)
+                self.results[name] = self.run_step(name)
+                if bar is not None:
+                    bar.update()
+        else:
+            self.run_parallel(bar, max_parallelism)
+
+    def run_parallel(self, bar, max_parallelism):
+        """Run steps in forked worker processes as their dependencies complete."""
+
+        # fork so workers inherit the graph and fabric state; fabric itself
+        # forks per host for multi-host roles so workers can't be daemonic
+        mp = multiprocessing.get_context('fork')
+        tasks = mp.Queue()
+        results = mp.Queue()
+        workers = [mp.Process(target=self._worker, args=(tasks, results))
+                   for i in range(min(max_parallelism, len(self.steps)))]
+        for w in workers:
+            w.start()
+        logger.debug("running %d %s update steps with %d workers" %
+                     (len(self.steps), self.comp, len(workers)))
+
+        waiting = OrderedDict((name, set(step.deps)) for name, step in self.steps.items())
+        running = set()
+        failed = []
+        try:
+            while waiting or running:
+                if not failed:
+                    ready = [n for n, deps in waiting.items() if not deps]
+                    for name in ready[:len(workers) - len(running)]:
+                        del waiting[name]
+                        running.add(name)
+                        if bar is not None:
+                            set_bar_desc(bar, self.steps[name].desc)
+                        tasks.put(name)
+                if not running:
+                    break
+                name, error, result = results.get()
+                running.remove(name)
+                if error is not None:
+                    failed.append((name, error))
+                    continue
+                self.results[name] = result
+                if bar is not None:
+                    bar.update()
+                for deps in waiting.values():
+                    deps.discard(name)
+        finally:
+            for w in workers:
+                tasks.put(None)
+            for w in workers:
+                w.join()
+
+        if failed:
+            for name, error in failed:
+                logger.error("Update step %s of %s failed:\n%s" % (name, self.comp, error))
+            raise RuntimeError("Failed to update %s: step(s) %s failed." %
+                               (self.comp, ", ".join(n for n, e in failed)))
+
+    def _worker(self, tasks, results):
+        """Run steps received from tasks queue until None arrives."""
+
+        # the parent's SSH transports can't be used from this process; each
+        # worker opens and reuses its own connection per host instead
+        fab.connections.clear()
+        for name in iter(tasks.get, None):
+            try:
+                result = self.run_step(name)
+            except BaseException:
+                # fabric's abort() raises SystemExit; report it instead of dying
+                results.put((name, traceback.format_exc(), None))
+                continue
+            try:
+                pickle.dumps(result)
+            except Exception:
+                result = None
+            results.put((name, None, result))
+
+
+class UpdateGraph(StepGraph):
+    """Component updates of 'sds update all' and the dependencies between them.
+
+    Each step calls an update function that drives its own component's hosts
+    and progress bar, so steps are run as plain function calls.
+    """
+
+    def __init__(self):
+        """Construct UpdateGraph instance."""
+
+        super(UpdateGraph, self).__init__('all')
+
+    def run_step(self, name):
+        """Run update function calls of step."""
+
+        return [func(*args, **kwargs) for func, args, kwargs in self.steps[name].calls]
@@ -14,27 +14,16 @@ import yaml
 import pwd
 import hashlib
 import traceback
-from fabric.api import execute, hide
+from fabric.api import hide
 from tqdm import tqdm
 
-from prompt_toolkit.shortcuts import prompt, print_tokens
-from prompt_toolkit.styles import style_from_dict
-from prompt_toolkit.validation import Validator, ValidationError
-from pygments.token import Token
-
 from sdscli.log_utils import logger
 from sdscli.conf_utils import get_user_files_path, SettingsConf
 from sdscli.os_utils import validate_dir
-from sdscli.prompt_utils import YesNoValidator, set_bar_desc
+from sdscli.prompt_utils import prompt_yes_no, set_bar_desc
 
 from . import fabfile as fab
-
-
-prompt_style = style_from_dict({
-    Token.Alert: 'bg:#D8060C',
-    Token.Username: '#D8060C',
-    Token.Param: '#3CFF33',
-})
+from .fabfile import execute
 
 
 def stop_mozart(conf, comp='mozart'):
@@ -110,6 +99,25 @@ def stop_factotum(conf, comp='factotum'):
         set_bar_desc(bar, 'Stopped factotum')
 
 
+def stop_verdi(conf, comp='verdi'):
+    """"Stop verdi component on all verdi hosts."""
+
+    # progress bar
+    with tqdm(total=2) as bar:
+
+        # ensure venv
+        set_bar_desc(bar, 'Ensuring HySDS venv')
+        execute(fab.ensure_venv, 'verdi', roles=[comp])
+        bar.update()
+
+        # stop services
+        set_bar_desc(bar, 'Stopping verdid')
+        execute(fab.verdid_stop, roles=[comp])
+        execute(fab.kill_hung, roles=[comp])
+        bar.update()
+        set_bar_desc(bar, 'Stopped verdi')
+
+
 def stop_comp(comp, conf):
     """Stop component."""
 
@@ -141,16 +149,17 @@ def stop_comp(comp, conf):
             stop_metrics(conf)
         if comp == 'factotum':
             stop_factotum(conf)
+        if comp == 'verdi':
+            fab.run_rolling(comp, stop_verdi, conf)
 
 
-def stop(comp, debug=False, force=False):
+def stop(comp, debug=False, force=False, parallel=None, batch_size=None, rolling=False,
+         max_failures=0):
     """Stop components."""
 
     # prompt user
     if not force:
-        cont = prompt(get_prompt_tokens=lambda x: [(Token.Alert,
-                                                    "Stopping component[s]: {}. Continue [y/n]: ".format(comp)), (Token, " ")],
-                      validator=YesNoValidator(), style=prompt_style) == 'y'
+        cont = prompt_yes_no("Stopping component[s]: {}. Continue [y/n]: ".format(comp))
         if not cont:
             return 0
 
@@ -159,8 +168,9 @@ def stop(comp, debug=False, force=False):
 
     logger.debug("Stopping %s" % comp)
 
-    if debug:
-        stop_comp(comp, conf)
-    else:
-        with hide('everything'):
+    with fab.rollout(parallel, batch_size, rolling, max_failures):
+        if debug:
             stop_comp(comp, conf)
+        else:
+            with hide('everything'):
+                stop_comp(comp, conf)
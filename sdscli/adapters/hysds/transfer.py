@@ -0,0 +1,143 @@
+"""
+Parallel transfers of s3:// objects for HySDS, with osaka for other schemes.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+
+from future import standard_library
+standard_library.install_aliases()
+import os
+import shutil
+import tempfile
+import threading
+from urllib.parse import urlparse
+
+from sdscli.log_utils import logger
+from sdscli.func_utils import lazy_func
+
+# osaka pulls in every storage backend; only non-s3 urls need it
+osaka_get = lazy_func('osaka.main', 'get')
+osaka_put = lazy_func('osaka.main', 'put')
+osaka_rmall = lazy_func('osaka.main', 'rmall')
+
+# bytes per ranged GET or multipart PUT part and parts in flight per transfer
+PART_SIZE = 64 * 1024 ** 2
+CONCURRENCY = 8
+
+# boto3 clients by endpoint url; they are thread-safe so transfers share them
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class StreamReader(object):
+    """Read-only view of a file object that is read in order, even if it claims to be seekable.
+
+    Members of tar streams do, but can't seek back to reread parts.
+    """
+
+    def __init__(self, f):
+        """Construct StreamReader instance."""
+
+        self.f = f
+
+    def read(self, size=-1):
+        return self.f.read(size)
+
+
+def parse_s3_url(url):
+    """Return (endpoint url, bucket, key) of s3:// url.
+
+    HySDS urls name the endpoint before the bucket, e.g.
+    s3://s3-us-west-2.amazonaws.com/bucket/key; a netloc without a dot or
+    port is taken as the bucket and the default endpoint is used.
+    """
+
+    parsed = urlparse(url)
+    path = parsed.path.lstrip('/')
+    if '.' not in parsed.netloc and ':' not in parsed.netloc:
+        return None, parsed.netloc, path
+    bucket, _, key = path.partition('/')
+    scheme = 'http' if parsed.port not in (None, 443) else 'https'
+    return "%s://%s" % (scheme, parsed.netloc), bucket, key
+
+
+def get_client(endpoint_url=None):
+    """Return shared boto3 S3 client for endpoint."""
+
+    with _clients_lock:
+        if endpoint_url not in _clients:
+            import boto3
+            _clients[endpoint_url] = boto3.client('s3', endpoint_url=endpoint_url)
+        return _clients[endpoint_url]
+
+
+def get_transfer_config(part_size=None, concurrency=None):
+    """Return boto3 transfer config splitting objects into parts of part_size, concurrency at a time."""
+
+    from boto3.s3.transfer import TransferConfig
+    part_size = part_size or PART_SIZE
+    return TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size,
+                          max_concurrency=concurrency or CONCURRENCY, use_threads=True)
+
+
+def is_s3(url):
+    return urlparse(url).scheme == 's3'
+
+
+def get(url, dest, part_size=None, concurrency=None, callback=None):
+    """Download url to dest, or into dest if it is a dir; s3 objects come in parallel ranged GETs.
+
+    callback, if given, is called with the number of bytes of each chunk received.
+    """
+
+    if not is_s3(url):
+        return osaka_get(url, dest)
+    endpoint_url, bucket, key = parse_s3_url(url)
+    if os.path.isdir(dest):
+        dest = os.path.join(dest, os.path.basename(key))
+    logger.debug("downloading s3://%s/%s from %s to %s" % (bucket, key, endpoint_url, dest))
+    get_client(endpoint_url).download_file(bucket, key, dest, Callback=callback,
+                                           Config=get_transfer_config(part_size, concurrency))
+
+
+def put(src, url, part_size=None, concurrency=None, callback=None):
+    """Upload file or binary file object src to url; s3 objects go up in parallel multipart PUTs.
+
+    File objects are read in order, so src can be a stream of unknown size.
+    """
+
+    if not is_s3(url):
+        if hasattr(src, 'read'):
+            # osaka only uploads files; spool the stream to one
+            with tempfile.NamedTemporaryFile(prefix='sds-put-') as f:
+                shutil.copyfileobj(src, f, PART_SIZE)
+                f.flush()
+                return osaka_put(f.name, url)
+        return osaka_put(src, url)
+    endpoint_url, bucket, key = parse_s3_url(url)
+    logger.debug("uploading %s to s3://%s/%s on %s" % (getattr(src, 'name', src), bucket, key, endpoint_url))
+    client = get_client(endpoint_url)
+    config = get_transfer_config(part_size, concurrency)
+    if hasattr(src, 'read'):
+        client.upload_fileobj(StreamReader(src), bucket, key, Callback=callback, Config=config)
+    else:
+        client.upload_file(src, bucket, key, Callback=callback, Config=config)
+
+
+def rmall(url):
+    """Remove url; for an s3 url, that is the object and everything under it as a prefix."""
+
+    if not is_s3(url):
+        return osaka_rmall(url)
+    endpoint_url, bucket, key = parse_s3_url(url)
+    client = get_client(endpoint_url)
+    logger.debug("removing s3://%s/%s from %s" % (bucket, key, endpoint_url))
+    prefix = key if key.endswith('/') else key + '/'
+    keys = [o['Key'] for page in client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=key)
+            for o in page.get('Contents', []) if o['Key'] == key or o['Key'].startswith(prefix)]
+    for i in range(0, len(keys), 1000):
+        client.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': k} for k in keys[i:i + 1000]],
+                                                     'Quiet': True})
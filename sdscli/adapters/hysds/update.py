@@ -9,820 +9,869 @@ from future import standard_library
 standard_library.install_aliases()
 
 import os
-from fabric.api import execute, hide
+import hashlib
+import multiprocessing
+from collections import OrderedDict
+from fabric.api import hide
 from tqdm import tqdm
 
-from prompt_toolkit.shortcuts import prompt, print_tokens
-from prompt_toolkit.styles import style_from_dict
-from pygments.token import Token
-
 from sdscli.log_utils import logger
 from sdscli.conf_utils import get_user_files_path, SettingsConf
-from sdscli.prompt_utils import YesNoValidator, set_bar_desc
+from sdscli.os_utils import format_bytes
+from sdscli.prompt_utils import prompt_yes_no, set_bar_desc, highlight
 
 from . import fabfile as fab
+from .fabfile import execute
+from .steps import StepGraph, UpdateGraph, call
+from .incremental import get_restart_services
+from .compression import DEFAULT_CODEC
+from .ledger import ShipLedger
 
 
-prompt_style = style_from_dict({
-    Token.Alert: 'bg:#D8060C',
-    Token.Username: '#D8060C',
-    Token.Param: '#3CFF33',
-})
-
-
-def update_mozart(conf, ndeps=False, config_only=False, comp='mozart'):
-    """"Update mozart component."""
-
-    num_updates = 31 if config_only else 45  # number of progress bar updates
-
-    with tqdm(total=num_updates) as bar:  # progress bar
-        # ensure venv
-        set_bar_desc(bar, 'Ensuring HySDS venv')
-        execute(fab.ensure_venv, comp, roles=[comp])
-        bar.update()
-
-        # stop services
-        set_bar_desc(bar, 'Stopping mozartd')
-        execute(fab.mozartd_stop, roles=[comp])
-        bar.update()
-
-        # update reqs
-        if not config_only:
-            set_bar_desc(bar, 'Updating HySDS core')
-            execute(fab.pip_install_with_req, 'mozart', '~/mozart/ops/osaka', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'mozart', '~/mozart/ops/prov_es', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'mozart', '~/mozart/ops/hysds_commons', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'mozart', '~/mozart/ops/hysds', ndeps, roles=[comp])
+# HySDS core packages installed in each kind of venv
+CORE_PKGS = ('osaka', 'prov_es', 'hysds_commons', 'hysds', 'sciflo', 'chimera')
+MOZART_PKGS = CORE_PKGS + ('mozart',)
+GRQ_PKGS = CORE_PKGS + ('grq2', 'pele')
+
+
+def pip_install_core(g, node_type, pkgs, ndeps, deps, wheelhouse=None, name='pip_install',
+                     venv_artifacts=False):
+    """Add steps installing HySDS core packages; return name of last step.
+
+    Without a wheelhouse each package is installed in turn from its repo;
+    with one they are installed together from the wheelhouse. With venv
+    artifacts nodes whose venv is the current artifact skip them.
+    """
+
+    if wheelhouse is None:
+        last = deps
+        for pkg in pkgs:
+            last = g.add('{}_{}'.format(name, pkg), 'Updating HySDS core', [
+                call(fab.pip_install_with_req, node_type,
+                     '~/{}/ops/{}'.format(node_type, pkg), ndeps, skip_artifact=venv_artifacts),
+            ], deps=[last])
+        return last
+
+    if 'wheelhouse' not in g.steps:
+        g.add('wheelhouse', 'Distributing wheelhouse', [
+            call(fab.distribute_wheelhouse, wheelhouse),
+        ])
+    return g.add(name, 'Updating HySDS core', [
+        call(fab.pip_install_from_wheelhouse, node_type, wheelhouse,
+             ['~/{}/ops/{}'.format(node_type, pkg) for pkg in pkgs], ndeps, skip_artifact=venv_artifacts),
+    ], deps=[deps, 'wheelhouse'])
+
+
+def build_wheelhouse():
+    """Build wheelhouse of HySDS core dependencies on mozart; return its key."""
+
+    key = fab.get_wheelhouse_key(MOZART_PKGS + GRQ_PKGS)
+    with tqdm(total=1) as bar:
+        set_bar_desc(bar, 'Building wheelhouse')
+        execute(fab.build_wheelhouse, key, [MOZART_PKGS, GRQ_PKGS], roles=['mozart'])
+        bar.update()
+        set_bar_desc(bar, 'Built wheelhouse')
+    return key
+
+
+def add_venv(g, hysds_dir, venv_artifacts=False, incremental=False):
+    """Add step ensuring venv on verdi nodes ahead of stopping services; return its name.
+
+    With venv artifacts it only fetches mozart's artifact and unpacks it
+    aside, since services still run from the live venv.
+    """
+
+    if not venv_artifacts:
+        return g.add('venv', 'Ensuring HySDS venv', [call(fab.ensure_venv, hysds_dir)])
+    return g.add('venv', 'Fetching HySDS venv', [call(fab.fetch_venv_artifact, hysds_dir, incremental)])
+
+
+def add_venv_swap(g, hysds_dir, stop, venv_artifacts=False):
+    """Add step swapping fetched venv artifact in once services are stopped; return name of step to follow."""
+
+    if not venv_artifacts:
+        return stop
+    return g.add('venv_swap', 'Installing HySDS venv', [call(fab.install_venv_artifact, hysds_dir)], deps=[stop])
+
+
+def rm_conf(path, incremental=False):
+    """Return call removing config file ahead of sending it, or None for incremental updates.
+
+    Incremental updates keep the deployed file so the rendered one can be
+    compared against it.
+    """
+
+    return None if incremental else call(fab.rm_rf, path)
+
+
+def get_config_files(base_dir, suffix=''):
+    """Return paths of config files every update sends under base dir and the home dir."""
+
+    return ['~/{}/{}'.format(base_dir, f) for f in (
+        'ops/hysds/celeryconfig.py', 'etc/supervisord.conf', 'etc/datasets.json',
+        'etc/sdswatch_client.conf', 'bin/run_sdswatch_client.sh', 'bin/run_docker_registry.sh',
+        'bin/watch_supervisord_services.py', 'bin/watch_systemd_services.py')
+    ] + [f.format(suffix) for f in (
+        '.aws{}/config', '.aws{}/credentials', '.boto{}', '.s3cfg{}', '.netrc{}')]
+
+
+# config files whose hashes are fetched in one query per host ahead of an
+# incremental update; files not listed here are looked up one at a time
+CONFIG_FILES = {
+    'mozart': get_config_files('mozart') + get_config_files('verdi', '.verdi') + [
+        '~/mozart/etc/indexer.conf', '~/mozart/ops/mozart/settings.cfg',
+        '~/mozart/ops/hysds_ui/src/config/index.js', '~/mozart/etc/tosca.js',
+        '~/mozart/etc/orchestrator_jobs.json', '~/mozart/etc/orchestrator_datasets.json',
+        '~/mozart/ops/mozart/actions_config.json',
+        '~/mozart/etc/figaro.js', '~/logstash/config/jvm.options',
+        '~/verdi/ops/spyddder-man/settings.json',
+        '~/verdi/ops/hysds-dockerfiles/verdi/run_verdi_podman.sh',
+    ],
+    'metrics': get_config_files('metrics') + [
+        '~/metrics/etc/indexer.conf', '~/logstash/config/jvm.options',
+        '~/kibana/config/kibana.yml',
+    ],
+    'grq': get_config_files('sciflo') + [
+        '~/sciflo/ops/grq2/settings.cfg', '~/sciflo/ops/pele/settings.cfg',
+    ],
+    'factotum': get_config_files('verdi') + [
+        '~/verdi/ops/spyddder-man/settings.json',
+    ],
+    'verdi': get_config_files('verdi') + [
+        '~/verdi/ops/spyddder-man/settings.json',
+        '~/verdi/ops/hysds-dockerfiles/verdi/run_verdi_podman.sh',
+    ],
+}
+
+
+def print_changes(comp, changed):
+    """Print files an incremental update changed and the services to restart for them."""
+
+    if not changed:
+        print("{}: no config changes, no restart needed".format(comp))
+        return
+    by_host = {}
+    for host, path in changed:
+        by_host.setdefault(host, []).append(path)
+    for host, paths in sorted(by_host.items()):
+        print("{} ({}): updated {}".format(comp, host, ", ".join(paths)))
+        services = get_restart_services(comp, paths)
+        if services:
+            print("{} ({}): restart needed: {}".format(comp, host, highlight(", ".join(services), 'yellow')))
+
+
+def print_transfers(g):
+    """Print bytes code sync steps of the update actually transferred."""
+
+    for name, step in g.steps.items():
+        for (task, args, kwargs), result in zip(step.calls, g.results.get(name) or []):
+            if task is not fab.rsync_code:
+                continue
+            for host, stats in sorted((result or {}).items()):
+                source = " via {}".format(stats['relay']) if 'relay' in stats else ""
+                print("{} ({}): synced code{}, sent {} for {} of files".format(
+                    g.comp, host, source, format_bytes(stats.get('total_bytes_sent', 0)),
+                    format_bytes(stats.get('total_file_size', 0))))
+
+
+def run_update(g, max_parallelism=1, position=None, config_files=None):
+    """Run update steps of component with its own progress bar.
+
+    When a bar position is given the bar is one of several shown at once,
+    so it is labeled with the component. When config files are given the
+    update is incremental: their deployed hashes are fetched up front and
+    only templates that render differently are uploaded.
+    """
+
+    postfix = None if position is None else g.comp
+    if config_files is None:
+        with tqdm(total=len(g), position=position, postfix=postfix) as bar:
+            g.run(bar, max_parallelism)
+            set_bar_desc(bar, 'Updated {}'.format(g.comp))
+        print_transfers(g)
+        return
+
+    with fab.incremental_update():
+        with tqdm(total=len(g) + 1, position=position, postfix=postfix) as bar:
+            set_bar_desc(bar, 'Checking configs')
+            fab.prefetch_hashes(config_files, roles=[g.comp])
             bar.update()
-            execute(fab.pip_install_with_req, 'mozart', '~/mozart/ops/sciflo', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'mozart', '~/mozart/ops/chimera', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'mozart', '~/mozart/ops/mozart', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.npm_install_package_json, '~/mozart/ops/hysds_ui', roles=[comp])
-            bar.update()
-
-        # update celery config
-        set_bar_desc(bar, 'Updating celery config')
-        execute(fab.rm_rf, '~/mozart/ops/hysds/celeryconfig.py', roles=[comp])
-        execute(fab.rm_rf, '~/mozart/ops/hysds/celeryconfig.pyc', roles=[comp])
-        execute(fab.send_celeryconf, 'mozart', roles=[comp])
-        bar.update()
-
-        # set default ES shard number
-        set_bar_desc(bar, 'Setting default ES shard number')
-        execute(fab.install_base_es_template, roles=[comp])
-        bar.update()
-
-        # set the ES ILM policy
-        set_bar_desc(bar, 'Setting ES Index Lifecycle Manager policy')
-        execute(fab.install_es_policy, roles=[comp])
-        bar.update()
-
-        # install the templates in order to attach the ILM policy onto them
-        set_bar_desc(bar, 'Installing ES templates')
-        execute(fab.install_mozart_es_templates, roles=[comp])
-        bar.update()
-
-        # update logstash jvm.options to increase heap size
-        set_bar_desc(bar, 'Updating logstash jvm.options')
-        execute(fab.send_logstash_jvm_options, 'mozart', roles=[comp])
-        bar.update()
-
-        # update supervisor config
-        set_bar_desc(bar, 'Updating supervisor config')
-        execute(fab.rm_rf, '~/mozart/etc/supervisord.conf', roles=[comp])
-        execute(fab.send_template_user_override, 'supervisord.conf.mozart',
-                '~/mozart/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor',
-                roles=[comp])
-        bar.update()
+            g.run(bar, max_parallelism)
+            set_bar_desc(bar, 'Updated {}'.format(g.comp))
+        changed = fab.get_changed_files()
+    print_transfers(g)
+    print_changes(g.comp, changed)
 
-        # update orchestrator config
-        set_bar_desc(bar, 'Updating orchestrator config')
-        execute(fab.rm_rf, '~/mozart/etc/orchestrator_*.json', roles=[comp])
-        execute(fab.copy, '~/mozart/ops/hysds/configs/orchestrator/orchestrator_jobs.json',
-                '~/mozart/etc/orchestrator_jobs.json', roles=[comp])
-        execute(fab.copy, '~/mozart/ops/hysds/configs/orchestrator/orchestrator_datasets.json',
-                '~/mozart/etc/orchestrator_datasets.json', roles=[comp])
-        bar.update()
-
-        # update job_creators
-        set_bar_desc(bar, 'Updating job_creators')
-        execute(fab.rm_rf, '~/mozart/etc/job_creators', roles=[comp])
-        execute(fab.cp_rp, '~/mozart/ops/hysds/scripts/job_creators',
-                '~/mozart/etc/', roles=[comp])
-        bar.update()
-
-        # update datasets config; overwrite datasets config with domain-specific config
-        set_bar_desc(bar, 'Updating datasets config')
-        execute(fab.rm_rf, '~/mozart/etc/datasets.json', roles=[comp])
-        execute(fab.send_template, 'datasets.json',
-                '~/mozart/etc/datasets.json', roles=[comp])
-        bar.update()
-
-        # ship logstash shipper configs
-        set_bar_desc(bar, 'Updating logstash shipper config')
-        execute(fab.send_shipper_conf, 'mozart', '~/mozart/log', conf.get('MOZART_ES_CLUSTER'),
-                '127.0.0.1', conf.get('METRICS_ES_CLUSTER'),
-                conf.get('METRICS_REDIS_PVT_IP'), roles=[comp])
-        bar.update()
-
-        # update HySDS scripts
-        set_bar_desc(bar, 'Updating HySDS scripts')
-        execute(fab.send_hysds_scripts, 'mozart', roles=[comp])
-        bar.update()
-
-        # update mozart config
-        set_bar_desc(bar, 'Updating mozart config')
-        execute(fab.rm_rf, '~/mozart/ops/mozart/settings.cfg', roles=[comp])
-        execute(fab.send_mozartconf, roles=[comp])
-        execute(fab.rm_rf, '~/mozart/ops/mozart/actions_config.json',
-                roles=[comp])
-        execute(fab.copy, '~/mozart/ops/mozart/configs/actions_config.json.example',
-                '~/mozart/ops/mozart/actions_config.json', roles=[comp])
-        bar.update()
-
-        # update hysds_ui config
-        set_bar_desc(bar, 'Updating hysds_ui config')
-        execute(fab.rm_rf, '~/mozart/ops/hysds_ui/src/config/index.js', roles=[comp])
-        execute(fab.send_hysds_ui_conf, roles=[comp])
-        bar.update()
-
-        # building HySDS UI
-        set_bar_desc(bar, 'Building HySDS UI')
-        execute(fab.build_hysds_ui, roles=[comp])
-        bar.update()
-
-        # create user_rules index
-        set_bar_desc(bar, 'Creating user_rules index')
-        execute(fab.create_user_rules_index, roles=[comp])
-        bar.update()
-
-        # create hysds_ios-mozart index
-        set_bar_desc(bar, 'Creating hysds_ios-grq index')
-        execute(fab.create_hysds_ios_index, roles=[comp])
-        bar.update()
-
-        # ensure self-signed SSL certs exist
-        set_bar_desc(bar, 'Configuring SSL')
-        execute(fab.ensure_ssl, 'mozart', roles=[comp])
-        bar.update()
-
-        # link ssl certs to apps
-        execute(fab.ln_sf, '~/ssl/server.key', '~/mozart/ops/mozart/server.key', roles=[comp])
-        execute(fab.ln_sf, '~/ssl/server.pem', '~/mozart/ops/mozart/server.pem', roles=[comp])
-        bar.update()
-
-        # expose hysds log dir via webdav
-        set_bar_desc(bar, 'Expose logs')
-        execute(fab.mkdir, '/data/work', None, None, roles=[comp])
-        execute(fab.ln_sf, '~/mozart/log', '/data/work/log', roles=[comp])
-        bar.update()
-
-        # ship netrc
-        set_bar_desc(bar, 'Configuring netrc')
-        execute(fab.send_template, 'netrc.mozart',
-                '.netrc', node_type='mozart', roles=[comp])
-        execute(fab.chmod, 600, '.netrc', roles=[comp])
-        bar.update()
-
-        # update ES template
-        set_bar_desc(bar, 'Update ES template')
-        execute(fab.install_pkg_es_templates, roles=[comp])
-        bar.update()
-
-        # ship AWS creds
-        set_bar_desc(bar, 'Configuring AWS creds')
-        execute(fab.send_awscreds, roles=[comp])
-        bar.update()
-        set_bar_desc(bar, 'Updated mozart')
-
-        # update verdi for code/config bundle
-        set_bar_desc(bar, 'Ensuring HySDS venv')
-        execute(fab.rm_rf, '~/verdi', roles=[comp])
-        execute(fab.ensure_venv, 'verdi',
-                update_bash_profile=False, roles=[comp])
-        bar.update()
-
-        # remove code bundle stuff
-        set_bar_desc(bar, 'Remove code bundle')
-        execute(fab.rm_rf, '~/verdi/ops/etc', roles=[comp])
-        execute(fab.rm_rf, '~/verdi/ops/install.sh', roles=[comp])
-        bar.update()
-
-        # update
-        set_bar_desc(bar, 'Syncing packages')
-        execute(fab.rm_rf, '~/verdi/ops/*', roles=[comp])
-        execute(fab.rsync_code, 'verdi', roles=[comp])
-        execute(fab.set_spyddder_settings, roles=[comp])
-        bar.update()
-
-        # update reqs
-        if not config_only:
-            set_bar_desc(bar, 'Updating HySDS core')
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/osaka', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/prov_es', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/hysds_commons', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/hysds', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/sciflo', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/chimera', ndeps, roles=[comp])
-            bar.update()
-
-        # update celery config
-        set_bar_desc(bar, 'Updating celery config')
-        execute(fab.rm_rf, '~/verdi/ops/hysds/celeryconfig.py', roles=[comp])
-        execute(fab.rm_rf, '~/verdi/ops/hysds/celeryconfig.pyc', roles=[comp])
-        execute(fab.send_celeryconf, 'verdi-asg', roles=[comp])
-        bar.update()
-
-        # update supervisor config
-        set_bar_desc(bar, 'Updating supervisor config')
-        execute(fab.rm_rf, '~/verdi/etc/supervisord.conf', roles=[comp])
-        execute(fab.send_template_user_override, 'supervisord.conf.verdi',
-                '~/verdi/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor',
-                roles=[comp])
-        bar.update()
-
-        # update datasets config; overwrite datasets config with domain-specific config
-        set_bar_desc(bar, 'Updating datasets config')
-        execute(fab.rm_rf, '~/verdi/etc/datasets.json', roles=[comp])
-        execute(fab.send_template, 'datasets.json',
-                '~/verdi/etc/datasets.json', roles=[comp])
-        bar.update()
-
-        # ship logstash shipper configs
-        set_bar_desc(bar, 'Updating logstash shipper config')
-        execute(fab.send_shipper_conf, 'verdi-asg', '~/verdi/log', conf.get('MOZART_ES_CLUSTER'),
-                conf.get('MOZART_REDIS_PVT_IP'), conf.get('METRICS_ES_CLUSTER'),
-                conf.get('METRICS_REDIS_PVT_IP'), roles=[comp])
-        bar.update()
-
-        # update HySDS scripts
-        set_bar_desc(bar, 'Updating HySDS scripts')
-        execute(fab.send_hysds_scripts, 'verdi-asg', roles=[comp])
-        bar.update()
-
-        # ship netrc
-        netrc = os.path.join(get_user_files_path(), 'netrc')
-        if os.path.exists(netrc):
-            set_bar_desc(bar, 'Configuring netrc')
-            execute(fab.send_template, 'netrc', '.netrc.verdi', roles=[comp])
-            execute(fab.chmod, 600, '.netrc.verdi', roles=[comp])
-
-        # ship AWS creds
-        set_bar_desc(bar, 'Configuring AWS creds')
-        execute(fab.send_awscreds, suffix='.verdi', roles=[comp])
-        bar.update()
-        set_bar_desc(bar, 'Updated verdi code/config')
-
-        # ship the run_podman script
-        set_bar_desc(bar, 'Updating run_verdi_podman.sh.tmpl')
-        execute(fab.rm_rf, '~/verdi/ops/hysds-dockerfiles/verdi/run_verdi_podman.sh', roles=[comp])
-        execute(fab.send_template,
-                "run_verdi_podman.sh.tmpl",
-                "~/verdi/ops/hysds-dockerfiles/verdi/run_verdi_podman.sh",
-                "~/mozart/ops/hysds-dockerfiles/verdi",
-                roles=[comp]
-        )
-        bar.update()
 
+def update_mozart(conf, ndeps=False, config_only=False, comp='mozart', max_parallelism=1,
+                  position=None, incremental=False, wheelhouse=None,
+                  venv_artifacts=False):
+    """"Update mozart component."""
 
-def update_metrics(conf, ndeps=False, config_only=False, comp='metrics'):
+    g = StepGraph(comp)
+
+    # ensure venv
+    venv = g.add('venv', 'Ensuring HySDS venv', [call(fab.ensure_venv, comp)])
+
+    # stop services; incremental updates leave them running and report what to restart
+    stop = venv if incremental else g.add('stop', 'Stopping mozartd', [call(fab.mozartd_stop)], deps=[venv])
+
+    # update reqs
+    core = stop
+    ui_deps = []
+    if not config_only:
+        core = pip_install_core(g, 'mozart', MOZART_PKGS, ndeps, stop, wheelhouse)
+        ui_deps.append(g.add('npm_install', 'Updating HySDS core', [
+            call(fab.npm_install_package_json, '~/mozart/ops/hysds_ui'),
+        ], deps=[stop]))
+
+    # update celery config
+    celery = g.add('celery_conf', 'Updating celery config', [
+        rm_conf('~/mozart/ops/hysds/celeryconfig.py', incremental),
+        call(fab.rm_rf, '~/mozart/ops/hysds/celeryconfig.pyc'),
+        call(fab.send_celeryconf, 'mozart'),
+    ], deps=[stop])
+
+    # set default ES shard number
+    base_es = g.add('base_es_template', 'Setting default ES shard number', [
+        call(fab.install_base_es_template),
+    ], deps=[core, celery])
+
+    # set the ES ILM policy
+    es_policy = g.add('es_policy', 'Setting ES Index Lifecycle Manager policy', [
+        call(fab.install_es_policy),
+    ], deps=[core, celery])
+
+    # install the templates in order to attach the ILM policy onto them
+    es_templates = g.add('es_templates', 'Installing ES templates', [
+        call(fab.install_mozart_es_templates),
+    ], deps=[base_es, es_policy])
+
+    # update logstash jvm.options to increase heap size
+    g.add('logstash_jvm_options', 'Updating logstash jvm.options', [
+        call(fab.send_logstash_jvm_options, 'mozart'),
+    ], deps=[stop])
+
+    # update supervisor config
+    g.add('supervisor_conf', 'Updating supervisor config', [
+        rm_conf('~/mozart/etc/supervisord.conf', incremental),
+        call(fab.send_template_user_override, 'supervisord.conf.mozart',
+             '~/mozart/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor'),
+    ], deps=[stop])
+
+    # update orchestrator config
+    g.add('orchestrator_conf', 'Updating orchestrator config', [
+        rm_conf('~/mozart/etc/orchestrator_*.json', incremental),
+        call(fab.copy, '~/mozart/ops/hysds/configs/orchestrator/orchestrator_jobs.json',
+             '~/mozart/etc/orchestrator_jobs.json'),
+        call(fab.copy, '~/mozart/ops/hysds/configs/orchestrator/orchestrator_datasets.json',
+             '~/mozart/etc/orchestrator_datasets.json'),
+    ], deps=[stop])
+
+    # update job_creators
+    g.add('job_creators', 'Updating job_creators', [
+        call(fab.rm_rf, '~/mozart/etc/job_creators'),
+        call(fab.cp_rp, '~/mozart/ops/hysds/scripts/job_creators', '~/mozart/etc/'),
+    ], deps=[stop])
+
+    # update datasets config; overwrite datasets config with domain-specific config
+    g.add('datasets_conf', 'Updating datasets config', [
+        rm_conf('~/mozart/etc/datasets.json', incremental),
+        call(fab.send_template, 'datasets.json', '~/mozart/etc/datasets.json'),
+    ], deps=[stop])
+
+    # ship logstash shipper configs
+    g.add('shipper_conf', 'Updating logstash shipper config', [
+        call(fab.send_shipper_conf, 'mozart', '~/mozart/log', conf.get('MOZART_ES_CLUSTER'),
+             '127.0.0.1', conf.get('METRICS_ES_CLUSTER'), conf.get('METRICS_REDIS_PVT_IP')),
+    ], deps=[stop])
+
+    # update HySDS scripts
+    g.add('hysds_scripts', 'Updating HySDS scripts', [
+        call(fab.send_hysds_scripts, 'mozart'),
+    ], deps=[stop])
+
+    # update mozart config
+    mozart_conf = g.add('mozart_conf', 'Updating mozart config', [
+        rm_conf('~/mozart/ops/mozart/settings.cfg', incremental),
+        call(fab.send_mozartconf),
+        rm_conf('~/mozart/ops/mozart/actions_config.json', incremental),
+        call(fab.copy, '~/mozart/ops/mozart/configs/actions_config.json.example',
+             '~/mozart/ops/mozart/actions_config.json'),
+    ], deps=[core])
+
+    # update hysds_ui config
+    ui_deps.append(g.add('hysds_ui_conf', 'Updating hysds_ui config', [
+        rm_conf('~/mozart/ops/hysds_ui/src/config/index.js', incremental),
+        call(fab.send_hysds_ui_conf),
+    ], deps=[stop]))
+
+    # building HySDS UI
+    g.add('build_hysds_ui', 'Building HySDS UI', [call(fab.build_hysds_ui)], deps=ui_deps)
+
+    # create user_rules index
+    g.add('user_rules_index', 'Creating user_rules index', [
+        call(fab.create_user_rules_index),
+    ], deps=[mozart_conf])
+
+    # create hysds_ios-mozart index
+    g.add('hysds_ios_index', 'Creating hysds_ios-mozart index', [
+        call(fab.create_hysds_ios_index),
+    ], deps=[mozart_conf])
+
+    # ensure self-signed SSL certs exist
+    ssl = g.add('ssl', 'Configuring SSL', [call(fab.ensure_ssl, 'mozart')], deps=[venv])
+
+    # link ssl certs to apps
+    g.add('ssl_links', 'Configuring SSL', [
+        call(fab.ln_sf, '~/ssl/server.key', '~/mozart/ops/mozart/server.key'),
+        call(fab.ln_sf, '~/ssl/server.pem', '~/mozart/ops/mozart/server.pem'),
+    ], deps=[ssl])
+
+    # expose hysds log dir via webdav
+    g.add('expose_logs', 'Expose logs', [
+        call(fab.mkdir, '/data/work', None, None),
+        call(fab.ln_sf, '~/mozart/log', '/data/work/log'),
+    ], deps=[venv])
+
+    # ship netrc
+    g.add('netrc', 'Configuring netrc', [
+        call(fab.send_template, 'netrc.mozart', '.netrc', node_type='mozart'),
+        call(fab.chmod, 600, '.netrc'),
+    ], deps=[venv])
+
+    # update ES template
+    g.add('pkg_es_templates', 'Update ES template', [
+        call(fab.install_pkg_es_templates),
+    ], deps=[es_templates, mozart_conf])
+
+    # ship AWS creds
+    g.add('aws_creds', 'Configuring AWS creds', [call(fab.send_awscreds)], deps=[venv])
+
+    # update verdi for code/config bundle; with venv artifacts its venv is kept,
+    # since rebuilding it would upgrade pip and setuptools and version a new artifact
+    verdi_venv = g.add('verdi_venv', 'Ensuring HySDS venv', [
+        None if incremental or venv_artifacts else call(fab.rm_rf, '~/verdi'),
+        call(fab.ensure_venv, 'verdi', update_bash_profile=False),
+    ], deps=[venv])
+
+    # remove code bundle stuff
+    verdi_bundle = g.add('verdi_rm_bundle', 'Remove code bundle', [
+        call(fab.rm_rf, '~/verdi/ops/etc'),
+        call(fab.rm_rf, '~/verdi/ops/install.sh'),
+    ], deps=[verdi_venv])
+
+    # update
+    verdi_sync = g.add('verdi_sync', 'Syncing packages', [
+        call(fab.rsync_code, 'verdi'),
+        call(fab.set_spyddder_settings),
+    ], deps=[verdi_bundle])
+
+    # update reqs
+    if not config_only:
+        verdi_core = pip_install_core(g, 'verdi', CORE_PKGS, ndeps, verdi_sync, wheelhouse,
+                                      name='verdi_pip_install')
+
+        # package verdi venv for verdi and factotum nodes to unpack instead of building it
+        if venv_artifacts:
+            g.add('verdi_venv_artifact', 'Packaging verdi venv', [
+                call(fab.build_venv_artifact, 'verdi'),
+            ], deps=[verdi_core])
+
+    # update celery config
+    g.add('verdi_celery_conf', 'Updating celery config', [
+        rm_conf('~/verdi/ops/hysds/celeryconfig.py', incremental),
+        call(fab.rm_rf, '~/verdi/ops/hysds/celeryconfig.pyc'),
+        call(fab.send_celeryconf, 'verdi-asg'),
+    ], deps=[verdi_sync])
+
+    # update supervisor config
+    g.add('verdi_supervisor_conf', 'Updating supervisor config', [
+        rm_conf('~/verdi/etc/supervisord.conf', incremental),
+        call(fab.send_template_user_override, 'supervisord.conf.verdi',
+             '~/verdi/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor'),
+    ], deps=[verdi_venv])
+
+    # update datasets config; overwrite datasets config with domain-specific config
+    g.add('verdi_datasets_conf', 'Updating datasets config', [
+        rm_conf('~/verdi/etc/datasets.json', incremental),
+        call(fab.send_template, 'datasets.json', '~/verdi/etc/datasets.json'),
+    ], deps=[verdi_venv])
+
+    # ship logstash shipper configs
+    g.add('verdi_shipper_conf', 'Updating logstash shipper config', [
+        call(fab.send_shipper_conf, 'verdi-asg', '~/verdi/log', conf.get('MOZART_ES_CLUSTER'),
+             conf.get('MOZART_REDIS_PVT_IP'), conf.get('METRICS_ES_CLUSTER'),
+             conf.get('METRICS_REDIS_PVT_IP')),
+    ], deps=[verdi_venv])
+
+    # update HySDS scripts
+    g.add('verdi_hysds_scripts', 'Updating HySDS scripts', [
+        call(fab.send_hysds_scripts, 'verdi-asg'),
+    ], deps=[verdi_venv])
+
+    # ship netrc
+    netrc = os.path.join(get_user_files_path(), 'netrc')
+    if os.path.exists(netrc):
+        g.add('verdi_netrc', 'Configuring netrc', [
+            call(fab.send_template, 'netrc', '.netrc.verdi'),
+            call(fab.chmod, 600, '.netrc.verdi'),
+        ], deps=[venv])
+
+    # ship AWS creds
+    g.add('verdi_aws_creds', 'Configuring AWS creds', [
+        call(fab.send_awscreds, suffix='.verdi'),
+    ], deps=[venv])
+
+    # ship the run_podman script
+    g.add('verdi_run_podman', 'Updating run_verdi_podman.sh.tmpl', [
+        rm_conf('~/verdi/ops/hysds-dockerfiles/verdi/run_verdi_podman.sh', incremental),
+        call(fab.send_template, "run_verdi_podman.sh.tmpl",
+             "~/verdi/ops/hysds-dockerfiles/verdi/run_verdi_podman.sh",
+             "~/mozart/ops/hysds-dockerfiles/verdi"),
+    ], deps=[verdi_sync])
+
+    run_update(g, max_parallelism, position, CONFIG_FILES[comp] if incremental else None)
+
+
+def update_metrics(conf, ndeps=False, config_only=False, comp='metrics', max_parallelism=1,
+                   position=None, incremental=False, wheelhouse=None,
+                   venv_artifacts=False):
     """"Update metrics component."""
 
-    num_updates = 15 if config_only else 22  # number of progress bar updates
+    g = StepGraph(comp)
 
-    with tqdm(total=num_updates) as bar:  # progress bar
-        # ensure venv
-        set_bar_desc(bar, 'Ensuring HySDS venv')
-        execute(fab.ensure_venv, comp, roles=[comp])
-        bar.update()
+    # ensure venv
+    venv = g.add('venv', 'Ensuring HySDS venv', [call(fab.ensure_venv, comp)])
 
-        # stop services
-        set_bar_desc(bar, 'Stopping metricsd')
-        execute(fab.metricsd_stop, roles=[comp])
-        bar.update()
+    # stop services; incremental updates leave them running and report what to restart
+    stop = venv if incremental else g.add('stop', 'Stopping metricsd', [call(fab.metricsd_stop)], deps=[venv])
 
-        # update
-        if not config_only:
-            set_bar_desc(bar, 'Syncing packages')
-            execute(fab.rm_rf, '~/metrics/ops/*', roles=[comp])
-            execute(fab.rsync_code, 'metrics', roles=[comp])
-            bar.update()
-
-            # update reqs
-            set_bar_desc(bar, 'Updating HySDS core')
-            execute(fab.pip_install_with_req, 'metrics',
-                    '~/metrics/ops/osaka', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'metrics',
-                    '~/metrics/ops/prov_es', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'metrics',
-                    '~/metrics/ops/hysds_commons', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'metrics',
-                    '~/metrics/ops/hysds', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'metrics',
-                    '~/metrics/ops/sciflo', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'metrics',
-                    '~/metrics/ops/chimera', ndeps, roles=[comp])
-            bar.update()
-
-        # update logstash jvm.options to increase heap size
-        set_bar_desc(bar, 'Updating logstash jvm.options')
-        execute(fab.send_logstash_jvm_options, 'metrics', roles=[comp])
-        bar.update()
-
-        # update celery config
-        set_bar_desc(bar, 'Updating celery config')
-        execute(fab.rm_rf, '~/metrics/ops/hysds/celeryconfig.py', roles=[comp])
-        bar.update()
-        execute(fab.rm_rf, '~/metrics/ops/hysds/celeryconfig.pyc',
-                roles=[comp])
-        bar.update()
-        execute(fab.send_celeryconf, 'metrics', roles=[comp])
-        bar.update()
-
-        # update supervisor config
-        set_bar_desc(bar, 'Updating supervisor config')
-        execute(fab.rm_rf, '~/metrics/etc/supervisord.conf', roles=[comp])
-        bar.update()
-        execute(fab.send_template_user_override, 'supervisord.conf.metrics',
-                '~/metrics/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor',
-                roles=[comp])
-        bar.update()
-
-        # update datasets config; overwrite datasets config with domain-specific config
-        set_bar_desc(bar, 'Updating datasets config')
-        execute(fab.rm_rf, '~/metrics/etc/datasets.json', roles=[comp])
-        bar.update()
-        execute(fab.send_template, 'datasets.json',
-                '~/metrics/etc/datasets.json', roles=[comp])
-        bar.update()
-
-        # ship logstash shipper configs
-        set_bar_desc(bar, 'Updating logstash shipper config')
-        execute(fab.send_shipper_conf, 'metrics', '~/metrics/log', conf.get('MOZART_ES_CLUSTER'),
-                conf.get('MOZART_REDIS_PVT_IP'), conf.get('METRICS_ES_CLUSTER'),
-                '127.0.0.1', roles=[comp])
-        bar.update()
-
-        # update HySDS scripts
-        set_bar_desc(bar, 'Updating HySDS scripts')
-        execute(fab.send_hysds_scripts, 'metrics', roles=[comp])
-        bar.update()
+    # update
+    sync = stop
+    if not config_only:
+        sync = g.add('sync', 'Syncing packages', [
+            call(fab.rsync_code, 'metrics'),
+        ], deps=[stop])
 
-        # ship kibana config
-        set_bar_desc(bar, 'Updating kibana config')
-        if fab.metrics_es_engine != "opensearch":
-            execute(fab.send_template, 'kibana.yml',
-                    '~/kibana/config/kibana.yml', roles=[comp])
-        bar.update()
-
-        # expose hysds log dir via webdav
-        set_bar_desc(bar, 'Expose logs')
-        execute(fab.mkdir, '/data/work', None, None, roles=[comp])
-        execute(fab.ln_sf, '~/metrics/log', '/data/work/log', roles=[comp])
-        bar.update()
-
-        # ship AWS creds
-        set_bar_desc(bar, 'Configuring AWS creds')
-        execute(fab.send_awscreds, roles=[comp])
-        bar.update()
-        set_bar_desc(bar, 'Updated metrics')
-
-
-def update_grq(conf, ndeps=False, config_only=False, comp='grq'):
+        # update reqs
+        pip_install_core(g, 'metrics', CORE_PKGS, ndeps, sync, wheelhouse)
+
+    # update logstash jvm.options to increase heap size
+    g.add('logstash_jvm_options', 'Updating logstash jvm.options', [
+        call(fab.send_logstash_jvm_options, 'metrics'),
+    ], deps=[stop])
+
+    # update celery config
+    g.add('celery_conf', 'Updating celery config', [
+        rm_conf('~/metrics/ops/hysds/celeryconfig.py', incremental),
+        call(fab.rm_rf, '~/metrics/ops/hysds/celeryconfig.pyc'),
+        call(fab.send_celeryconf, 'metrics'),
+    ], deps=[sync])
+
+    # update supervisor config
+    g.add('supervisor_conf', 'Updating supervisor config', [
+        rm_conf('~/metrics/etc/supervisord.conf', incremental),
+        call(fab.send_template_user_override, 'supervisord.conf.metrics',
+             '~/metrics/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor'),
+    ], deps=[stop])
+
+    # update datasets config; overwrite datasets config with domain-specific config
+    g.add('datasets_conf', 'Updating datasets config', [
+        rm_conf('~/metrics/etc/datasets.json', incremental),
+        call(fab.send_template, 'datasets.json', '~/metrics/etc/datasets.json'),
+    ], deps=[stop])
+
+    # ship logstash shipper configs
+    g.add('shipper_conf', 'Updating logstash shipper config', [
+        call(fab.send_shipper_conf, 'metrics', '~/metrics/log', conf.get('MOZART_ES_CLUSTER'),
+             conf.get('MOZART_REDIS_PVT_IP'), conf.get('METRICS_ES_CLUSTER'), '127.0.0.1'),
+    ], deps=[stop])
+
+    # update HySDS scripts
+    g.add('hysds_scripts', 'Updating HySDS scripts', [
+        call(fab.send_hysds_scripts, 'metrics'),
+    ], deps=[stop])
+
+    # ship kibana config
+    if fab.get_es_engine('metrics') != "opensearch":
+        g.add('kibana_conf', 'Updating kibana config', [
+            call(fab.send_template, 'kibana.yml', '~/kibana/config/kibana.yml'),
+        ], deps=[stop])
+
+    # expose hysds log dir via webdav
+    g.add('expose_logs', 'Expose logs', [
+        call(fab.mkdir, '/data/work', None, None),
+        call(fab.ln_sf, '~/metrics/log', '/data/work/log'),
+    ], deps=[venv])
+
+    # ship AWS creds
+    g.add('aws_creds', 'Configuring AWS creds', [call(fab.send_awscreds)], deps=[venv])
+
+    run_update(g, max_parallelism, position, CONFIG_FILES[comp] if incremental else None)
+
+
+def update_grq(conf, ndeps=False, config_only=False, comp='grq', max_parallelism=1,
+               position=None, incremental=False, wheelhouse=None,
+               venv_artifacts=False):
     """"Update grq component."""
 
-    num_updates = 17 if config_only else 26  # number of progress bar updates
+    g = StepGraph(comp)
 
-    with tqdm(total=num_updates) as bar:  # progress bar
-        # ensure venv
-        set_bar_desc(bar, 'Ensuring HySDS venv')
-        execute(fab.ensure_venv, 'sciflo', roles=[comp])
-        bar.update()
+    # ensure venv
+    venv = g.add('venv', 'Ensuring HySDS venv', [call(fab.ensure_venv, 'sciflo')])
 
-        # stop services
-        set_bar_desc(bar, 'Stopping grqd')
-        execute(fab.grqd_stop, roles=[comp])
-        bar.update()
+    # stop services; incremental updates leave them running and report what to restart
+    stop = venv if incremental else g.add('stop', 'Stopping grqd', [call(fab.grqd_stop)], deps=[venv])
 
-        # update
-        if not config_only:
-            set_bar_desc(bar, 'Syncing packages')
-            execute(fab.rm_rf, '~/sciflo/ops/*', roles=[comp])
-            execute(fab.rsync_code, 'grq', 'sciflo', roles=[comp])
-            execute(fab.pip_upgrade, 'gunicorn', 'sciflo',
-                    roles=[comp])  # ensure latest gunicorn
-            bar.update()
+    # update
+    sync = core = stop
+    if not config_only:
+        sync = g.add('sync', 'Syncing packages', [
+            call(fab.rsync_code, 'grq', 'sciflo'),
+            call(fab.pip_upgrade, 'gunicorn', 'sciflo'),  # ensure latest gunicorn
+        ], deps=[stop])
 
-            # update reqs
-            set_bar_desc(bar, 'Updating HySDS core')
-            execute(fab.pip_install_with_req, 'sciflo',
-                    '~/sciflo/ops/osaka', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'sciflo',
-                    '~/sciflo/ops/prov_es', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'sciflo',
-                    '~/sciflo/ops/hysds_commons', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'sciflo',
-                    '~/sciflo/ops/hysds', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'sciflo',
-                    '~/sciflo/ops/sciflo', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'sciflo',
-                    '~/sciflo/ops/chimera', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'sciflo',
-                    '~/sciflo/ops/grq2', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'sciflo',
-                    '~/sciflo/ops/pele', ndeps, roles=[comp])
-            bar.update()
-
-        # update celery config
-        set_bar_desc(bar, 'Updating celery config')
-        execute(fab.rm_rf, '~/sciflo/ops/hysds/celeryconfig.py', roles=[comp])
-        execute(fab.rm_rf, '~/sciflo/ops/hysds/celeryconfig.pyc', roles=[comp])
-        execute(fab.send_celeryconf, 'grq', roles=[comp])
-        bar.update()
-
-        # update grq2 config
-        set_bar_desc(bar, 'Updating grq2 config')
-        execute(fab.rm_rf, '~/sciflo/ops/grq2/settings.cfg', roles=[comp])
-        execute(fab.send_grq2conf, roles=[comp])
-        bar.update()
-
-        # set default ES shard number
-        set_bar_desc(bar, 'Setting default ES shard number')
-        execute(fab.install_base_es_template, roles=[comp])
-        bar.update()
-
-        # update pele config
-        set_bar_desc(bar, 'Updating pele config')
-        execute(fab.rm_rf, '~/sciflo/ops/pele/settings.cfg', roles=[comp])
-        execute(fab.send_peleconf, 'pele_settings.cfg.tmpl', roles=[comp])
-        bar.update()
-
-        # create user_rules index
-        set_bar_desc(bar, 'Creating user_rules index')
-        execute(fab.create_grq_user_rules_index, roles=[comp])
-        bar.update()
-
-        # create hysds_ios-grq index
-        set_bar_desc(bar, 'Creating hysds_ios-grq index')
-        execute(fab.create_hysds_ios_grq_index, roles=[comp])
-        bar.update()
-
-        # update supervisor config
-        set_bar_desc(bar, 'Updating supervisor config')
-        execute(fab.rm_rf, '~/sciflo/etc/supervisord.conf', roles=[comp])
-        execute(fab.send_template_user_override, 'supervisord.conf.grq',
-                '~/sciflo/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor',
-                roles=[comp])
-        bar.update()
-
-        # update datasets config; overwrite datasets config with domain-specific config
-        set_bar_desc(bar, 'Updating datasets config')
-        execute(fab.rm_rf, '~/sciflo/etc/datasets.json', roles=[comp])
-        execute(fab.send_template, 'datasets.json',
-                '~/sciflo/etc/datasets.json', roles=[comp])
-        bar.update()
-
-        # ship logstash shipper configs
-        set_bar_desc(bar, 'Updating logstash shipper config')
-        execute(fab.send_shipper_conf, 'grq', '~/sciflo/log', conf.get('MOZART_ES_CLUSTER'),
-                conf.get('MOZART_REDIS_PVT_IP'), conf.get('METRICS_ES_CLUSTER'),
-                conf.get('METRICS_REDIS_PVT_IP'), roles=[comp])
-        bar.update()
-
-        # update HySDS scripts
-        set_bar_desc(bar, 'Updating HySDS scripts')
-        execute(fab.send_hysds_scripts, 'grq', roles=[comp])
-        bar.update()
-
-        # ensure self-signed SSL certs exist
-        set_bar_desc(bar, 'Configuring SSL')
-        execute(fab.ensure_ssl, 'grq', roles=[comp])
-        bar.update()
-
-        # link ssl certs to apps
-        execute(fab.ln_sf, '~/ssl/server.key',
-                '~/sciflo/ops/grq2/server.key', roles=[comp])
-        execute(fab.ln_sf, '~/ssl/server.pem',
-                '~/sciflo/ops/grq2/server.pem', roles=[comp])
-        execute(fab.ln_sf, '~/ssl/server.key',
-                '~/sciflo/ops/pele/server.key', roles=[comp])
-        execute(fab.ln_sf, '~/ssl/server.pem',
-                '~/sciflo/ops/pele/server.pem', roles=[comp])
-        bar.update()
-
-        # expose hysds log dir via webdav
-        set_bar_desc(bar, 'Expose logs')
-        execute(fab.mkdir, '/data/work', None, None, roles=[comp])
-        execute(fab.ln_sf, '~/sciflo/log', '/data/work/log', roles=[comp])
-        bar.update()
-
-        # installing ingest pipeline
-        # set_bar_desc(bar, 'Install GRQ Elasticsearch ingest pipeline')
-        # execute(fab.install_ingest_pipeline, roles=[comp])
-        # bar.update()
-
-        # update ES template
-        set_bar_desc(bar, 'Update ES template')
-        execute(fab.install_es_template, roles=[comp])
-        bar.update()
-
-        # ship AWS creds
-        set_bar_desc(bar, 'Configuring AWS creds')
-        execute(fab.send_awscreds, roles=[comp])
-        bar.update()
-        set_bar_desc(bar, 'Updated grq')
-
-
-def update_factotum(conf, ndeps=False, config_only=False, comp='factotum'):
+        # update reqs
+        core = pip_install_core(g, 'sciflo', GRQ_PKGS, ndeps, sync, wheelhouse)
+
+    # update celery config
+    celery = g.add('celery_conf', 'Updating celery config', [
+        rm_conf('~/sciflo/ops/hysds/celeryconfig.py', incremental),
+        call(fab.rm_rf, '~/sciflo/ops/hysds/celeryconfig.pyc'),
+        call(fab.send_celeryconf, 'grq'),
+    ], deps=[sync])
+
+    # update grq2 config
+    grq2_conf = g.add('grq2_conf', 'Updating grq2 config', [
+        rm_conf('~/sciflo/ops/grq2/settings.cfg', incremental),
+        call(fab.send_grq2conf),
+    ], deps=[sync])
+
+    # set default ES shard number
+    base_es = g.add('base_es_template', 'Setting default ES shard number', [
+        call(fab.install_base_es_template),
+    ], deps=[core, celery])
+
+    # update pele config
+    g.add('pele_conf', 'Updating pele config', [
+        rm_conf('~/sciflo/ops/pele/settings.cfg', incremental),
+        call(fab.send_peleconf, 'pele_settings.cfg.tmpl'),
+    ], deps=[core])
+
+    # create user_rules index
+    g.add('user_rules_index', 'Creating user_rules index', [
+        call(fab.create_grq_user_rules_index),
+    ], deps=[core, grq2_conf])
+
+    # create hysds_ios-grq index
+    g.add('hysds_ios_index', 'Creating hysds_ios-grq index', [
+        call(fab.create_hysds_ios_grq_index),
+    ], deps=[core, grq2_conf])
+
+    # update supervisor config
+    g.add('supervisor_conf', 'Updating supervisor config', [
+        rm_conf('~/sciflo/etc/supervisord.conf', incremental),
+        call(fab.send_template_user_override, 'supervisord.conf.grq',
+             '~/sciflo/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor'),
+    ], deps=[stop])
+
+    # update datasets config; overwrite datasets config with domain-specific config
+    g.add('datasets_conf', 'Updating datasets config', [
+        rm_conf('~/sciflo/etc/datasets.json', incremental),
+        call(fab.send_template, 'datasets.json', '~/sciflo/etc/datasets.json'),
+    ], deps=[stop])
+
+    # ship logstash shipper configs
+    g.add('shipper_conf', 'Updating logstash shipper config', [
+        call(fab.send_shipper_conf, 'grq', '~/sciflo/log', conf.get('MOZART_ES_CLUSTER'),
+             conf.get('MOZART_REDIS_PVT_IP'), conf.get('METRICS_ES_CLUSTER'),
+             conf.get('METRICS_REDIS_PVT_IP')),
+    ], deps=[stop])
+
+    # update HySDS scripts
+    g.add('hysds_scripts', 'Updating HySDS scripts', [
+        call(fab.send_hysds_scripts, 'grq'),
+    ], deps=[stop])
+
+    # ensure self-signed SSL certs exist
+    ssl = g.add('ssl', 'Configuring SSL', [call(fab.ensure_ssl, 'grq')], deps=[venv])
+
+    # link ssl certs to apps
+    g.add('ssl_links', 'Configuring SSL', [
+        call(fab.ln_sf, '~/ssl/server.key', '~/sciflo/ops/grq2/server.key'),
+        call(fab.ln_sf, '~/ssl/server.pem', '~/sciflo/ops/grq2/server.pem'),
+        call(fab.ln_sf, '~/ssl/server.key', '~/sciflo/ops/pele/server.key'),
+        call(fab.ln_sf, '~/ssl/server.pem', '~/sciflo/ops/pele/server.pem'),
+    ], deps=[ssl, sync])
+
+    # expose hysds log dir via webdav
+    g.add('expose_logs', 'Expose logs', [
+        call(fab.mkdir, '/data/work', None, None),
+        call(fab.ln_sf, '~/sciflo/log', '/data/work/log'),
+    ], deps=[venv])
+
+    # installing ingest pipeline
+    # g.add('ingest_pipeline', 'Install GRQ Elasticsearch ingest pipeline', [
+    #     call(fab.install_ingest_pipeline),
+    # ], deps=[core])
+
+    # update ES template
+    g.add('es_template', 'Update ES template', [
+        call(fab.install_es_template),
+    ], deps=[base_es, grq2_conf])
+
+    # ship AWS creds
+    g.add('aws_creds', 'Configuring AWS creds', [call(fab.send_awscreds)], deps=[venv])
+
+    run_update(g, max_parallelism, position, CONFIG_FILES[comp] if incremental else None)
+
+
+def update_factotum(conf, ndeps=False, config_only=False, comp='factotum', max_parallelism=1,
+                    position=None, incremental=False, wheelhouse=None,
+                    venv_artifacts=False):
     """"Update factotum component."""
 
-    num_updates = 9 if config_only else 16  # number of progress bar updates
-
-    with tqdm(total=num_updates) as bar:  # progress bar
-        # ensure venv
-        set_bar_desc(bar, 'Ensuring HySDS venv')
-        execute(fab.ensure_venv, 'verdi', roles=[comp])
-        bar.update()
-
-        # stop services
-        set_bar_desc(bar, 'Stopping verdid')
-        execute(fab.verdid_stop, roles=[comp])
-        execute(fab.kill_hung, roles=[comp])
-        bar.update()
-
-        # update
-        if not config_only:
-            set_bar_desc(bar, 'Syncing packages')
-            execute(fab.rm_rf, '~/verdi/ops/*', roles=[comp])
-            execute(fab.rsync_code, 'factotum', 'verdi', roles=[comp])
-            execute(fab.set_spyddder_settings, roles=[comp])
-            bar.update()
-
-            # update reqs
-            set_bar_desc(bar, 'Updating HySDS core')
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/osaka', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/prov_es', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/hysds_commons', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/hysds', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/sciflo', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/chimera', ndeps, roles=[comp])
-            bar.update()
-
-        # update celery config
-        set_bar_desc(bar, 'Updating celery config')
-        execute(fab.rm_rf, '~/verdi/ops/hysds/celeryconfig.py', roles=[comp])
-        execute(fab.rm_rf, '~/verdi/ops/hysds/celeryconfig.pyc', roles=[comp])
-        execute(fab.send_celeryconf, 'verdi', roles=[comp])
-        bar.update()
-
-        # update supervisor config
-        set_bar_desc(bar, 'Updating supervisor config')
-        execute(fab.rm_rf, '~/verdi/etc/supervisord.conf', roles=[comp])
-        execute(fab.send_template_user_override, 'supervisord.conf.factotum',
-                '~/verdi/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor',
-                roles=[comp])
-        bar.update()
+    g = StepGraph(comp)
 
-        # update datasets config; overwrite datasets config with domain-specific config
-        set_bar_desc(bar, 'Updating datasets config')
-        execute(fab.rm_rf, '~/verdi/etc/datasets.json', roles=[comp])
-        execute(fab.send_template, 'datasets.json',
-                '~/verdi/etc/datasets.json', roles=[comp])
-        bar.update()
+    # ensure venv
+    venv = add_venv(g, 'verdi', venv_artifacts, incremental)
 
-        # ship logstash shipper configs
-        set_bar_desc(bar, 'Updating logstash shipper config')
-        execute(fab.send_shipper_conf, 'factotum', '~/verdi/log', conf.get('MOZART_ES_CLUSTER'),
-                conf.get('MOZART_REDIS_PVT_IP'), conf.get('METRICS_ES_CLUSTER'),
-                conf.get('METRICS_REDIS_PVT_IP'), roles=[comp])
-        bar.update()
-
-        # update HySDS scripts
-        set_bar_desc(bar, 'Updating HySDS scripts')
-        execute(fab.send_hysds_scripts, 'factotum', roles=[comp])
-        bar.update()
+    # stop services; incremental updates leave them running and report what to restart
+    stop = venv if incremental else g.add('stop', 'Stopping verdid', [
+        call(fab.verdid_stop),
+        call(fab.kill_hung),
+    ], deps=[venv])
+    stop = add_venv_swap(g, 'verdi', stop, venv_artifacts and not incremental)
 
-        # expose hysds log dir via webdav
-        set_bar_desc(bar, 'Expose logs')
-        execute(fab.mkdir, '/data/work', None, None, roles=[comp])
-        execute(fab.ln_sf, '~/verdi/log', '/data/work/log', roles=[comp])
-        bar.update()
-
-        # ship netrc
-        netrc = os.path.join(get_user_files_path(), 'netrc')
-        if os.path.exists(netrc):
-            set_bar_desc(bar, 'Configuring netrc')
-            execute(fab.send_template, 'netrc', '.netrc', roles=[comp])
-            execute(fab.chmod, 600, '.netrc', roles=[comp])
-
-        # ship AWS creds
-        set_bar_desc(bar, 'Configuring AWS creds')
-        execute(fab.send_awscreds, roles=[comp])
-        bar.update()
-        set_bar_desc(bar, 'Updated factotum')
+    # update
+    sync = stop
+    if not config_only:
+        sync = g.add('sync', 'Syncing packages', [
+            call(fab.rsync_code, 'factotum', 'verdi'),
+            call(fab.set_spyddder_settings),
+        ], deps=[stop])
 
-
-def update_verdi(conf, ndeps=False, config_only=False, comp='verdi'):
+        # update reqs
+        pip_install_core(g, 'verdi', CORE_PKGS, ndeps, sync, wheelhouse, venv_artifacts=venv_artifacts)
+
+    # update celery config
+    g.add('celery_conf', 'Updating celery config', [
+        rm_conf('~/verdi/ops/hysds/celeryconfig.py', incremental),
+        call(fab.rm_rf, '~/verdi/ops/hysds/celeryconfig.pyc'),
+        call(fab.send_celeryconf, 'verdi'),
+    ], deps=[sync])
+
+    # update supervisor config
+    g.add('supervisor_conf', 'Updating supervisor config', [
+        rm_conf('~/verdi/etc/supervisord.conf', incremental),
+        call(fab.send_template_user_override, 'supervisord.conf.factotum',
+             '~/verdi/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor'),
+    ], deps=[stop])
+
+    # update datasets config; overwrite datasets config with domain-specific config
+    g.add('datasets_conf', 'Updating datasets config', [
+        rm_conf('~/verdi/etc/datasets.json', incremental),
+        call(fab.send_template, 'datasets.json', '~/verdi/etc/datasets.json'),
+    ], deps=[stop])
+
+    # ship logstash shipper configs
+    g.add('shipper_conf', 'Updating logstash shipper config', [
+        call(fab.send_shipper_conf, 'factotum', '~/verdi/log', conf.get('MOZART_ES_CLUSTER'),
+             conf.get('MOZART_REDIS_PVT_IP'), conf.get('METRICS_ES_CLUSTER'),
+             conf.get('METRICS_REDIS_PVT_IP')),
+    ], deps=[stop])
+
+    # update HySDS scripts
+    g.add('hysds_scripts', 'Updating HySDS scripts', [
+        call(fab.send_hysds_scripts, 'factotum'),
+    ], deps=[stop])
+
+    # expose hysds log dir via webdav
+    g.add('expose_logs', 'Expose logs', [
+        call(fab.mkdir, '/data/work', None, None),
+        call(fab.ln_sf, '~/verdi/log', '/data/work/log'),
+    ], deps=[venv])
+
+    # ship netrc
+    netrc = os.path.join(get_user_files_path(), 'netrc')
+    if os.path.exists(netrc):
+        g.add('netrc', 'Configuring netrc', [
+            call(fab.send_template, 'netrc', '.netrc'),
+            call(fab.chmod, 600, '.netrc'),
+        ], deps=[venv])
+
+    # ship AWS creds
+    g.add('aws_creds', 'Configuring AWS creds', [call(fab.send_awscreds)], deps=[venv])
+
+    run_update(g, max_parallelism, position, CONFIG_FILES[comp] if incremental else None)
+
+
+def update_verdi(conf, ndeps=False, config_only=False, comp='verdi', max_parallelism=1,
+                 position=None, incremental=False, wheelhouse=None,
+                 venv_artifacts=False):
     """"Update verdi component."""
 
-    num_updates = 10 if config_only else 17  # number of progress bar updates
+    g = StepGraph(comp)
 
-    with tqdm(total=num_updates) as bar:  # progress bar
-        # ensure venv
-        set_bar_desc(bar, 'Ensuring HySDS venv')
-        execute(fab.ensure_venv, comp, roles=[comp])
-        bar.update()
+    # ensure venv
+    venv = add_venv(g, comp, venv_artifacts, incremental)
 
-        # stop services
-        set_bar_desc(bar, 'Stopping verdid')
-        execute(fab.verdid_stop, roles=[comp])
-        execute(fab.kill_hung, roles=[comp])
-        bar.update()
+    # stop services; incremental updates leave them running and report what to restart
+    stop = venv if incremental else g.add('stop', 'Stopping verdid', [
+        call(fab.verdid_stop),
+        call(fab.kill_hung),
+    ], deps=[venv])
+    stop = add_venv_swap(g, comp, stop, venv_artifacts and not incremental)
 
-        # remove code bundle stuff
-        set_bar_desc(bar, 'Remove code bundle')
-        execute(fab.rm_rf, '~/verdi/ops/etc', roles=[comp])
-        execute(fab.rm_rf, '~/verdi/ops/install.sh', roles=[comp])
-        bar.update()
+    # remove code bundle stuff
+    sync = g.add('rm_bundle', 'Remove code bundle', [
+        call(fab.rm_rf, '~/verdi/ops/etc'),
+        call(fab.rm_rf, '~/verdi/ops/install.sh'),
+    ], deps=[stop])
 
-        # update
-        if not config_only:
-            set_bar_desc(bar, 'Syncing packages')
-            execute(fab.rm_rf, '~/verdi/ops/*', roles=[comp])
-            execute(fab.rsync_code, 'verdi', roles=[comp])
-            execute(fab.set_spyddder_settings, roles=[comp])
-            bar.update()
-
-            # update reqs
-            set_bar_desc(bar, 'Updating HySDS core')
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/osaka', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/prov_es', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/hysds_commons', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/hysds', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/sciflo', ndeps, roles=[comp])
-            bar.update()
-            execute(fab.pip_install_with_req, 'verdi',
-                    '~/verdi/ops/chimera', ndeps, roles=[comp])
-            bar.update()
-
-        # update celery config
-        set_bar_desc(bar, 'Updating celery config')
-        execute(fab.rm_rf, '~/verdi/ops/hysds/celeryconfig.py', roles=[comp])
-        execute(fab.rm_rf, '~/verdi/ops/hysds/celeryconfig.pyc', roles=[comp])
-        execute(fab.send_celeryconf, 'verdi', roles=[comp])
-        bar.update()
-
-        # update supervisor config
-        set_bar_desc(bar, 'Updating supervisor config')
-        execute(fab.rm_rf, '~/verdi/etc/supervisord.conf', roles=[comp])
-        execute(fab.send_template_user_override, 'supervisord.conf.verdi',
-                '~/verdi/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor',
-                roles=[comp])
-        bar.update()
-
-        # update datasets config; overwrite datasets config with domain-specific config
-        set_bar_desc(bar, 'Updating datasets config')
-        execute(fab.rm_rf, '~/verdi/etc/datasets.json', roles=[comp])
-        execute(fab.send_template, 'datasets.json',
-                '~/verdi/etc/datasets.json', roles=[comp])
-        bar.update()
-
-        # ship logstash shipper configs
-        set_bar_desc(bar, 'Updating logstash shipper config')
-        execute(fab.send_shipper_conf, 'verdi', '~/verdi/log', conf.get('MOZART_ES_CLUSTER'),
-                conf.get('MOZART_REDIS_PVT_IP'), conf.get('METRICS_ES_CLUSTER'),
-                conf.get('METRICS_REDIS_PVT_IP'), roles=[comp])
-        bar.update()
+    # update
+    if not config_only:
+        sync = g.add('sync', 'Syncing packages', [
+            call(fab.rsync_code, 'verdi'),
+            call(fab.set_spyddder_settings),
+        ], deps=[sync])
 
-        # update HySDS scripts
-        set_bar_desc(bar, 'Updating HySDS scripts')
-        execute(fab.send_hysds_scripts, 'verdi', roles=[comp])
-        bar.update()
-
-        # expose hysds log dir via webdav
-        set_bar_desc(bar, 'Expose logs')
-        execute(fab.mkdir, '/data/work', None, None, roles=[comp])
-        execute(fab.ln_sf, '~/verdi/log', '/data/work/log', roles=[comp])
-        bar.update()
-
-        # ship netrc
-        netrc = os.path.join(get_user_files_path(), 'netrc')
-        if os.path.exists(netrc):
-            set_bar_desc(bar, 'Configuring netrc')
-            execute(fab.send_template, 'netrc', '.netrc', roles=[comp])
-            execute(fab.chmod, 600, '.netrc', roles=[comp])
-
-        # ship AWS creds
-        set_bar_desc(bar, 'Configuring AWS creds')
-        execute(fab.send_awscreds, roles=[comp])
-        bar.update()
-        set_bar_desc(bar, 'Updated verdi')
-
-        # ship the run_podman script
-        set_bar_desc(bar, 'Updating run_verdi_podman.sh.tmpl')
-        execute(fab.rm_rf, '~/verdi/ops/hysds-dockerfiles/verdi/run_verdi_podman.sh', roles=[comp])
-        execute(fab.send_template,
-                "run_verdi_podman.sh.tmpl",
-                "~/verdi/ops/hysds-dockerfiles/verdi/run_verdi_podman.sh",
-                "~/mozart/ops/hysds-dockerfiles/verdi",
-                roles=[comp]
-        )
-        bar.update()
-
-
-def update_comp(comp, conf, ndeps=False, config_only=False):
+        # update reqs
+        pip_install_core(g, 'verdi', CORE_PKGS, ndeps, sync, wheelhouse, venv_artifacts=venv_artifacts)
+
+    # update celery config
+    g.add('celery_conf', 'Updating celery config', [
+        rm_conf('~/verdi/ops/hysds/celeryconfig.py', incremental),
+        call(fab.rm_rf, '~/verdi/ops/hysds/celeryconfig.pyc'),
+        call(fab.send_celeryconf, 'verdi'),
+    ], deps=[sync])
+
+    # update supervisor config
+    g.add('supervisor_conf', 'Updating supervisor config', [
+        rm_conf('~/verdi/etc/supervisord.conf', incremental),
+        call(fab.send_template_user_override, 'supervisord.conf.verdi',
+             '~/verdi/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor'),
+    ], deps=[stop])
+
+    # update datasets config; overwrite datasets config with domain-specific config
+    g.add('datasets_conf', 'Updating datasets config', [
+        rm_conf('~/verdi/etc/datasets.json', incremental),
+        call(fab.send_template, 'datasets.json', '~/verdi/etc/datasets.json'),
+    ], deps=[stop])
+
+    # ship logstash shipper configs
+    g.add('shipper_conf', 'Updating logstash shipper config', [
+        call(fab.send_shipper_conf, 'verdi', '~/verdi/log', conf.get('MOZART_ES_CLUSTER'),
+             conf.get('MOZART_REDIS_PVT_IP'), conf.get('METRICS_ES_CLUSTER'),
+             conf.get('METRICS_REDIS_PVT_IP')),
+    ], deps=[stop])
+
+    # update HySDS scripts
+    g.add('hysds_scripts', 'Updating HySDS scripts', [
+        call(fab.send_hysds_scripts, 'verdi'),
+    ], deps=[stop])
+
+    # expose hysds log dir via webdav
+    g.add('expose_logs', 'Expose logs', [
+        call(fab.mkdir, '/data/work', None, None),
+        call(fab.ln_sf, '~/verdi/log', '/data/work/log'),
+    ], deps=[venv])
+
+    # ship netrc
+    netrc = os.path.join(get_user_files_path(), 'netrc')
+    if os.path.exists(netrc):
+        g.add('netrc', 'Configuring netrc', [
+            call(fab.send_template, 'netrc', '.netrc'),
+            call(fab.chmod, 600, '.netrc'),
+        ], deps=[venv])
+
+    # ship AWS creds
+    g.add('aws_creds', 'Configuring AWS creds', [call(fab.send_awscreds)], deps=[venv])
+
+    # ship the run_podman script
+    g.add('run_podman', 'Updating run_verdi_podman.sh.tmpl', [
+        rm_conf('~/verdi/ops/hysds-dockerfiles/verdi/run_verdi_podman.sh', incremental),
+        call(fab.send_template, "run_verdi_podman.sh.tmpl",
+             "~/verdi/ops/hysds-dockerfiles/verdi/run_verdi_podman.sh",
+             "~/mozart/ops/hysds-dockerfiles/verdi"),
+    ], deps=[sync])
+
+    run_update(g, max_parallelism, position, CONFIG_FILES[comp] if incremental else None)
+
+
+UPDATE_FUNCS = {
+    'grq': update_grq,
+    'mozart': update_mozart,
+    'metrics': update_metrics,
+    'factotum': update_factotum,
+    'verdi': update_verdi,
+}
+
+# components updated by 'sds update all', in sequential order, and the
+# components each one must wait for when they are updated concurrently;
+# factotum and verdi are workers mirroring the verdi bundle that mozart's
+# update rebuilds, so they follow mozart
+UPDATE_ALL_DEPS = OrderedDict([
+    ('grq', ()),
+    ('mozart', ()),
+    ('metrics', ()),
+    ('factotum', ('mozart',)),
+    ('verdi', ('mozart',)),
+])
+
+
+def update_all(conf, ndeps=False, config_only=False, max_parallelism=1, incremental=False,
+               wheelhouse=None, venv_artifacts=False):
+    """Update all components at the same time, each on its own hosts."""
+
+    g = UpdateGraph()
+    for position, (comp, deps) in enumerate(UPDATE_ALL_DEPS.items()):
+        g.add(comp, 'Updating {}'.format(comp), [
+            call(fab.run_rolling, comp, UPDATE_FUNCS[comp], conf, ndeps, config_only,
+                 max_parallelism=max_parallelism, position=position, incremental=incremental,
+                 wheelhouse=wheelhouse, venv_artifacts=venv_artifacts),
+        ], deps=deps)
+
+    # share one lock so that bars drawn from the component processes don't interleave
+    tqdm.set_lock(multiprocessing.RLock())
+    g.run(max_parallelism=len(g))
+    print("")
+
+
+def update_comp(comp, conf, ndeps=False, config_only=False, max_parallelism=1, concurrent=False,
+                incremental=False, wheelhouse=False, venv_artifacts=False):
     """Update component."""
 
-    if comp == 'all':  # if all, create progress bar
+    # build dependency wheels once on mozart for every node to install from
+    wheelhouse = build_wheelhouse() if wheelhouse and not config_only else None
+    opts = dict(max_parallelism=max_parallelism, incremental=incremental, wheelhouse=wheelhouse,
+                venv_artifacts=venv_artifacts)
+
+    if comp == 'all' and concurrent:
+        update_all(conf, ndeps, config_only, **opts)
+    elif comp == 'all':  # if all, create progress bar
         # progress bar
         with tqdm(total=5) as bar:
-            set_bar_desc(bar, "Updating grq")
-            update_grq(conf, ndeps, config_only)
-            bar.update()
-            set_bar_desc(bar, "Updating mozart")
-            update_mozart(conf, ndeps, config_only)
-            bar.update()
-            set_bar_desc(bar, "Updating metrics")
-            update_metrics(conf, ndeps, config_only)
-            bar.update()
-            set_bar_desc(bar, "Updating factotum")
-            update_factotum(conf, ndeps, config_only)
-            bar.update()
-            set_bar_desc(bar, "Updating verdi")
-            update_verdi(conf, ndeps, config_only)
-            bar.update()
+            for comp in UPDATE_ALL_DEPS:
+                set_bar_desc(bar, "Updating {}".format(comp))
+                fab.run_rolling(comp, UPDATE_FUNCS[comp], conf, ndeps, config_only, **opts)
+                bar.update()
             set_bar_desc(bar, "Updated all")
             print("")
     else:
-        if comp == 'grq':
-            update_grq(conf, ndeps, config_only)
-        if comp == 'mozart':
-            update_mozart(conf, ndeps, config_only)
-        if comp == 'metrics':
-            update_metrics(conf, ndeps, config_only)
-        if comp == 'factotum':
-            update_factotum(conf, ndeps, config_only)
-        if comp == 'verdi':
-            update_verdi(conf, ndeps, config_only)
-
-
-def update(comp, debug=False, force=False, ndeps=False, config_only=False):
+        fab.run_rolling(comp, UPDATE_FUNCS[comp], conf, ndeps, config_only, **opts)
+
+
+def update(comp, debug=False, force=False, ndeps=False, config_only=False, max_parallelism=1,
+           concurrent=False, incremental=False, wheelhouse=False, venv_artifacts=False,
+           parallel=None, batch_size=None, rolling=False, max_failures=0, relay_seeds=0,
+           relay_fanout=4):
     """Update components."""
 
     # prompt user
     if not force:
-        cont = prompt(get_prompt_tokens=lambda x: [(Token.Alert,
-                                                    "Updating component[s]: {}. Continue [y/n]: ".format(comp)), (Token, " ")],
-                      validator=YesNoValidator(), style=prompt_style) == 'y'
+        cont = prompt_yes_no("Updating component[s]: {}. Continue [y/n]: ".format(comp))
         if not cont:
             return 0
 
@@ -831,26 +880,93 @@ def update(comp, debug=False, force=False, ndeps=False, config_only=False):
 
     logger.debug("Updating %s" % comp)
 
-    if debug:
-        update_comp(comp, conf, ndeps, config_only)
-    else:
-        with hide('everything'):
-            update_comp(comp, conf, ndeps, config_only)
+    # incremental updates leave services running, so code and venvs under them are left alone
+    if incremental and not config_only:
+        logger.debug("incremental update, so updating configuration files only")
+        config_only = True
+
+    args = (comp, conf, ndeps, config_only, max_parallelism, concurrent, incremental, wheelhouse,
+            venv_artifacts)
+    with fab.rollout(parallel, batch_size, rolling, max_failures), \
+            fab.relay_distribution(relay_seeds, relay_fanout):
+        if debug:
+            update_comp(*args)
+        else:
+            with hide('everything'):
+                update_comp(*args)
 
 
-def ship_verdi(conf, encrypt=False, comp='mozart'):
-    """"Ship verdi code/config bundle."""
+def get_ship_queues(conf, queues, inputs, ledger, only=None):
+    """Return queues whose bundles to ship: the ones in only, or else the ones whose inputs changed."""
+
+    venue = conf.get('VENUE')
+    if only:
+        unknown = sorted(set(only) - set(queues))
+        if unknown:
+            raise RuntimeError("Unknown queue(s) %s. Configured queues: %s." %
+                               (", ".join(unknown), ", ".join(queues)))
+        return [q for q in queues if q in only]
+    selected = []
+    for queue in queues:
+        bundle = '{}-{}.tbz2'.format(queue, venue)
+        if ledger.is_current(bundle, inputs[queue]):
+            logger.debug("%s unchanged since last ship" % bundle)
+            continue
+        logger.debug("%s changed: %s" % (bundle, ", ".join(ledger.get_changed(bundle, inputs[queue]))))
+        selected.append(queue)
+    return selected
+
+
+def ship_verdi(conf, encrypt=False, comp='mozart', layered=False, codec=DEFAULT_CODEC, queues=None):
+    """"Ship verdi code/config bundle.
+
+    Layered bundles ship the code once as a content-addressed layer that
+    install.sh fetches, so each queue bundle only holds the queue's
+    config and creds; codec applies to that layer, queue bundles are
+    always bzip2. Only queues whose code, configs or creds changed
+    since they were last shipped are rebuilt, unless queues are given.
+    """
 
     venue = conf.get('VENUE')
-    queues = [q['QUEUE_NAME'] for q in conf.get('QUEUES')]
-    # progress bar
-    with tqdm(total=len(queues)+1) as bar:
+    all_queues = [q['QUEUE_NAME'] for q in conf.get('QUEUES')]
+    ledger = ShipLedger(conf.get('CODE_BUCKET'))
+    # progress bar; simple shell steps are sent to the host in batches
+    shipped = []  # bundles checked against the code bucket
+    with tqdm(total=len(all_queues)+3+layered) as bar, fab.batched_steps():
 
         # ensure venv
         set_bar_desc(bar, 'Ensuring HySDS venv')
         execute(fab.ensure_venv, comp, roles=[comp])
         bar.update()
 
+        # hash the inputs of each queue's bundle
+        set_bar_desc(bar, 'Checking queue inputs')
+        shared = list(execute(fab.get_ship_inputs, codec, roles=[comp]).values())[0]
+        style_tar = os.path.join(get_user_files_path(), 'beefed-autoindex-open_in_new_win.tbz2')
+        with open(style_tar, 'rb') as f:
+            shared['style'] = hashlib.sha1(f.read()).hexdigest()
+        shared.update(codec=codec, layered=layered, encrypt=encrypt)
+        inputs = {}
+        for queue in all_queues:
+            inputs[queue] = dict(shared, **fab.get_queue_config_hashes(queue))
+        queues = get_ship_queues(conf, all_queues, inputs, ledger, queues)
+        bar.total = len(queues)+3+layered
+        bar.update()
+        if not queues:
+            bar.update(bar.total - bar.n)
+            set_bar_desc(bar, 'Finished shipping')
+            print("")
+            print("All {} queue bundle(s) are up to date".format(len(all_queues)))
+            return
+
+        # ship code layer shared by all queues
+        if layered:
+            set_bar_desc(bar, 'Shipping code layer')
+            result = execute(fab.ship_code_layer, '~/verdi/ops', encrypt, codec, roles=[comp])
+            shipped.append(list(result.values())[0])
+            code_layer = shipped[-1]['bundle']
+            bar.update()
+
         # iterate over queues
         for queue in queues:
 
@@ -862,6 +978,7 @@ def ship_verdi(conf, encrypt=False, comp='mozart'):
                 # send queue-specific install.sh script and configs
                 set_bar_desc(queue_bar, 'Sending queue-specific config')
                 execute(fab.rm_rf, '~/verdi/ops/install.sh', roles=[comp])
+                execute(fab.rm_rf, '~/verdi/ops/code_layer', roles=[comp])
                 execute(fab.rm_rf, '~/verdi/etc/datasets.json', roles=[comp])
                 execute(fab.rm_rf, '~/verdi/etc/supervisord.conf',
                         roles=[comp])
@@ -907,29 +1024,49 @@ def ship_verdi(conf, encrypt=False, comp='mozart'):
 
                 # create venue bundle
                 set_bar_desc(queue_bar, 'Creating/shipping bundle')
-                execute(fab.mkdir, '~/code_configs',
-                        'ops', 'ops', roles=[comp])
+                # bundles are streamed to the code bucket; drop copies staged by older releases
                 execute(
                     fab.rm_rf, '~/code_configs/{}-{}.tbz2'.format(queue, venue), roles=[comp])
-                execute(fab.ship_code, '~/verdi/ops',
-                        '~/code_configs/{}-{}.tbz2'.format(queue, venue), encrypt, roles=[comp])
+                if layered:
+                    result = execute(fab.ship_overlay, '~/verdi/ops', '{}-{}.tbz2'.format(queue, venue),
+                                     code_layer, encrypt, roles=[comp])
+                else:
+                    result = execute(fab.ship_code, '~/verdi/ops', '{}-{}.tbz2'.format(queue, venue),
+                                     encrypt, roles=[comp])
+                shipped.append(list(result.values())[0])
+                ledger.record('{}-{}.tbz2'.format(queue, venue), inputs[queue])
                 queue_bar.update()
             bar.update()
+
+        # record content hashes of shipped bundles
+        set_bar_desc(bar, 'Recording bundle manifest')
+        execute(fab.update_bundle_manifest, shipped, roles=[comp])
+        bar.update()
         set_bar_desc(bar, 'Finished shipping')
         print("")
 
+    uploaded = [r['bundle'] for r in shipped if r['uploaded']]
+    print("Rebuilt {} of {} queue bundle(s)".format(len(queues), len(all_queues)))
+    print("Uploaded {} of {} bundle(s){}".format(len(uploaded), len(shipped),
+                                                 ": " + ", ".join(uploaded) if uploaded else ""))
 
-def ship(encrypt, debug=False):
+
+def ship(encrypt, debug=False, layered=False, codec=DEFAULT_CODEC, queues=None):
     """Update components."""
 
+    # queue bundles are always bzip2; only the code layer of layered bundles can use another codec
+    if codec != DEFAULT_CODEC and not layered:
+        logger.error("--codec %s needs --layered; queue bundles are always %s." % (codec, DEFAULT_CODEC))
+        return 1
+
     # get user's SDS conf settings
     conf = SettingsConf()
 
     if debug:
-        ship_verdi(conf, encrypt)
+        ship_verdi(conf, encrypt, layered=layered, codec=codec, queues=queues)
     else:
         with hide('everything'):
-            ship_verdi(conf, encrypt)
+            ship_verdi(conf, encrypt, layered=layered, codec=codec, queues=queues)
 
 
 def import_kibana(comp='metrics'):
@@ -949,7 +1086,7 @@ def import_kibana(comp='metrics'):
         bar.update()
         set_bar_desc(bar, 'copying over dashboards and scripts')
 
-        if fab.metrics_es_engine == "opensearch":
+        if fab.get_es_engine('metrics') == "opensearch":
             execute(fab.send_template_user_override, 'import_dashboard.sh.tmpl',
                     '~/metrics/ops/kibana_metrics/import_dashboard.sh',
                     '~/mozart/ops/sdscli/sdscli/adapters/hysds/files/opensearch_dashboards_import',
@@ -1001,9 +1138,7 @@ def kibana(job_type, debug=False, force=False):
     """Update components."""
 
     if not force:  # prompt user
-        cont = prompt(get_prompt_tokens=lambda x: [(Token.Alert,
-                                                    "Updating Kibana: {}. Continue [y/n]: ".format(job_type)), (Token, " ")],
-                      validator=YesNoValidator(), style=prompt_style) == 'y'
+        cont = prompt_yes_no("Updating Kibana: {}. Continue [y/n]: ".format(job_type))
         if not cont:
             return 0
 
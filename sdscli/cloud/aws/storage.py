@@ -17,7 +17,7 @@ import base64
 from pprint import pformat
 from collections import OrderedDict
 from operator import itemgetter
-from fabric.api import execute, hide
+from fabric.api import hide
 
 from prompt_toolkit.shortcuts import prompt, print_tokens
 from prompt_toolkit.styles import style_from_dict
@@ -80,8 +80,9 @@ def ship_style(args, conf):
         'DATASET_BUCKET') if args.bucket is None else args.bucket
 
     # get fab function
-    func = get_func('sdscli.adapters.{}.fabfile'.format(
-        args.type), args.subparser2)
+    fab_mod = 'sdscli.adapters.{}.fabfile'.format(args.type)
+    func = get_func(fab_mod, args.subparser2)
+    execute = get_func(fab_mod, 'execute')
 
     # execute
     execute(func, bucket_name, args.encrypt, roles=['mozart'])
@@ -198,8 +199,9 @@ def create_staging_area(args, conf):
 
     # create lambda zip file and upload to code bucket
     zip_file = "/tmp/data-staged.zip"
-    func = get_func('sdscli.adapters.{}.fabfile'.format(
-        args.type), 'create_zip')
+    fab_mod = 'sdscli.adapters.{}.fabfile'.format(args.type)
+    func = get_func(fab_mod, 'create_zip')
+    execute = get_func(fab_mod, 'execute')
     if args.debug:
         execute(func, "mozart/ops/hysds-cloud-functions/aws/data-staged",
                 zip_file, roles=['mozart'])
@@ -8,17 +8,10 @@ from __future__ import absolute_import
 
 
 from sdscli.log_utils import logger
-from sdscli.func_utils import get_module, get_func
-import sdscli
-from importlib import import_module
+from sdscli.func_utils import get_func
 import logging
 import argparse
-import traceback
-import yaml
-import json
-import importlib
 import sys
-import os
 from future import standard_library
 standard_library.install_aliases()
 
@@ -70,7 +63,10 @@ def update(args):
     logger.debug("sds_type: %s" % sds_type)
     func = get_adapter_func(sds_type, 'update', 'update')
     logger.debug("func: %s" % func)
-    func(args.component, args.debug, args.force, args.ndeps, args.config_only)
+    func(args.component, args.debug, args.force, args.ndeps, args.config_only,
+         args.max_step_parallelism, args.concurrent, args.incremental, args.wheelhouse,
+         args.venv_artifacts, args.parallel, args.batch_size, args.rolling, args.max_failures,
+         args.relay_seeds, args.relay_fanout)
 
 
 def ship(args):
@@ -81,7 +77,7 @@ def ship(args):
     logger.debug("sds_type: %s" % sds_type)
     func = get_adapter_func(sds_type, 'update', 'ship')
     logger.debug("func: %s" % func)
-    func(args.encrypt, args.debug)
+    return func(args.encrypt, args.debug, args.layered, args.codec, args.queues)
 
 
 def start_tps(args):
@@ -114,7 +110,8 @@ def start(args):
     logger.debug("sds_type: %s" % sds_type)
     func = get_adapter_func(sds_type, 'start', 'start')
     logger.debug("func: %s" % func)
-    func(args.component, args.debug, args.force)
+    func(args.component, args.debug, args.force,
+         args.parallel, args.batch_size, args.rolling, args.max_failures)
 
 
 def stop(args):
@@ -125,7 +122,8 @@ def stop(args):
     logger.debug("sds_type: %s" % sds_type)
     func = get_adapter_func(sds_type, 'stop', 'stop')
     logger.debug("func: %s" % func)
-    func(args.component, args.debug, args.force)
+    func(args.component, args.debug, args.force,
+         args.parallel, args.batch_size, args.rolling, args.max_failures)
 
 
 def reset(args):
@@ -147,7 +145,8 @@ def status(args):
     logger.debug("sds_type: %s" % sds_type)
     func = get_adapter_func(sds_type, 'status', 'status')
     logger.debug("func: %s" % func)
-    func(args.component, args.debug)
+    func(args.component, args.debug, args.parallel, args.batch_size, args.rolling,
+         args.max_failures)
 
 
 def ci(args):
@@ -222,6 +221,21 @@ def orch(args):
         func(args.component, args.debug, args.force)
 
 
+def serve(args):
+    """SDS command daemon functions."""
+
+    logger.debug("got to serve(): %s" % args)
+    sds_type = args.type
+    logger.debug("sds_type: %s" % sds_type)
+    func = get_adapter_func(sds_type, 'serve', args.subparser)
+    logger.debug("func: %s" % func)
+    return func(args)
+
+
+# non-interactive commands that a running sds daemon may execute
+FORWARD_FUNCS = (status, pkg, rules, job_list)
+
+
 def dispatch(args):
     """Dispatch to appropriate function."""
 
@@ -238,12 +252,50 @@ def dispatch(args):
         return 1
 
 
-def main():
+def add_transfer_args(parser):
+    """Add options tuning parallel S3 transfers to subcommand parser."""
+
+    parser.add_argument('--part-size', type=int, default=None, metavar='MB',
+                        help="transfer S3 objects in ranged GETs or multipart PUTs of MB "
+                             "megabytes (default: 64)")
+    parser.add_argument('--concurrency', type=int, default=None, metavar='N',
+                        help="transfer up to N parts of an S3 object at once (default: 8)")
+
+
+def add_bulk_args(parser):
+    """Add options batching ES requests to subcommand parser."""
+
+    parser.add_argument('--batch-size', type=int, default=None, metavar='N',
+                        help="send ES documents in _bulk requests of N (default: 500)")
+
+
+def add_rollout_args(parser):
+    """Add options bounding fan-out over multi-host roles to subcommand parser."""
+
+    parser.add_argument('--parallel', type=int, default=None, metavar='N',
+                        help="run tasks on at most N hosts of a multi-host role at once")
+    parser.add_argument('--batch-size', type=int, default=None, metavar='N',
+                        help="roll out over a multi-host role N hosts at a time, finishing "
+                             "each batch before starting the next")
+    parser.add_argument('--rolling', action='store_true',
+                        help="roll out in batches of --batch-size, --parallel or 10 hosts")
+    parser.add_argument('--max-failures', type=int, default=0, metavar='N',
+                        help="skip up to N failed hosts before aborting the rollout")
+
+
+def main(argv=None, forward=True):
     """Process command line."""
 
+    if argv is None:
+        argv = sys.argv[1:]
+
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument('--debug', '-d', action='store_true',
                         help="turn on debugging")
+    parser.add_argument('--import-profile', action='store_true',
+                        help="report per-module import cost of the command")
+    parser.add_argument('--no-serve', action='store_true',
+                        help="run in this process even if an sds daemon is running")
     subparsers = parser.add_subparsers(help='Functions')
 
     # parser for configure
@@ -266,6 +318,29 @@ def main():
                                help="skip the external accesses for dependencies")
     parser_update.add_argument('--config-only', '-c', action='store_true',
                                help="update configuration files only")
+    parser_update.add_argument('--max-step-parallelism', '-p', type=int, default=1,
+                               help="max number of independent update steps run at once "
+                                    "per component (default: 1, runs them in sequence)")
+    parser_update.add_argument('--concurrent', action='store_true',
+                               help="with 'all', update components on their own hosts "
+                                    "at the same time")
+    parser_update.add_argument('--incremental', action='store_true',
+                               help="leave services running, upload only config files that "
+                                    "changed and report services that need a restart; "
+                                    "implies --config-only")
+    parser_update.add_argument('--wheelhouse', action='store_true',
+                               help="build dependency wheels once on mozart and install HySDS "
+                                    "core on every node from them without index access")
+    parser_update.add_argument('--venv-artifacts', action='store_true',
+                               help="package mozart's verdi venv as a versioned artifact and "
+                                    "unpack it on verdi/factotum nodes instead of rebuilding it")
+    parser_update.add_argument('--relay-seeds', type=int, default=0, metavar='N',
+                               help="send code and venv artifacts from mozart to N hosts of a "
+                                    "multi-host role only and have them relay to the rest; "
+                                    "needs an ssh-agent holding the hosts' key")
+    parser_update.add_argument('--relay-fanout', type=int, default=4, metavar='N',
+                               help="number of hosts each host relays artifacts to")
+    add_rollout_args(parser_update)
     parser_update.set_defaults(func=update)
 
     # parser for kibana
@@ -287,6 +362,16 @@ def main():
                              choices=['hysds', 'sdskit'])
     parser_ship.add_argument('--encrypt', '-e', action='store_true',
                              help="encrypt code/config bundle")
+    parser_ship.add_argument('--layered', action='store_true',
+                             help="ship code once as a shared layer fetched by install.sh "
+                                  "and only config and creds per queue")
+    parser_ship.add_argument('--codec', default='bzip2', choices=['bzip2', 'gzip', 'zstd', 'none'],
+                             help="compression codec of the --layered code layer; queue bundles "
+                                  "are always bzip2. Uses multi-threaded lbzip2/pbzip2, pigz or "
+                                  "zstd when installed")
+    parser_ship.add_argument('--queues', '-q', nargs='+', metavar='QUEUE',
+                             help="rebuild and ship only these queues' bundles instead of "
+                                  "the ones whose code, configs or creds changed since the last ship")
     parser_ship.set_defaults(func=ship)
 
     # parser for start_tps
@@ -316,9 +401,10 @@ def main():
     parser_start.add_argument('--type', '-t', default='hysds', const='hysds', nargs='?',
                               choices=['hysds', 'sdskit'])
     parser_start.add_argument('component', choices=['mozart', 'grq', 'metrics',
-                                                    'factotum', 'all'])
+                                                    'factotum', 'verdi', 'all'])
     parser_start.add_argument('--force', '-f', action='store_true',
                               help="force start without user confirmation")
+    add_rollout_args(parser_start)
     parser_start.set_defaults(func=start)
 
     # parser for stop
@@ -326,9 +412,10 @@ def main():
     parser_stop.add_argument('--type', '-t', default='hysds', const='hysds', nargs='?',
                              choices=['hysds', 'sdskit'])
     parser_stop.add_argument('component', choices=['mozart', 'grq', 'metrics',
-                                                   'factotum', 'all'])
+                                                   'factotum', 'verdi', 'all'])
     parser_stop.add_argument('--force', '-f', action='store_true',
                              help="force stop without user confirmation")
+    add_rollout_args(parser_stop)
     parser_stop.set_defaults(func=stop)
 
     # parser for reset
@@ -348,6 +435,7 @@ def main():
                                choices=['hysds', 'sdskit'])
     parser_status.add_argument('component', default='all', const='all', nargs='?',
                                choices=['mozart', 'grq', 'metrics', 'factotum', 'ci', 'verdi', 'all'])
+    add_rollout_args(parser_status)
     parser_status.set_defaults(func=status)
 
     # parser for ci
@@ -399,6 +487,11 @@ def main():
         '--skip-include-dependency-images', '-D', action='store_true',
         help="Do not include dependency images in the SDS package"
     )
+    parser_pkg_export.add_argument('--codec', default='none', choices=['none', 'bzip2', 'gzip', 'zstd'],
+                                   help="compression codec of SDS package; import detects it")
+    parser_pkg_export.add_argument('--parallel', '-j', type=int, default=4,
+                                   help="max number of images to download at a time")
+    add_transfer_args(parser_pkg_export)
     parser_pkg_import = parser_pkg_subparsers.add_parser(
         'import', help="import SDS package")
     parser_pkg_import.add_argument('file', help='SDS package to import')
@@ -406,9 +499,12 @@ def main():
         '--skip-include-dependency-images', '-D', action='store_true',
         help="Do not attempt to include dependency images when importing the SDS package"
     )
+    add_transfer_args(parser_pkg_import)
+    add_bulk_args(parser_pkg_import)
     parser_pkg_rm = parser_pkg_subparsers.add_parser(
         'rm', help="remove SDS package")
     parser_pkg_rm.add_argument('id', help='SDS package id to remove')
+    add_bulk_args(parser_pkg_rm)
     parser_pkg.set_defaults(func=pkg)
 
     # parser for cloud
@@ -472,6 +568,7 @@ def main():
         'import', help="import user rules")
     parser_rules_import.add_argument(
         'file', help='input JSON file for user rules import')
+    add_bulk_args(parser_rules_import)
     parser_rules.set_defaults(func=rules)
 
     # parser for jobs
@@ -542,14 +639,43 @@ def main():
     parser_orch_run.add_argument('cmd', nargs=argparse.REMAINDER, help="command")
     parser_orch.set_defaults(func=orch)
 
+    # parser for sds daemon
+    parser_serve = subparsers.add_parser(
+        'serve', help="run sds daemon keeping config and connections warm")
+    parser_serve.add_argument('--type', '-t', default='hysds', const='hysds', nargs='?',
+                              choices=['hysds', 'sdskit'])
+    parser_serve_subparsers = parser_serve.add_subparsers(
+        dest='subparser', help='sds daemon functions')
+    parser_serve_start = parser_serve_subparsers.add_parser(
+        'start', help="start sds daemon")
+    parser_serve_start.add_argument('--foreground', '-F', action='store_true',
+                                    help="do not detach from terminal")
+    parser_serve_stop = parser_serve_subparsers.add_parser(
+        'stop', help="stop sds daemon")
+    parser_serve_status = parser_serve_subparsers.add_parser(
+        'status', help="status of sds daemon")
+    parser_serve.set_defaults(func=serve, subparser='start', foreground=False)
+
     # parse
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     # print help
-    if len(sys.argv) == 1 or not hasattr(args, 'func'):
+    if len(argv) == 0 or not hasattr(args, 'func'):
         parser.print_help(sys.stderr)
         sys.exit(1)
 
+    # rerun command under import profiler
+    if args.import_profile:
+        from sdscli.profile_utils import run_import_profile
+        return run_import_profile([i for i in argv if i != '--import-profile'])
+
+    # run in sds daemon if one is listening
+    if forward and not args.no_serve and args.func in FORWARD_FUNCS:
+        from sdscli.serve_utils import forward_command
+        ret = forward_command(argv)
+        if ret is not None:
+            return ret
+
     # dispatch
     return dispatch(args)
 
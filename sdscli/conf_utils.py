@@ -10,11 +10,22 @@ from future import standard_library
 standard_library.install_aliases()
 import os
 import yaml
+import hashlib
 import logging
 import traceback
 
 from sdscli.log_utils import logger
 
+# use libyaml bindings when PyYAML was built with them
+try:
+    from yaml import CFullLoader as FullLoader
+except ImportError:
+    from yaml import FullLoader
+
+
+# parsed YAML files keyed by path: (mtime, size, sha1, cfg)
+_yaml_cache = {}
+
 
 def get_user_config_path():
     """Return path to user configuration."""
@@ -28,6 +39,35 @@ def get_user_files_path():
     return os.path.expanduser(os.path.join('~', '.sds', 'files'))
 
 
+def get_ship_ledger_path():
+    """Return path to ledger of shipped verdi bundles."""
+
+    return os.path.expanduser(os.path.join('~', '.sds', 'ship_ledger.json'))
+
+
+def load_yaml(file):
+    """Return parsed YAML file, reusing the cached result while the file is unchanged.
+
+    The returned object is shared between callers and must not be modified.
+    """
+
+    path = os.path.abspath(file)
+    st = os.stat(path)
+    cached = _yaml_cache.get(path)
+    if cached is not None and cached[:2] == (st.st_mtime, st.st_size):
+        return cached[3]
+    with open(path, 'rb') as f:
+        data = f.read()
+    sha1 = hashlib.sha1(data).hexdigest()
+    if cached is not None and cached[2] == sha1:
+        logger.debug("{} touched but unchanged".format(path))
+        cfg = cached[3]
+    else:
+        cfg = yaml.load(data, Loader=FullLoader)
+    _yaml_cache[path] = (st.st_mtime, st.st_size, sha1, cfg)
+    return cfg
+
+
 class YamlConfError(Exception):
     """Exception class for YamlConf class."""
     pass
@@ -41,8 +81,7 @@ class YamlConf(object):
 
         logger.debug("file: {}".format(file))
         self._file = file
-        with open(self._file) as f:
-            self._cfg = yaml.load(f, Loader=yaml.FullLoader)
+        self._cfg = load_yaml(self._file)
 
     @property
     def file(self):
@@ -6,14 +6,9 @@ from __future__ import absolute_import
 
 from sdscli.log_utils import logger
 from importlib import import_module
-import logging
-import argparse
+import importlib.util
 import traceback
-import yaml
-import json
-import importlib
 import sys
-import os
 from future import standard_library
 standard_library.install_aliases()
 
@@ -42,3 +37,34 @@ def get_func(mod_name, func_name):
                      (func_name, mod_name))
         logger.error(traceback.format_exc())
         raise
+
+
+def lazy_import(mod_name):
+    """Return module whose execution is deferred until first attribute access."""
+
+    if mod_name in sys.modules:
+        return sys.modules[mod_name]
+    spec = importlib.util.find_spec(mod_name)
+    if spec is None:
+        raise ImportError('Failed to find module "%s".' % mod_name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[mod_name] = mod
+    loader.exec_module(mod)
+    return mod
+
+
+def lazy_func(mod_name, func_name):
+    """Return proxy that imports function from module on first call."""
+
+    resolved = []
+
+    def proxy(*args, **kwargs):
+        if not resolved:
+            resolved.append(get_func(mod_name, func_name))
+        return resolved[0](*args, **kwargs)
+
+    proxy.__name__ = str(func_name)
+    proxy.__doc__ = "Lazily imported %s.%s()." % (mod_name, func_name)
+    return proxy
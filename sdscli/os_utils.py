@@ -17,6 +17,16 @@ def normpath(d):
     return os.path.abspath(os.path.normpath(d))
 
 
+def format_bytes(n):
+    """Return human readable size of n bytes."""
+
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if abs(n) < 1024 or unit == 'TB':
+            break
+        n /= 1024.
+    return "{:.0f} {}".format(n, unit) if unit == 'B' else "{:.1f} {}".format(n, unit)
+
+
 def makedirs(d, mode=0o777):
     """Make directory along with any parent directory that may be needed."""
 
@@ -0,0 +1,61 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+
+from future import standard_library
+standard_library.install_aliases()
+import os
+import re
+import sys
+import subprocess
+
+from sdscli.log_utils import logger
+
+
+IMPORT_TIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+def parse_import_times(lines):
+    """Parse output of python -X importtime into (module, self_us, cumulative_us, depth) tuples."""
+
+    timings = []
+    for line in lines:
+        match = IMPORT_TIME_RE.search(line)
+        if not match:
+            continue
+        self_us, cum_us, indent, mod_name = match.groups()
+        timings.append((mod_name, int(self_us), int(cum_us), (len(indent) - 1) // 2))
+    return timings
+
+
+def print_import_profile(timings, top=25, file=sys.stderr):
+    """Print per-module import cost report."""
+
+    total_us = sum(t[2] for t in timings if t[3] == 0)
+    print("{:-^78}".format(" import profile "), file=file)
+    print("{:<50} {:>12} {:>12}".format("module", "self [ms]", "cumul [ms]"), file=file)
+    for mod_name, self_us, cum_us, depth in sorted(timings, key=lambda t: t[2], reverse=True)[:top]:
+        print("{:<50.50} {:>12.1f} {:>12.1f}".format(mod_name, self_us / 1000., cum_us / 1000.), file=file)
+    print("{:-^78}".format(""), file=file)
+    print("{} modules imported in {:.1f} ms".format(len(timings), total_us / 1000.), file=file)
+
+
+def run_import_profile(argv, top=25):
+    """Run sds with argv in a child interpreter and report per-module import cost."""
+
+    cmd = [sys.executable, '-X', 'importtime', '-m', 'sdscli.command_line'] + list(argv)
+    logger.debug("import profile cmd: %s" % cmd)
+    env = dict(os.environ)
+    env.pop('PYTHONPROFILEIMPORTTIME', None)
+    proc = subprocess.Popen(cmd, stderr=subprocess.PIPE, env=env, universal_newlines=True)
+    import_lines = []
+    for line in proc.stderr:
+        if line.startswith('import time:'):
+            import_lines.append(line)
+        else:
+            sys.stderr.write(line)
+    ret = proc.wait()
+    print_import_profile(parse_import_times(import_lines), top)
+    return ret
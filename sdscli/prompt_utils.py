@@ -9,8 +9,6 @@ standard_library.install_aliases()
 import os
 import re
 
-from prompt_toolkit.validation import Validator, ValidationError
-
 from sdscli.log_utils import logger
 
 
@@ -35,58 +33,105 @@ COLOR_CODE = {
 }
 
 
-class YesNoValidator(Validator):
-    def validate(self, document):
-        text = document.text.lower()
-        if not text in ('yes', 'no', 'y', 'n'):
-            raise ValidationError(message='Input needs to be "y" or "n"',
-                                  cursor_position=len(text))
-
-
-class IpAddressValidator(Validator):
-    def validate(self, document):
-        text = document.text.lower()
-        match = re.search(
-            r'^(([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.){3}([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])$', text)
-        if not match:
-            raise ValidationError(message='Input needs to be valid IP address',
-                                  cursor_position=len(text))
-
-
-class SelectionValidator(Validator):
-    def validate(self, document):
-        text = document.text.lower()
-        match = re.search(r'^\s*\d+\s*$', text)
-        if not match:
-            raise ValidationError(message='Input needs to be integer',
-                                  cursor_position=len(text))
-
-
-class MultipleSelectionValidator(Validator):
-    def validate(self, document):
-        text = document.text.lower()
-        match = re.search(r'^\s*(\d+\s*)+$', text)
-        if not match:
-            raise ValidationError(message='Inputs need to be integer[s] separated by space',
-                                  cursor_position=len(text))
-
-
-class Ec2InstanceTypeValidator(Validator):
-    def validate(self, document):
-        text = document.text.lower()
-        match = re.search(r'^\s*\w+\.\w+\s*$', text)
-        if not match:
-            raise ValidationError(message='Input needs to be EC2 instance type',
-                                  cursor_position=len(text))
-
-
-class PriceValidator(Validator):
-    def validate(self, document):
-        text = document.text.lower()
-        match = re.search(r'^\s*\d*\.\d+\s*$', text)
-        if not match:
-            raise ValidationError(message='Input needs to be dollar amount e.g. 0.001',
-                                  cursor_position=len(text))
+VALIDATOR_NAMES = ('YesNoValidator', 'IpAddressValidator', 'SelectionValidator',
+                   'MultipleSelectionValidator', 'Ec2InstanceTypeValidator', 'PriceValidator')
+
+_validators = {}
+
+
+def _build_validators():
+    """Define prompt_toolkit validator classes on first use."""
+
+    from prompt_toolkit.validation import Validator, ValidationError
+
+    class YesNoValidator(Validator):
+        def validate(self, document):
+            text = document.text.lower()
+            if not text in ('yes', 'no', 'y', 'n'):
+                raise ValidationError(message='Input needs to be "y" or "n"',
+                                      cursor_position=len(text))
+
+    class IpAddressValidator(Validator):
+        def validate(self, document):
+            text = document.text.lower()
+            match = re.search(
+                r'^(([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.){3}([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])$', text)
+            if not match:
+                raise ValidationError(message='Input needs to be valid IP address',
+                                      cursor_position=len(text))
+
+    class SelectionValidator(Validator):
+        def validate(self, document):
+            text = document.text.lower()
+            match = re.search(r'^\s*\d+\s*$', text)
+            if not match:
+                raise ValidationError(message='Input needs to be integer',
+                                      cursor_position=len(text))
+
+    class MultipleSelectionValidator(Validator):
+        def validate(self, document):
+            text = document.text.lower()
+            match = re.search(r'^\s*(\d+\s*)+$', text)
+            if not match:
+                raise ValidationError(message='Inputs need to be integer[s] separated by space',
+                                      cursor_position=len(text))
+
+    class Ec2InstanceTypeValidator(Validator):
+        def validate(self, document):
+            text = document.text.lower()
+            match = re.search(r'^\s*\w+\.\w+\s*$', text)
+            if not match:
+                raise ValidationError(message='Input needs to be EC2 instance type',
+                                      cursor_position=len(text))
+
+    class PriceValidator(Validator):
+        def validate(self, document):
+            text = document.text.lower()
+            match = re.search(r'^\s*\d*\.\d+\s*$', text)
+            if not match:
+                raise ValidationError(message='Input needs to be dollar amount e.g. 0.001',
+                                      cursor_position=len(text))
+
+    return dict((name, cls) for name, cls in locals().items() if name in VALIDATOR_NAMES)
+
+
+def get_validator(name):
+    """Return validator class by name."""
+
+    if not _validators:
+        _validators.update(_build_validators())
+    return _validators[name]
+
+
+def __getattr__(name):
+    """Resolve validator classes lazily so importing this module doesn't pull in prompt_toolkit."""
+
+    if name in VALIDATOR_NAMES:
+        return get_validator(name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def get_prompt_style():
+    """Return style used for confirmation prompts."""
+
+    from prompt_toolkit.styles import style_from_dict
+    from pygments.token import Token
+
+    return style_from_dict({
+        Token.Alert: 'bg:#D8060C',
+        Token.Username: '#D8060C',
+        Token.Param: '#3CFF33',
+    })
+
+
+def prompt_yes_no(message):
+    """Prompt user with message and return True if answered yes."""
+
+    from prompt_toolkit.shortcuts import prompt
+    from pygments.token import Token
+
+    return prompt(get_prompt_tokens=lambda x: [(Token.Alert, message), (Token, " ")],
+                  validator=get_validator('YesNoValidator')(), style=get_prompt_style()) == 'y'
 
 
 def set_bar_desc(bar, message):
@@ -0,0 +1,231 @@
+"""
+Local unix socket daemon that runs sds commands in a warm process.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+
+from future import standard_library
+standard_library.install_aliases()
+import os
+import sys
+import json
+import errno
+import signal
+import socket
+import logging
+import traceback
+
+from sdscli.log_utils import logger
+from sdscli.conf_utils import get_user_config_path
+
+
+def get_socket_path():
+    """Return path to unix socket of the sds daemon."""
+
+    return os.path.join(os.path.dirname(get_user_config_path()), 'sds.sock')
+
+
+def get_serve_log_path():
+    """Return path to log file of the sds daemon."""
+
+    return os.path.join(os.path.dirname(get_user_config_path()), 'serve.log')
+
+
+def send_msg(sock, msg):
+    """Send JSON message as a single line."""
+
+    sock.sendall((json.dumps(msg) + "\n").encode('utf-8'))
+
+
+def connect(socket_path=None, timeout=None):
+    """Connect to sds daemon; return None if it is not running."""
+
+    if socket_path is None:
+        socket_path = get_socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+    except (IOError, OSError) as e:
+        sock.close()
+        if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+            return None
+        raise
+    return sock
+
+
+def request(msg, socket_path=None, stdout=None, stderr=None):
+    """Send request to sds daemon and relay its output; return final reply or None if not running."""
+
+    stdout = sys.stdout if stdout is None else stdout
+    stderr = sys.stderr if stderr is None else stderr
+    sock = connect(socket_path)
+    if sock is None:
+        return None
+    try:
+        send_msg(sock, msg)
+        for line in sock.makefile('r', encoding='utf-8'):
+            reply = json.loads(line)
+            if 'data' in reply:
+                (stderr if reply['fd'] == 2 else stdout).write(reply['data'])
+                continue
+            return reply
+    finally:
+        sock.close()
+    raise RuntimeError("Connection to sds daemon closed before command finished.")
+
+
+def ping(socket_path=None):
+    """Return pid of running sds daemon or None."""
+
+    reply = request({'cmd': 'ping'}, socket_path)
+    return None if reply is None else reply['pid']
+
+
+def forward_command(argv, socket_path=None):
+    """Run sds command in the daemon; return exit code or None if daemon is not running."""
+
+    msg = {
+        'cmd': 'run',
+        'argv': list(argv),
+        'cwd': os.getcwd(),
+        'isatty': sys.stdout.isatty(),
+    }
+    reply = request(msg, socket_path)
+    if reply is None:
+        return None
+    logger.debug("daemon reply: %s" % reply)
+    return reply['rc']
+
+
+class RemoteStream(object):
+    """File-like object relaying writes to a daemon client."""
+
+    encoding = 'utf-8'
+
+    def __init__(self, sock, fd, isatty=False):
+        """Construct RemoteStream instance."""
+
+        self._sock = sock
+        self._fd = fd
+        self._isatty = isatty
+        self._closed = False
+
+    def write(self, data):
+        if data and not self._closed:
+            try:
+                send_msg(self._sock, {'fd': self._fd, 'data': data})
+            except (IOError, OSError):
+                # client went away; let the command finish quietly
+                self._closed = True
+        return len(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return self._isatty
+
+
+def run_in_daemon(sock, msg, runner):
+    """Run forwarded command with stdio and log output relayed to the client."""
+
+    stdout = RemoteStream(sock, 1, msg.get('isatty', False))
+    stderr = RemoteStream(sock, 2, msg.get('isatty', False))
+    handlers = [h for h in logging.getLogger().handlers
+                if isinstance(h, logging.StreamHandler)]
+    saved = (sys.stdout, sys.stderr, os.getcwd(), [h.stream for h in handlers], logger.level)
+    sys.stdout, sys.stderr = stdout, stderr
+    for h in handlers:
+        h.stream = stderr
+    try:
+        os.chdir(msg['cwd'])
+        rc = runner(msg['argv'])
+    except SystemExit as e:
+        rc = e.code if isinstance(e.code, int) else 1
+    except Exception:
+        stderr.write(traceback.format_exc())
+        rc = 1
+    finally:
+        sys.stdout, sys.stderr = saved[0], saved[1]
+        os.chdir(saved[2])
+        for h, stream in zip(handlers, saved[3]):
+            h.stream = stream
+        logger.setLevel(saved[4])
+    return 0 if rc is None else rc
+
+
+def daemonize(log_file):
+    """Detach from controlling terminal; return False in the calling process."""
+
+    if os.fork() > 0:
+        return False
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with open(os.devnull, 'r') as f:
+        os.dup2(f.fileno(), sys.stdin.fileno())
+    with open(log_file, 'a') as f:
+        os.dup2(f.fileno(), sys.stdout.fileno())
+        os.dup2(f.fileno(), sys.stderr.fileno())
+    return True
+
+
+def serve_forever(runner, before_request=None, socket_path=None):
+    """Accept and run forwarded commands one at a time until stopped."""
+
+    if socket_path is None:
+        socket_path = get_socket_path()
+    if ping(socket_path) is not None:
+        raise RuntimeError("sds daemon already listening on %s." % socket_path)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    def terminate(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, terminate)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o077)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(old_umask)
+    server.listen(16)
+    logger.info("sds daemon %s listening on %s" % (os.getpid(), socket_path))
+    try:
+        while True:
+            sock, _ = server.accept()
+            try:
+                line = sock.makefile('r', encoding='utf-8').readline()
+                if not line:
+                    continue
+                msg = json.loads(line)
+                logger.debug("daemon request: %s" % msg)
+                if msg['cmd'] == 'ping':
+                    send_msg(sock, {'pid': os.getpid()})
+                elif msg['cmd'] == 'stop':
+                    send_msg(sock, {'pid': os.getpid()})
+                    break
+                elif msg['cmd'] == 'run':
+                    if before_request is not None:
+                        before_request()
+                    send_msg(sock, {'rc': run_in_daemon(sock, msg, runner)})
+            except Exception:
+                logger.error("Failed to handle daemon request.")
+                logger.error(traceback.format_exc())
+            finally:
+                sock.close()
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
@@ -0,0 +1,132 @@
+"""
+Process-wide cache of compiled Jinja templates and their renders.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+
+from builtins import open
+from future import standard_library
+standard_library.install_aliases()
+import os
+import json
+import hashlib
+
+from sdscli.log_utils import logger
+from sdscli.conf_utils import get_user_config_path
+
+
+# max number of memoized renders kept in the process
+MAX_RENDERS = 512
+
+# Jinja environments keyed by template dir
+_envs = {}
+
+# rendered text keyed by (template path, template mtime, hash of the context it uses)
+_renders = {}
+
+# names of context variables used by each template keyed by (template path, template mtime)
+_variables = {}
+
+
+def get_bytecode_cache_path():
+    """Return path to on-disk cache of compiled templates."""
+
+    return os.path.join(os.path.dirname(get_user_config_path()), 'jinja_cache')
+
+
+def get_bytecode_cache():
+    """Return Jinja bytecode cache under ~/.sds or None if it can't be created."""
+
+    from jinja2 import FileSystemBytecodeCache
+
+    cache_dir = get_bytecode_cache_path()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError as e:
+        logger.debug("not caching template bytecode in %s: %s" % (cache_dir, e))
+        return None
+    return FileSystemBytecodeCache(cache_dir)
+
+
+def get_template_env(template_dir):
+    """Return shared Jinja environment loading templates from template dir."""
+
+    template_dir = os.path.abspath(template_dir)
+    jenv = _envs.get(template_dir)
+    if jenv is None:
+        from jinja2 import Environment, FileSystemLoader
+
+        # same settings as fabric's upload_template so output is byte for byte identical
+        jenv = Environment(loader=FileSystemLoader(template_dir),
+                           bytecode_cache=get_bytecode_cache(),
+                           keep_trailing_newline=False)
+        _envs[template_dir] = jenv
+    return jenv
+
+
+def get_template_variables(jenv, filename):
+    """Return names of context variables template and the templates it pulls in use, or None if unknown.
+
+    They are unknown if it pulls in a template whose name is computed.
+    """
+
+    from jinja2 import meta
+
+    names = set()
+    seen = set()
+    todo = [filename]
+    while todo:
+        name = todo.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        ast = jenv.parse(jenv.loader.get_source(jenv, name)[0])
+        names.update(meta.find_undeclared_variables(ast))
+        for ref in meta.find_referenced_templates(ast):
+            if ref is None:
+                return None
+            todo.append(ref)
+    return names
+
+
+def get_context_hash(context, names=None):
+    """Return hash of template context, or of just the given variables of it."""
+
+    context = dict(context or {})
+    if names is not None:
+        context = dict((k, v) for k, v in context.items() if k in names)
+    data = json.dumps(context, sort_keys=True, default=repr)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def render_template(filename, context=None, use_jinja=False, template_dir=None):
+    """Render template like fabric's upload_template does, reusing compiled templates and prior renders.
+
+    Renders are reused for contexts that only differ in variables the
+    template doesn't use, such as the host of each verdi node.
+    """
+
+    template_dir = template_dir or os.getcwd()
+    path = os.path.join(template_dir, filename)
+    if not use_jinja:
+        with open(os.path.expanduser(path)) as f:
+            text = f.read()
+        return text % context if context else text
+
+    jenv = get_template_env(template_dir)
+    template_key = (os.path.abspath(path), os.stat(path).st_mtime)
+    if template_key not in _variables:
+        _variables[template_key] = get_template_variables(jenv, filename)
+    key = template_key + (get_context_hash(context, _variables[template_key]),)
+    text = _renders.get(key)
+    if text is None:
+        text = jenv.get_template(filename).render(**context or {})
+        if len(_renders) >= MAX_RENDERS:
+            _renders.clear()
+        _renders[key] = text
+    else:
+        logger.debug("reusing render of %s" % path)
+    return text